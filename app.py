@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
-import os, glob, json, shutil, zipfile, io
+import os, json, shutil, zipfile, io, threading, bisect, sqlite3, time, uuid, struct, hashlib, select
+import ctypes, ctypes.util, zlib, itertools
+from contextlib import contextmanager
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Dict, Any
-from flask import Flask, request, jsonify, render_template, send_from_directory, abort
+from typing import List, Dict, Any, Optional, Set
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, abort, stream_with_context
+from werkzeug.datastructures import MultiDict
 from werkzeug.middleware.proxy_fix import ProxyFix
 from PIL import Image
+try:
+    import fcntl  # cross-process file locks; not available on Windows
+except ImportError:
+    fcntl = None
 import xml.etree.ElementTree as ET
 
+PROCESS_STARTED = time.time()
 APP_TITLE = "Yolo-ReviewBox"
 PROJECTS_ROOT_DIR = os.environ.get("RB_PROJECTS_DIR", os.path.abspath("./projects"))
 RAW_IMAGES_DIR = os.environ.get("RB_RAW_IMAGES_DIR", os.path.abspath("./raw_images"))
@@ -14,34 +24,436 @@ IMAGE_CATALOG_DIR = os.environ.get("RB_IMAGE_CATALOG_DIR", os.path.abspath("./im
 ANNOTATION_CATALOG_DIR = os.environ.get("RB_ANNOTATION_CATALOG_DIR", os.path.abspath("./annotations"))
 PAGE_SIZE_DEFAULT = int(os.environ.get("RB_PAGE_SIZE", "200"))
 ALLOWED_EXTS = {".jpg", ".jpeg", ".png"}
+THUMB_CACHE_DIR = os.environ.get("RB_THUMB_CACHE_DIR", os.path.abspath("./thumb_cache"))
+THUMB_SIZES = (112, 160, 224, 256)
+THUMB_FORMAT = "webp" if os.environ.get("RB_THUMB_FORMAT", "jpeg").lower() == "webp" else "jpeg"
+THUMB_PREWARM = os.environ.get("RB_THUMB_PREWARM", "").lower() in ("1","true","yes")
+REVIEW_BATCH_MAX = 200
+QUERY_CACHE_SIZE = 32
+STATS_AREA_BINS = (16, 32, 64, 96, 128, 256, 512)  # sqrt(box area) in px, COCO-style small < 32 <= medium < 96
+STATS_ASPECT_BINS = (0.25, 0.5, 0.75, 1.0, 1.33, 2.0, 4.0)  # box width / height
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # for ?v= versioned image and thumbnail URLs
+JOB_WORKERS = int(os.environ.get("RB_JOB_WORKERS", "2"))
+ANNOTATION_CACHE_SIZE = int(os.environ.get("RB_ANNOTATION_CACHE_SIZE", "20000"))
+IMPORT_WORKERS = int(os.environ.get("RB_IMPORT_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+EXPORT_WORKERS = int(os.environ.get("RB_EXPORT_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+HASH_WORKERS = int(os.environ.get("RB_HASH_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+DEDUP_DISTANCE = int(os.environ.get("RB_DEDUP_DISTANCE", "4"))  # max differing dHash bits for near-duplicates
+WATCH_MODE = os.environ.get("RB_WATCH", "auto").lower()  # auto (inotify, else polling), poll, off
+WATCH_INTERVAL = float(os.environ.get("RB_WATCH_INTERVAL", "2"))
+FSYNC_WRITES = os.environ.get("RB_FSYNC", "1").lower() not in ("0", "false", "no")
+GROUP_COMMIT_MS = float(os.environ.get("RB_GROUP_COMMIT_MS", "0"))  # 0 = commit each project-list update alone
+ANNOTATION_STORE_KIND = "compact" if os.environ.get("RB_ANNOTATION_STORE", "xml").lower() == "compact" else "xml"
+EXPORT_KEEP = int(os.environ.get("RB_EXPORT_KEEP", "10"))  # ZIPs kept per project; 0 keeps all
+RAW_REFRESH_SECONDS = float(os.environ.get("RB_RAW_REFRESH_SECONDS", "2"))  # min time between raw tree walks
 
 ACTIVE_PROJECT_FILE = os.path.join(PROJECTS_ROOT_DIR, "active_project.txt")
+METADATA_DB_FILE = os.environ.get("RB_METADATA_DB", os.path.join(PROJECTS_ROOT_DIR, "reviewbox.sqlite3"))
+UPLOADS_DIR = os.path.join(PROJECTS_ROOT_DIR, ".uploads")  # ZIPs staged for background import jobs
+INDEX_SNAPSHOT_FILE = os.path.join(PROJECTS_ROOT_DIR, ".annotation_index.json")  # reloaded at startup
+LOCKS_DIR = os.path.join(PROJECTS_ROOT_DIR, ".locks")
+# Pre-SQLite metadata files, imported once by migrate_legacy_metadata()
 IMAGE_CATEGORIES_FILE = os.path.join(PROJECTS_ROOT_DIR, "image_categories.json")
+CLASSES_FILE = os.path.join(PROJECTS_ROOT_DIR, "classes.json")
+
+METADATA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS project_images (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    image TEXT NOT NULL,
+    UNIQUE (project, image)
+);
+CREATE INDEX IF NOT EXISTS idx_project_images_image ON project_images(image);
+CREATE TABLE IF NOT EXISTS image_categories (
+    image TEXT PRIMARY KEY,
+    category TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_image_categories_category ON image_categories(category);
+CREATE TABLE IF NOT EXISTS classes (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_classes_position ON classes(position);
+CREATE TABLE IF NOT EXISTS annotation_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    stem TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS image_dims (
+    path TEXT PRIMARY KEY,
+    w INTEGER NOT NULL,
+    h INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotation_labels (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotation_records (
+    stem TEXT PRIMARY KEY,
+    filename TEXT,
+    w INTEGER NOT NULL,
+    h INTEGER NOT NULL,
+    objects INTEGER NOT NULL,
+    boxes BLOB NOT NULL,
+    rev INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS image_hashes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    dhash INTEGER
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha1 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exports (
+    project TEXT NOT NULL,
+    zip_name TEXT NOT NULL,
+    options_key TEXT NOT NULL,
+    base TEXT,
+    created REAL NOT NULL,
+    members TEXT NOT NULL,
+    PRIMARY KEY (project, zip_name)
+);
+"""
+
+_db_local = threading.local()
+
+def get_db() -> sqlite3.Connection:
+    """Per-thread connection to the metadata store (sqlite3 connections can't be shared across threads)."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(METADATA_DB_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _db_local.conn = conn
+    return conn
+
+def _chunks(items: List[str], n: int = 500):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+_FILE_LOCK_STRIPES = 64
+_file_locks = [threading.Lock() for _ in range(_FILE_LOCK_STRIPES)]
+_file_lock_fds: Dict[int, int] = {}
+
+def _lock_fd(stripe: int) -> Optional[int]:
+    fd = _file_lock_fds.get(stripe)
+    if fd is None and fcntl is not None:
+        os.makedirs(LOCKS_DIR, exist_ok=True)
+        fd = _file_lock_fds[stripe] = os.open(os.path.join(LOCKS_DIR, f"{stripe}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    return fd
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock on one file for read-modify-write, across threads and (with fcntl) worker processes.
+
+    Locks are striped by path, so unrelated files rarely wait on each other and never on
+    a global lock. Don't nest file_lock calls: two paths may share a stripe.
+    """
+    stripe = zlib.crc32(os.path.abspath(path).encode()) % _FILE_LOCK_STRIPES
+    with _file_locks[stripe]:
+        fd = _lock_fd(stripe)
+        if fd is None:
+            yield
+            return
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+def atomic_write(path: str, data: bytes):
+    """Replace `path` with `data` through a temp file and a rename, so readers and crashes see
+    the old or the new content, never a partial file. Temp names are dot-files, which the
+    listings and the watcher ignore."""
+    directory, base = os.path.split(path)
+    tmp = os.path.join(directory, f".{base}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if FSYNC_WRITES:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
 
-def load_image_categories():
-    if os.path.exists(IMAGE_CATEGORIES_FILE):
-        with open(IMAGE_CATEGORIES_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_image_categories(categories):
-    with open(IMAGE_CATEGORIES_FILE, "w") as f:
-        json.dump(categories, f, indent=2)
+def remove_stale_temp_files(directory: str, max_age: float = 3600):
+    """Delete temp files left behind by a crash mid-write (atomic_write, ZIP import)."""
+    cutoff = time.time() - max_age
+    try:
+        with os.scandir(directory) as it:
+            for e in it:
+                if e.name.startswith(".") and e.name.endswith((".tmp", ".part")):
+                    try:
+                        if e.stat().st_mtime < cutoff:
+                            os.remove(e.path)
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+
+def get_meta(key: str) -> Optional[str]:
+    row = get_db().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_meta(conn: sqlite3.Connection, key: str, value: str):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+def register_project(name: str):
+    with get_db() as conn:
+        conn.execute("INSERT OR IGNORE INTO projects (name) VALUES (?)", (name,))
+
+def project_version(name: str) -> int:
+    row = get_db().execute("SELECT version FROM projects WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else -1
+
+def list_project_images(name: str) -> List[str]:
+    rows = get_db().execute("SELECT image FROM project_images WHERE project = ? ORDER BY seq", (name,))
+    return [r[0] for r in rows]
+
+def project_image_set(name: str) -> Set[str]:
+    rows = get_db().execute("SELECT image FROM project_images WHERE project = ?", (name,))
+    return {r[0] for r in rows}
+
+_project_set_lock = threading.Lock()
+_project_set_cache: Dict[str, tuple] = {}  # project -> (project version, frozenset of images)
+
+def cached_project_image_set(name: str) -> frozenset:
+    """project_image_set, reused until the project's version changes. Callers must not mutate it."""
+    stamp = project_version(name)
+    with _project_set_lock:
+        cached = _project_set_cache.get(name)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    images = frozenset(project_image_set(name))
+    with _project_set_lock:
+        _project_set_cache[name] = (stamp, images)
+    return images
+
+def _add_project_images(conn: sqlite3.Connection, name: str, images: List[str]) -> int:
+    conn.execute("INSERT OR IGNORE INTO projects (name) VALUES (?)", (name,))
+    before = conn.total_changes
+    conn.executemany("INSERT OR IGNORE INTO project_images (project, image) VALUES (?, ?)",
+                     [(name, img) for img in images])
+    added = conn.total_changes - before
+    if added:
+        conn.execute("UPDATE projects SET version = version + 1 WHERE name = ?", (name,))
+    return added
+
+def _remove_project_images(conn: sqlite3.Connection, name: str, images: List[str]) -> int:
+    removed = 0
+    for chunk in _chunks(list(images)):
+        cur = conn.execute(
+            f"DELETE FROM project_images WHERE project = ? AND image IN ({','.join('?' * len(chunk))})",
+            [name, *chunk])
+        removed += cur.rowcount
+    if removed:
+        conn.execute("UPDATE projects SET version = version + 1 WHERE name = ?", (name,))
+    return removed
+
+class GroupCommitter:
+    """Runs concurrent metadata updates that arrive within `window` seconds in one transaction.
+
+    Callers block until their batch commits and get their own return value. If the
+    batch fails, its updates are retried one transaction each, so one bad update
+    can't fail the others.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._cond = threading.Condition()
+        self._queue: List[list] = []
+        self._thread = None
+
+    def submit(self, fn, *args):
+        op = [fn, args, threading.Event(), None, None]  # fn, args, done, result, error
+        with self._cond:
+            self._queue.append(op)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        op[2].wait()
+        if op[4] is not None:
+            raise op[4]
+        return op[3]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+            time.sleep(self.window)
+            with self._cond:
+                batch, self._queue = self._queue, []
+            conn = get_db()
+            try:
+                with conn:
+                    for op in batch:
+                        op[3] = op[0](conn, *op[1])
+            except Exception:
+                for op in batch:
+                    try:
+                        with conn:
+                            op[3], op[4] = op[0](conn, *op[1]), None
+                    except Exception as e:
+                        op[4] = e
+            for op in batch:
+                op[2].set()
+
+PROJECT_COMMITTER = GroupCommitter(GROUP_COMMIT_MS / 1000) if GROUP_COMMIT_MS > 0 else None
+
+def _project_update(fn, name: str, images: List[str]) -> int:
+    if PROJECT_COMMITTER is not None:
+        return PROJECT_COMMITTER.submit(fn, name, images)
+    with get_db() as conn:
+        return fn(conn, name, images)
+
+def add_project_images(name: str, images: List[str]) -> int:
+    return _project_update(_add_project_images, name, images)
+
+def remove_project_images(name: str, images: List[str]) -> int:
+    return _project_update(_remove_project_images, name, images)
+
+def project_associations() -> Dict[str, List[str]]:
+    associations: Dict[str, List[str]] = {}
+    for image, project in get_db().execute("SELECT image, project FROM project_images ORDER BY project, seq"):
+        associations.setdefault(image, []).append(project)
+    return associations
+
+def images_in_category(category: str) -> Set[str]:
+    rows = get_db().execute("SELECT image FROM image_categories WHERE category = ?", (category,))
+    return {r[0] for r in rows}
+
+def categories_version() -> int:
+    row = get_db().execute("SELECT value FROM meta WHERE key = 'categories_version'").fetchone()
+    return int(row[0]) if row else 0
+
+def _bump_categories_version(conn):
+    conn.execute("INSERT INTO meta (key, value) VALUES ('categories_version', '1') "
+                 "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+def set_image_category(images: List[str], category: str):
+    with get_db() as conn:
+        conn.executemany("UPDATE image_categories SET category = ? WHERE image = ?",
+                         [(category, img) for img in images])
+        _bump_categories_version(conn)
+
+def categorize_images(images: List[str], sizes: Dict[str, int] = None):
+    """Assign a category to any of `images` that doesn't have one yet, based on file size."""
+    rows = []
+    for filename in images:
+        try:
+            size = sizes[filename] if sizes and filename in sizes else os.path.getsize(os.path.join(IMAGE_CATALOG_DIR, filename))
+        except OSError:
+            continue
+        rows.append((filename, "TrailCam" if size > 20000 else "TrapNode"))
+    with get_db() as conn:
+        if conn.executemany("INSERT OR IGNORE INTO image_categories (image, category) VALUES (?, ?)", rows).rowcount:
+            _bump_categories_version(conn)
 
 def scan_and_categorize_images():
-    categories = load_image_categories()
-    image_files = [f for f in os.listdir(IMAGE_CATALOG_DIR) if os.path.isfile(os.path.join(IMAGE_CATALOG_DIR, f))]
-    for filename in image_files:
-        if filename not in categories:
+    known = {r[0] for r in get_db().execute("SELECT image FROM image_categories")}
+    with os.scandir(IMAGE_CATALOG_DIR) as it:
+        new_files = [e.name for e in it if e.name not in known and e.is_file()]
+    if new_files:
+        categorize_images(new_files)
+
+def add_classes(classes: List[str]):
+    """Append any of `classes` missing from the stored class list, keeping its order."""
+    current = get_classes() or []
+    missing = sorted(set(classes) - set(current) - {"__null__"})
+    if missing or get_meta("classes_initialized") is None:
+        set_classes(current + missing)
+
+def get_classes() -> Optional[List[str]]:
+    """Return the class list, or None if it has never been set."""
+    if get_meta("classes_initialized") is None:
+        return None
+    return [r[0] for r in get_db().execute("SELECT name FROM classes ORDER BY position")]
+
+def set_classes(classes: List[str]):
+    with get_db() as conn:
+        conn.execute("DELETE FROM classes")
+        conn.executemany("INSERT OR IGNORE INTO classes (name, position) VALUES (?, ?)",
+                         [(str(c), i) for i, c in enumerate(classes)])
+        set_meta(conn, "classes_initialized", "1")
+
+def record_image_dims_bulk(rows: List[tuple]):
+    """Store (absolute path, w, h, mtime_ns, size) rows."""
+    with get_db() as conn:
+        conn.executemany("INSERT OR REPLACE INTO image_dims (path, w, h, mtime_ns, size) VALUES (?, ?, ?, ?, ?)", rows)
+
+def migrate_legacy_metadata():
+    """Import project_images.txt, image_categories.json and classes.json into the metadata store.
+
+    Project lists are imported for any project directory not yet registered, so a
+    project folder copied in from an older install is picked up on the next start.
+    """
+    conn = get_db()
+    known = {r[0] for r in conn.execute("SELECT name FROM projects")}
+    for name in sorted(os.listdir(PROJECTS_ROOT_DIR)):
+        if name in known or name == "exports" or name.startswith(".") or not os.path.isdir(os.path.join(PROJECTS_ROOT_DIR, name)):
+            continue
+        images = []
+        legacy_list = os.path.join(PROJECTS_ROOT_DIR, name, "project_images.txt")
+        if os.path.exists(legacy_list):
+            with open(legacy_list, "r") as f:
+                images = [line.strip() for line in f if line.strip()]
+        register_project(name)
+        add_project_images(name, images)
+
+    if get_meta("legacy_files_migrated") is not None:
+        return
+    with conn:
+        if os.path.exists(IMAGE_CATEGORIES_FILE):
             try:
-                size = os.path.getsize(os.path.join(IMAGE_CATALOG_DIR, filename))
-                if size > 20000:
-                    categories[filename] = "TrailCam"
-                else:
-                    categories[filename] = "TrapNode"
-            except OSError:
-                continue
-    save_image_categories(categories)
+                with open(IMAGE_CATEGORIES_FILE, "r") as f:
+                    categories = json.load(f)
+                conn.executemany("INSERT OR IGNORE INTO image_categories (image, category) VALUES (?, ?)",
+                                 list(categories.items()))
+            except (ValueError, OSError) as e:
+                app.logger.warning(f"Skipping unreadable {IMAGE_CATEGORIES_FILE}: {e}")
+        if os.path.exists(CLASSES_FILE):
+            try:
+                with open(CLASSES_FILE, "r") as f:
+                    classes = json.load(f)
+                conn.executemany("INSERT OR IGNORE INTO classes (name, position) VALUES (?, ?)",
+                                 [(str(c), i) for i, c in enumerate(classes)])
+                set_meta(conn, "classes_initialized", "1")
+            except (ValueError, OSError) as e:
+                app.logger.warning(f"Skipping unreadable {CLASSES_FILE}: {e}")
+        set_meta(conn, "legacy_files_migrated", datetime.utcnow().isoformat())
+
+def init_metadata_db():
+    conn = get_db()
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(image_dims)")}
+    if columns and "path" not in columns:
+        # Early layout keyed by bare filename; it's only a cache, so rebuild it
+        conn.execute("DROP TABLE image_dims")
+    conn.executescript(METADATA_SCHEMA)
+    migrate_legacy_metadata()
 
 def get_active_project() -> str:
     if os.path.exists(ACTIVE_PROJECT_FILE):
@@ -51,14 +463,13 @@ def get_active_project() -> str:
 
 def set_active_project(name: str):
     os.makedirs(PROJECTS_ROOT_DIR, exist_ok=True)
-    with open(ACTIVE_PROJECT_FILE, "w") as f:
-        f.write(name)
+    atomic_write(ACTIVE_PROJECT_FILE, name.encode())
 
 def get_project_dirs(project_name: str) -> Dict[str, str]:
     base = os.path.join(PROJECTS_ROOT_DIR, project_name)
     return {
+        "name": project_name,
         "exports": os.path.join(base, "exports"),
-        "project_images": os.path.join(base, "project_images.txt"),
     }
 
 def get_active_project_dirs() -> Dict[str, str]:
@@ -70,80 +481,494 @@ def get_active_project_dirs() -> Dict[str, str]:
 def ensure_project_dirs_exist(project_name: str):
     dirs = get_project_dirs(project_name)
     os.makedirs(dirs["exports"], exist_ok=True)
-    if not os.path.exists(dirs["project_images"]):
-        with open(dirs["project_images"], "w") as f:
-            pass  # Create an empty file
+    register_project(project_name)
 
+os.makedirs(PROJECTS_ROOT_DIR, exist_ok=True)
 os.makedirs(RAW_IMAGES_DIR, exist_ok=True)
 os.makedirs(IMAGE_CATALOG_DIR, exist_ok=True)
 os.makedirs(ANNOTATION_CATALOG_DIR, exist_ok=True)
+os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
 
-scan_and_categorize_images()
-
+# Created before the metadata store so migration problems can go to app.logger
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 # Respect X-Forwarded-Proto/Host when behind a reverse proxy
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-def list_images_sorted() -> List[str]:
-    dirs = get_active_project_dirs()
-    if not dirs:
-        return []
-    images_file = dirs["project_images"]
-    if not os.path.exists(images_file):
-        return []
-    with open(images_file, "r") as f:
-        files = [line.strip() for line in f if line.strip()]
-
+init_metadata_db()
+
+@app.before_request
+def start_background_tasks():
+    # Started by the first request, so only processes that serve (e.g. gunicorn workers) run them
+    WATCHER.ensure_started()
+    start_reconcile()
+
+class CatalogListing:
+    """Newest-first listing of IMAGE_CATALOG_DIR kept in memory.
+
+    The directory is rescanned only when its own mtime changes (i.e. an entry was
+    added or removed behind our back); endpoints that add or remove catalog files
+    patch the listing in place. The sorted list is replaced, never mutated, so
+    callers can slice it without holding the lock.
+    """
+
+    def __init__(self, image_dir: str):
+        self.image_dir = image_dir
+        self._lock = threading.RLock()
+        self._mtimes: Dict[str, int] = {}
+        self._keys: List[tuple] = []
+        self._files: List[str] = []
+        self._dir_mtime_ns = None
+        self._index = (-1, {}, {}, {}, [])
+        self.version = 0
+        self.watched = False  # set while a CatalogWatcher feeds us changes
+
+    @staticmethod
+    def _key(name: str, mtime: int) -> tuple:
+        return (-mtime, name.lower(), name)
+
+    def _dir_stamp(self):
+        try:
+            return os.stat(self.image_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def _rescan(self, stamp):
+        mtimes = {}
+        with os.scandir(self.image_dir) as it:
+            for entry in it:
+                try:
+                    # Dot-files are in-flight temporaries (e.g. import .part files)
+                    if entry.is_file() and not entry.name.startswith("."):
+                        mtimes[entry.name] = entry.stat().st_mtime_ns
+                except OSError:
+                    continue
+        keys = sorted(self._key(n, m) for n, m in mtimes.items())
+        self._mtimes = mtimes
+        self._keys = keys
+        self._files = [k[2] for k in keys]
+        self._dir_mtime_ns = stamp
+        self.version += 1
+
+    def _check(self):
+        if self.watched and self._dir_mtime_ns is not None:
+            return
+        stamp = self._dir_stamp()
+        if stamp is None or stamp != self._dir_mtime_ns:
+            self._rescan(stamp)
+
+    def files(self) -> List[str]:
+        with self._lock:
+            self._check()
+            return self._files
+
+    def names(self) -> Set[str]:
+        with self._lock:
+            self._check()
+            return set(self._mtimes)
+
+    def snapshot(self):
+        """Return (version, name -> mtime_ns) as one consistent pair."""
+        with self._lock:
+            self._check()
+            return self.version, self._mtimes
+
+    def _search_index(self):
+        """Per-version lookup structures for /api/query, rebuilt lazily after the listing changes.
+
+        (version, stem -> name, stem -> extra names for stems shared by several
+        files, name -> position, and (name, lowercase name) pairs in listing order).
+        """
+        with self._lock:
+            self._check()
+            if self._index[0] != self.version:
+                by_stem: Dict[str, str] = {}
+                shared: Dict[str, List[str]] = {}
+                for name in self._files:
+                    stem = os.path.splitext(name)[0]
+                    if stem in by_stem:
+                        shared.setdefault(stem, []).append(name)
+                    else:
+                        by_stem[stem] = name
+                rank = {name: i for i, name in enumerate(self._files)}
+                lowered = [(name, name.lower()) for name in self._files]
+                self._index = (self.version, by_stem, shared, rank, lowered)
+            return self._index
+
+    def stems(self):
+        """Every catalog image's basename (annotation stem), as a read-only view."""
+        return self._search_index()[1].keys()
+
+    def names_for_stems(self, stems: Set[str]) -> Set[str]:
+        """Catalog names whose basename (annotation stem) is in `stems`."""
+        _, by_stem, shared, _, _ = self._search_index()
+        names = set(map(by_stem.get, stems))
+        names.discard(None)
+        for stem in stems & shared.keys():
+            names.update(shared[stem])
+        return names
+
+    def search(self, text: str, prefix: bool = False) -> Set[str]:
+        """Names containing (or starting with) `text`, case-insensitively."""
+        lowered = self._search_index()[4]
+        text = text.lower()
+        if prefix:
+            return {name for name, lower in lowered if lower.startswith(text)}
+        return {name for name, lower in lowered if text in lower}
+
+    def in_order(self, names: Set[str]) -> List[str]:
+        """`names` restricted to the catalog, in listing order."""
+        rank = self._search_index()[3]
+        if len(names) * 8 > len(rank):
+            return [n for n in self.files() if n in names]
+        return sorted((n for n in names if n in rank), key=rank.__getitem__)
+
+    def versions(self, names: List[str]) -> Dict[str, str]:
+        """Cache-busting tokens for /image and /thumb URLs (see file_version)."""
+        _, mtimes = self.snapshot()
+        return {n: format(mtimes[n], "x") for n in names if n in mtimes}
+
+    def _unlink(self, keys: List[tuple], name: str):
+        old = self._mtimes.pop(name, None)
+        if old is None:
+            return
+        i = bisect.bisect_left(keys, self._key(name, old))
+        if i < len(keys) and keys[i][2] == name:
+            del keys[i]
+
+    def add(self, names: List[str]):
+        with self._lock:
+            self._check()
+            stats = {}
+            for name in names:
+                try:
+                    stats[name] = os.stat(os.path.join(self.image_dir, name)).st_mtime_ns
+                except OSError:
+                    continue
+            stats = {n: m for n, m in stats.items() if self._mtimes.get(n) != m}
+            if not stats:
+                return
+            keys = list(self._keys)
+            self._mtimes = dict(self._mtimes)
+            for name, mtime in stats.items():
+                self._unlink(keys, name)
+                self._mtimes[name] = mtime
+                bisect.insort(keys, self._key(name, mtime))
+            self._commit(keys)
+
+    def discard(self, names: List[str]):
+        with self._lock:
+            self._check()
+            names = [n for n in names if n in self._mtimes]
+            if not names:
+                return
+            keys = list(self._keys)
+            self._mtimes = dict(self._mtimes)
+            for name in names:
+                self._unlink(keys, name)
+            self._commit(keys)
+
+    def _commit(self, keys: List[tuple]):
+        self._keys = keys
+        self._files = [k[2] for k in keys]
+        self._dir_mtime_ns = self._dir_stamp()
+        self.version += 1
+
+CATALOG_LISTING = CatalogListing(IMAGE_CATALOG_DIR)
+
+_project_order_lock = threading.Lock()
+_project_order_cache: Dict[str, tuple] = {}  # project -> (project version, listing version, sorted files, missing)
+
+def catalog_order_key(mtimes: Dict[str, int]):
+    """Newest-first sort key shared by the listings and their cursor lookups."""
+    return lambda p: (-mtimes.get(p, 0), p.lower(), p)
+
+def cursor_page(images: List[str], cursor: str, limit: int, key, keep=None):
+    """Keyset page: up to `limit` entries of `images` (sorted by `key`) after `cursor`, filtered by `keep`.
+
+    The cursor is resolved by sort key rather than by position, so it stays valid when
+    entries before it are added or removed, or when it leaves the filter itself.
+    Returns (page, next_cursor); next_cursor is None on the last page.
+    """
+    i = bisect.bisect_right(images, key(cursor), key=key) if cursor else 0
+    if keep is None:
+        page = images[i:i + limit]
+        i += len(page)
+    else:
+        page = []
+        while i < len(images) and len(page) < limit:
+            if keep(images[i]):
+                page.append(images[i])
+            i += 1
+    return page, (page[-1] if page and i < len(images) else None)
+
+def project_order(project: str) -> tuple:
+    """(members in the catalog, newest first, like /api/query; members missing from the catalog)."""
+    stamp = project_version(project)
+    version, mtimes = CATALOG_LISTING.snapshot()
+    with _project_order_lock:
+        cached = _project_order_cache.get(project)
+        if cached and cached[0] == stamp and cached[1] == version:
+            return cached[2], cached[3]
+
+    files, missing = [], []
+    for name in list_project_images(project):
+        (files if name in mtimes else missing).append(name)
     # Sort by modification time of the actual files in the catalog
-    def get_mtime(f):
-        path = os.path.join(IMAGE_CATALOG_DIR, f)
-        return os.path.getmtime(path) if os.path.exists(path) else 0
+    files.sort(key=catalog_order_key(mtimes))
+    with _project_order_lock:
+        _project_order_cache[project] = (stamp, version, files, missing)
+    return files, missing
 
-    files.sort(key=lambda p: (-get_mtime(p), p.lower()))
-    return files
+def list_images_sorted() -> List[str]:
+    dirs = get_active_project_dirs()
+    return project_order(dirs["name"])[0] if dirs else []
 
 def is_safe_filename(name: str) -> bool:
     if "/" in name or "\\" in name: return False
     _, ext = os.path.splitext(name)
     return ext.lower() in ALLOWED_EXTS
 
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _probe_header_size(path: str):
+    """Read (w, h) from a PNG IHDR or JPEG SOF header without decoding; None if unrecognised."""
+    with open(path, "rb") as f:
+        head = f.read(24)
+        if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head[:2] != b"\xff\xd8":
+            return None
+        f.seek(2)
+        while True:
+            b = f.read(1)
+            while b and b != b"\xff":
+                b = f.read(1)
+            while b == b"\xff":
+                b = f.read(1)
+            if not b:
+                return None
+            marker = b[0]
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                continue  # markers without a length field
+            seg = f.read(2)
+            if len(seg) < 2:
+                return None
+            length = struct.unpack(">H", seg)[0]
+            if marker in _JPEG_SOF_MARKERS:
+                data = f.read(5)
+                if len(data) < 5:
+                    return None
+                h, w = struct.unpack(">HH", data[1:5])
+                return (w, h)
+            f.seek(length - 2, 1)
+
+def probe_image_size(path: str):
+    try:
+        size = _probe_header_size(path)
+    except (OSError, struct.error):
+        size = None
+    if size:
+        return size
+    with Image.open(path) as im:
+        return im.size
+
+_probe_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="probe")
+
+def img_sizes(paths: List[str]) -> Dict[str, tuple]:
+    """Dimensions for many images at once.
+
+    Rows in the image_dims table are reused while the file's (mtime_ns, size) still
+    match; everything else is header-probed in parallel and written back in one
+    transaction. Unreadable images fall back to 224x224.
+    """
+    stats = {}
+    for p in paths:
+        try:
+            st = os.stat(p)
+            stats[p] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            continue
+
+    out = {}
+    conn = get_db()
+    for chunk in _chunks(list(stats)):
+        rows = conn.execute(
+            f"SELECT path, w, h, mtime_ns, size FROM image_dims WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+        for path, w, h, mtime_ns, size in rows:
+            if stats[path] == (mtime_ns, size):
+                out[path] = (w, h)
+
+    missing = [p for p in stats if p not in out]
+    if missing:
+        def probe(p):
+            try:
+                return p, probe_image_size(p)
+            except Exception:
+                return p, None
+        results = map(probe, missing) if len(missing) == 1 else _probe_pool.map(probe, missing)
+        new_rows = []
+        for p, size in results:
+            if size:
+                out[p] = size
+                new_rows.append((p, size[0], size[1], *stats[p]))
+        if new_rows:
+            record_image_dims_bulk(new_rows)
+
+    for p in paths:
+        out.setdefault(p, (224, 224))
+    return out
+
 def img_size(path: str):
+    return img_sizes([path])[path]
+
+def image_dhash(path: str) -> int:
+    """64-bit difference hash: one bit per pixel of a 9x8 grayscale thumbnail, set when it
+    is brighter than its right neighbour. draft() lets JPEGs decode at 1/8 scale."""
+    with Image.open(path) as im:
+        im.draft("L", (64, 64))
+        px = im.convert("L").resize((9, 8), Image.Resampling.BOX).tobytes()
+    return int("".join("1" if px[i] > px[i + 1] else "0" for row in range(0, 72, 9) for i in range(row, row + 8)), 2)
+
+def image_hashes(paths: List[str], job: "Job" = None, batch_size: int = 500):
+    """dHash for many images. Returns (hashes by path, number hashed now, number unreadable).
+
+    Rows in image_hashes are reused while the file's (mtime_ns, size) still match; the
+    rest are hashed across a worker pool (Pillow decodes outside the GIL) and stored a
+    batch at a time. Unreadable images are stored with a NULL hash so they aren't retried.
+    image_hashes_version is bumped once at the end, so cached clusters survive the scan.
+    """
+    stats = {}
+    for p in paths:
+        try:
+            st = os.stat(p)
+            stats[p] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            continue
+
+    out, known = {}, set()
+    conn = get_db()
+    for chunk in _chunks(list(stats)):
+        rows = conn.execute(
+            f"SELECT path, dhash, mtime_ns, size FROM image_hashes WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+        for path, h, mtime_ns, size in rows:
+            if stats[path] == (mtime_ns, size):
+                known.add(path)
+                if h is not None:
+                    out[path] = h & 0xFFFFFFFFFFFFFFFF
+
+    def dhash(p):
+        try:
+            return image_dhash(p)
+        except Exception:
+            return None
+
+    missing = [p for p in stats if p not in known]
+    if job:
+        job.set_total(len(missing))
+    failed = stored = 0
     try:
-        with Image.open(path) as im:
-            return im.size
-    except Exception:
-        return (224, 224)
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="dhash") as pool:
+            for i in range(0, len(missing), batch_size):
+                batch = missing[i:i + batch_size]
+                rows = []
+                for p, h in zip(batch, pool.map(dhash, batch)):
+                    if h is None:
+                        failed += 1
+                    else:
+                        out[p] = h
+                    # SQLite integers are signed 64-bit
+                    rows.append((p, *stats[p], None if h is None else h - (1 << 64) if h >> 63 else h))
+                with get_db() as conn:
+                    conn.executemany("INSERT OR REPLACE INTO image_hashes (path, mtime_ns, size, dhash) VALUES (?, ?, ?, ?)", rows)
+                stored += len(rows)
+                if job:
+                    job.advance(len(batch))
+    finally:
+        if stored:  # also publish what a cancelled scan got through
+            with get_db() as conn:
+                set_meta(conn, "image_hashes_version", str(time.time_ns()))
+    return out, len(missing) - failed, failed
+
+def hash_clusters(hashes: Dict[str, int], distance: int) -> List[List[str]]:
+    """Group keys whose hashes differ in at most `distance` bits (single linkage).
+
+    Multi-index hashing: the 64 bits are split into distance + 1 chunks, and two hashes
+    that close must agree exactly on at least one of them, so only keys sharing a chunk
+    value are ever compared.
+    """
+    by_hash: Dict[int, List[str]] = {}
+    for key, h in hashes.items():
+        by_hash.setdefault(h, []).append(key)
+    distinct = list(by_hash)
+    parent = list(range(len(distinct)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    bounds = [64 * i // (distance + 1) for i in range(distance + 2)]
+    for lo, hi in zip(bounds, bounds[1:]):
+        mask = (1 << (hi - lo)) - 1
+        buckets: Dict[int, List[int]] = {}
+        for i, h in enumerate(distinct):
+            buckets.setdefault((h >> lo) & mask, []).append(i)
+        for members in buckets.values():
+            for a, i in enumerate(members):
+                h = distinct[i]
+                for j in members[a + 1:]:
+                    if (h ^ distinct[j]).bit_count() <= distance:
+                        ri, rj = find(i), find(j)
+                        if ri != rj:
+                            parent[ri] = rj
+    groups: Dict[int, List[str]] = {}
+    for i, h in enumerate(distinct):
+        groups.setdefault(find(i), []).extend(by_hash[h])
+    return [g for g in groups.values() if len(g) > 1]
 
 def clamp(v, lo, hi): return max(lo, min(hi, v))
 
-def boxes_to_voc_xml(img_file: str, w: int, h: int, boxes: List[Dict[str, Any]]) -> bytes:
+def voc_entry(img_file: str, w: int, h: int, boxes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Annotation entry for boxes drawn on an image, clamped to it and with corners ordered."""
+    out = []
+    for b in boxes:
+        x1, y1, x2, y2 = int(b.get("x1",0)), int(b.get("y1",0)), int(b.get("x2",0)), int(b.get("y2",0))
+        x1, y1 = clamp(x1,0,w-1), clamp(y1,0,h-1)
+        x2, y2 = clamp(x2,0,w-1), clamp(y2,0,h-1)
+        out.append({"label": str(b.get("label","object")),
+                    "x1": min(x1,x2), "y1": min(y1,y2), "x2": max(x1,x2), "y2": max(y1,y2)})
+    return {"filename": img_file, "w": w, "h": h, "boxes": out,
+            "classes": {b["label"] for b in out if b["label"]}, "object_count": len(out)}
+
+def entry_to_voc_xml(entry: Dict[str, Any]) -> bytes:
+    img_file = entry["filename"] or ""
     ann = ET.Element("annotation")
     ET.SubElement(ann, "folder").text = os.path.basename(IMAGE_CATALOG_DIR)
     ET.SubElement(ann, "filename").text = img_file
     ET.SubElement(ann, "path").text = os.path.join(IMAGE_CATALOG_DIR, img_file)
     src = ET.SubElement(ann, "source"); ET.SubElement(src, "database").text = "Unknown"
     size = ET.SubElement(ann, "size")
-    ET.SubElement(size, "width").text = str(w)
-    ET.SubElement(size, "height").text = str(h)
+    ET.SubElement(size, "width").text = str(entry["w"])
+    ET.SubElement(size, "height").text = str(entry["h"])
     ET.SubElement(size, "depth").text = "3"
     ET.SubElement(ann, "segmented").text = "0"
-    for b in boxes:
-        x1, y1, x2, y2 = int(b.get("x1",0)), int(b.get("y1",0)), int(b.get("x2",0)), int(b.get("y2",0))
-        x1, y1 = clamp(x1,0,w-1), clamp(y1,0,h-1)
-        x2, y2 = clamp(x2,0,w-1), clamp(y2,0,h-1)
-        xmin, ymin, xmax, ymax = min(x1,x2), min(y1,y2), max(x1,x2), max(y1,y2)
+    for b in entry["boxes"]:
         obj = ET.SubElement(ann, "object")
-        ET.SubElement(obj, "name").text = str(b.get("label","object"))
+        ET.SubElement(obj, "name").text = b["label"]
         ET.SubElement(obj, "pose").text = "Unspecified"
         ET.SubElement(obj, "truncated").text = "0"
         ET.SubElement(obj, "difficult").text = "0"
         bb = ET.SubElement(obj, "bndbox")
-        ET.SubElement(bb, "xmin").text = str(xmin)
-        ET.SubElement(bb, "ymin").text = str(ymin)
-        ET.SubElement(bb, "xmax").text = str(xmax)
-        ET.SubElement(bb, "ymax").text = str(ymax)
+        ET.SubElement(bb, "xmin").text = str(b["x1"])
+        ET.SubElement(bb, "ymin").text = str(b["y1"])
+        ET.SubElement(bb, "xmax").text = str(b["x2"])
+        ET.SubElement(bb, "ymax").text = str(b["y2"])
     return ET.tostring(ann, encoding="utf-8")
 
+def boxes_to_voc_xml(img_file: str, w: int, h: int, boxes: List[Dict[str, Any]]) -> bytes:
+    return entry_to_voc_xml(voc_entry(img_file, w, h, boxes))
+
 def catalog_voc_xml_path(img_name: str) -> str:
     base, _ = os.path.splitext(img_name)
     return os.path.join(ANNOTATION_CATALOG_DIR, base + ".xml")
@@ -152,6 +977,1323 @@ def raw_voc_xml_path(img_name: str) -> str:
     base, _ = os.path.splitext(img_name)
     return os.path.join(RAW_IMAGES_DIR, ".tmp", base + ".xml")
 
+def raw_device_id(name: str) -> Optional[str]:
+    """Device id from a trap-node export name (`<id>_<device>_<auto>_<manual>.png`), else None."""
+    parts = os.path.splitext(name)[0].split("_")
+    return parts[1] if len(parts) >= 4 and parts[1] else None
+
+class RawTreeIndex:
+    """In-memory index of the RAW_IMAGES_DIR tree for the raw browser.
+
+    Each directory's entries are cached with its mtime; a refresh stats every known
+    directory but only rescans the ones whose mtime changed (an entry was added,
+    removed or renamed), and walks the tree at most every `min_interval` seconds
+    unless expire() was called. Per-directory device counts are computed at scan time,
+    so facets only sum directories. listdir, files and facets read the last refresh;
+    the derived listings are rebuilt lazily per version.
+    """
+
+    def __init__(self, root: str, min_interval: float = 0.0):
+        self.root = root
+        self.min_interval = min_interval
+        self._lock = threading.RLock()
+        self._dirs: Dict[str, tuple] = {}  # rel dir -> (mtime_ns, subdirs, files, device Counter, (name, path) rows)
+        self._memo: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._refreshed = None  # monotonic time of the last walk
+        self.version = 0
+
+    def _scan(self, rel: str, stamp: int) -> tuple:
+        subdirs, files = [], []
+        try:
+            with os.scandir(os.path.join(self.root, rel)) as it:
+                for entry in it:
+                    # Dot-entries are ours (.tmp holds raw annotations) or in-flight temporaries
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(entry.name)
+                        elif os.path.splitext(entry.name)[1].lower() in ALLOWED_EXTS:
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        subdirs.sort(key=lambda n: (n.lower(), n))
+        files.sort(key=lambda n: (n.lower(), n))
+        devices = Counter(filter(None, map(raw_device_id, files)))
+        rows = [(name, os.path.join(rel, name)) for name in files]
+        return (stamp, subdirs, files, devices, rows)
+
+    def expire(self):
+        """Make the next refresh walk the tree (after changes made through the app)."""
+        self._refreshed = None
+
+    def refresh(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._refreshed is not None and now - self._refreshed < self.min_interval:
+                return self._dirs
+            self._refreshed = now
+            dirs = {}
+            changed = False
+            stack = [""]
+            while stack:
+                rel = stack.pop()
+                try:
+                    stamp = os.stat(os.path.join(self.root, rel)).st_mtime_ns
+                except OSError:
+                    continue
+                entry = self._dirs.get(rel)
+                if entry is None or entry[0] != stamp:
+                    entry = self._scan(rel, stamp)
+                    changed = True
+                dirs[rel] = entry
+                stack.extend(os.path.join(rel, d) for d in entry[1])
+            if changed or len(dirs) != len(self._dirs):
+                self._dirs = dirs
+                self._memo.clear()
+                self.version += 1
+            return dirs
+
+    def listdir(self, rel: str) -> Optional[tuple]:
+        """(subdirs, files) of one directory, or None if it is not indexed."""
+        if self._refreshed is None:
+            self.refresh()
+        entry = self._dirs.get(rel)
+        return (entry[1], entry[2]) if entry else None
+
+    def _cached(self, key: tuple, build):
+        with self._lock:
+            if self._refreshed is None:
+                self.refresh()
+            dirs = self._dirs
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+            result = build(dirs)
+            self._memo[key] = result
+            while len(self._memo) > QUERY_CACHE_SIZE:
+                self._memo.popitem(last=False)
+            return result
+
+    @staticmethod
+    def _in_scope(rel: str, scope: str) -> bool:
+        return not scope or rel == scope or rel.startswith(scope + os.sep)
+
+    def files(self, scope: str = "", network: str = "", device: str = "") -> List[tuple]:
+        """(name, rel path) of every image under `scope` in tree order (folders, then names within each).
+
+        `network` keeps directories with a path component starting with it and
+        `device` keeps file names containing it.
+        """
+        def build(dirs):
+            keep = {rel for rel in dirs if self._in_scope(rel, scope)
+                    and (not network or any(p.startswith(network) for p in rel.split(os.sep)))}
+            rows = []
+            for rel in sorted(keep, key=lambda r: [(p.lower(), p) for p in r.split(os.sep)] if r else []):
+                if device:
+                    rows.extend(r for r in dirs[rel][4] if device in r[0])
+                else:
+                    rows.extend(dirs[rel][4])
+            return rows
+        return self._cached(("files", scope, network, device), build)
+
+    def facets(self, scope: str = "") -> Dict[str, Dict[str, int]]:
+        """Image counts under `scope` per network (top-level directory) and per device id."""
+        def build(dirs):
+            networks, devices = Counter(), Counter()
+            for rel, (_, _, files, devs, _) in dirs.items():
+                if not files or not self._in_scope(rel, scope):
+                    continue
+                if rel:
+                    networks[rel.split(os.sep, 1)[0]] += len(files)
+                devices.update(devs)
+            return {"networks": dict(sorted(networks.items())), "devices": dict(sorted(devices.items()))}
+        return self._cached(("facets", scope), build)
+
+RAW_TREE = RawTreeIndex(RAW_IMAGES_DIR, RAW_REFRESH_SECONDS)
+
+def parse_voc_annotation(path: str) -> Dict[str, Any]:
+    # One read plus fromstring beats ET.parse/iterparse on these small files
+    with open(path, "rb") as f:
+        return voc_entry_from_root(ET.fromstring(f.read()))
+
+def voc_entry_from_root(root: ET.Element) -> Dict[str, Any]:
+    w, h = -1, -1
+    size_el = root.find("size")
+    if size_el is not None:
+        w = int(size_el.findtext("width", "-1"))
+        h = int(size_el.findtext("height", "-1"))
+    boxes = []
+    objects = root.findall("object")
+    for obj in objects:
+        bnd = obj.find("bndbox")
+        if bnd is None: continue
+        boxes.append({
+            "label": obj.findtext("name", "object"),
+            "x1": int(bnd.findtext("xmin", "0")),
+            "y1": int(bnd.findtext("ymin", "0")),
+            "x2": int(bnd.findtext("xmax", "0")),
+            "y2": int(bnd.findtext("ymax", "0")),
+        })
+    return {
+        "filename": root.findtext("filename"),
+        "w": w, "h": h,
+        "boxes": boxes,
+        "classes": {o.findtext("name") for o in objects if o.findtext("name")},
+        "object_count": len(objects),
+    }
+
+class AnnotationCache:
+    """LRU of parsed VOC files, keyed by path and validated against (mtime_ns, size) on every read.
+
+    Entries are shared with the annotation index and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def read(self, path: str) -> Optional[Dict[str, Any]]:
+        """Return the parsed annotation, or None if there is no file. Raises on malformed XML."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._entries.get(path)
+            if hit and hit[0] == stamp:
+                self._entries.move_to_end(path)
+                return hit[1]
+
+        entry = parse_voc_annotation(path)
+        with self._lock:
+            self._entries[path] = (stamp, entry)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def prime(self, path: str, entry: Dict[str, Any]):
+        """Cache the entry for a file the caller just wrote (and still holds file_lock on)."""
+        stamp = file_stamp(path)
+        with self._lock:
+            self._entries[path] = (stamp, entry)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, path: str):
+        with self._lock:
+            self._entries.pop(path, None)
+
+ANNOTATION_CACHE = AnnotationCache(ANNOTATION_CACHE_SIZE)
+
+def file_stamp(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+class XmlAnnotationStore:
+    """Catalog annotations as one Pascal VOC XML per image in a directory (the default).
+
+    Entries are stamped with the file's (mtime_ns, size). Reads go through ANNOTATION_CACHE.
+    """
+
+    kind = "xml"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, img_name: str) -> str:
+        return os.path.join(self.directory, os.path.splitext(img_name)[0] + ".xml")
+
+    def read(self, stem: str):
+        """(stamp, entry) for one stem; (None, None) if it is missing or malformed."""
+        path = os.path.join(self.directory, stem + ".xml")
+        try:
+            st = os.stat(path)
+            entry = ANNOTATION_CACHE.read(path)
+        except (ET.ParseError, ValueError, OSError):
+            return None, None
+        return ((st.st_mtime_ns, st.st_size), entry) if entry is not None else (None, None)
+
+    def stamps(self) -> Dict[str, tuple]:
+        stamps = {}
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.name.endswith(".xml") and not e.name.startswith("."):
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    stamps[e.name[:-4]] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def stamps_of(self, img_names: List[str]) -> Dict[str, Optional[tuple]]:
+        return {n: file_stamp(self.path(n)) for n in img_names}
+
+    def scan(self, job: "Job" = None):
+        """Yield (stem, stamp, entry) for every stored annotation."""
+        stems = list(self.stamps())
+        if job:
+            job.set_total(len(stems))
+        for stem in stems:
+            stamp, entry = self.read(stem)
+            if entry is not None:
+                yield stem, stamp, entry
+            if job:
+                job.advance()
+
+    def entry(self, img_name: str) -> Optional[Dict[str, Any]]:
+        """The annotation, or None if there is none. Raises on malformed XML."""
+        return ANNOTATION_CACHE.read(self.path(img_name))
+
+    def entries(self, img_names: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """entry() per image name, with None for malformed XML too."""
+        out = {}
+        for name in img_names:
+            try:
+                out[name] = ANNOTATION_CACHE.read(self.path(name))
+            except (ET.ParseError, ValueError):
+                out[name] = None
+        return out
+
+    def xml(self, img_name: str) -> Optional[bytes]:
+        try:
+            with open(self.path(img_name), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write(self, img_name: str, entry: Dict[str, Any], xml: Optional[bytes] = None):
+        """Store an entry; `xml`, when the caller has the original document, is kept verbatim."""
+        atomic_write(self.path(img_name), xml if xml is not None else entry_to_voc_xml(entry))
+
+    def move_in(self, img_name: str, xml_path: str):
+        """Take over an XML file written elsewhere (e.g. the raw drop folder)."""
+        path = self.path(img_name)
+        shutil.move(xml_path, path)
+        try:
+            ANNOTATION_CACHE.read(path)  # parse here, in parallel, for the index update
+        except (ET.ParseError, ValueError, OSError):
+            pass
+
+    def relabel(self, img_name: str, new_class: str) -> bool:
+        """Rename every object; False if there is no annotation. Callers hold file_lock."""
+        path = self.path(img_name)
+        if not os.path.exists(path):
+            return False
+        root = ET.parse(path).getroot()
+        for obj in root.findall("object"):
+            obj.find("name").text = new_class
+        atomic_write(path, ET.tostring(root, encoding="utf-8"))
+        return True
+
+    def remap_labels(self, img_names: List[str], remap: Dict[str, str]):
+        """Rename objects per `remap` (old label -> new) across a worker pool, each file under
+        file_lock. Returns the names changed and (name, error) pairs for unreadable files."""
+        def remap_one(name):
+            path = self.path(name)
+            with file_lock(path):
+                try:
+                    with open(path, "rb") as f:
+                        root = ET.fromstring(f.read())
+                except FileNotFoundError:
+                    return name, False, None
+                except (ET.ParseError, OSError) as e:
+                    return name, False, str(e)
+                changed = False
+                for el in root.iterfind("object/name"):
+                    if el.text in remap:
+                        el.text = remap[el.text]
+                        changed = True
+                if changed:
+                    atomic_write(path, ET.tostring(root, encoding="utf-8"))
+                    ANNOTATION_CACHE.prime(path, voc_entry_from_root(root))  # the index re-reads it next
+            return name, changed, None
+
+        changed, errors = [], []
+        with ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="relabel") as pool:
+            for name, ok, error in pool.map(remap_one, img_names):
+                if ok:
+                    changed.append(name)
+                elif error:
+                    errors.append((name, error))
+        return changed, errors
+
+    def delete(self, img_name: str):
+        path = self.path(img_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+class CompactAnnotationStore:
+    """Catalog annotations in the metadata store instead of one XML per image.
+
+    Each image is one row of annotation_records whose `boxes` blob is a run of
+    fixed-width BOX_RECORD structs (label id, xmin, ymin, xmax, ymax), with label names
+    in annotation_labels. Rows are stamped (rev, blob size) the way XMLs are stamped by
+    (mtime_ns, size), so bulk reads, filters and exports are indexed queries rather than
+    an open and parse per file. `directory` is the VOC XML folder it imports from and
+    exports back to.
+    """
+
+    kind = "compact"
+    BOX_RECORD = struct.Struct("<I4i")
+    _COLUMNS = "stem, filename, w, h, objects, boxes, rev"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._label_ids: Dict[str, int] = {}
+        self._label_names: Dict[int, str] = {}
+
+    def _load_labels(self):
+        rows = get_db().execute("SELECT id, name FROM annotation_labels").fetchall()
+        with self._lock:
+            self._label_names = dict(rows)
+            self._label_ids = {name: i for i, name in rows}
+
+    def _ids(self, labels: Set[str]) -> Dict[str, int]:
+        missing = [l for l in labels if l not in self._label_ids]
+        if missing:
+            with get_db() as conn:
+                conn.executemany("INSERT OR IGNORE INTO annotation_labels (name) VALUES (?)", [(l,) for l in missing])
+            self._load_labels()
+        return self._label_ids
+
+    def _pack(self, boxes: List[Dict[str, Any]]) -> bytes:
+        ids = self._ids({b["label"] for b in boxes})
+        pack = self.BOX_RECORD.pack
+        return b"".join(pack(ids[b["label"]], b["x1"], b["y1"], b["x2"], b["y2"]) for b in boxes)
+
+    def _entry(self, row) -> Dict[str, Any]:
+        _, filename, w, h, objects, blob, _ = row
+        records = list(self.BOX_RECORD.iter_unpack(blob))
+        names = self._label_names
+        if any(r[0] not in names for r in records):
+            self._load_labels()  # labels added by another worker
+            names = self._label_names
+        boxes = [{"label": names[i], "x1": x1, "y1": y1, "x2": x2, "y2": y2} for i, x1, y1, x2, y2 in records]
+        return {"filename": filename, "w": w, "h": h, "boxes": boxes,
+                "classes": {b["label"] for b in boxes if b["label"]}, "object_count": objects}
+
+    def _select(self, stems: List[str]):
+        conn = get_db()
+        for chunk in _chunks(stems):
+            yield from conn.execute(f"SELECT {self._COLUMNS} FROM annotation_records "
+                                    f"WHERE stem IN ({','.join('?' * len(chunk))})", chunk)
+
+    def read(self, stem: str):
+        for row in self._select([stem]):
+            return (row[6], len(row[5])), self._entry(row)
+        return None, None
+
+    def stamps(self) -> Dict[str, tuple]:
+        return {stem: (rev, size) for stem, rev, size in
+                get_db().execute("SELECT stem, rev, length(boxes) FROM annotation_records")}
+
+    def stamps_of(self, img_names: List[str]) -> Dict[str, Optional[tuple]]:
+        stems = {os.path.splitext(n)[0]: n for n in img_names}
+        found = {row[0]: (row[6], len(row[5])) for row in self._select(list(stems))}
+        return {n: found.get(stem) for stem, n in stems.items()}
+
+    def scan(self, job: "Job" = None):
+        conn = get_db()
+        if job:
+            job.set_total(conn.execute("SELECT COUNT(*) FROM annotation_records").fetchone()[0])
+        self._load_labels()
+        for row in conn.execute(f"SELECT {self._COLUMNS} FROM annotation_records"):
+            yield row[0], (row[6], len(row[5])), self._entry(row)
+            if job:
+                job.advance()
+
+    def entry(self, img_name: str) -> Optional[Dict[str, Any]]:
+        return self.read(os.path.splitext(img_name)[0])[1]
+
+    def entries(self, img_names: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        stems = {os.path.splitext(n)[0]: n for n in img_names}
+        out = dict.fromkeys(img_names)
+        for row in self._select(list(stems)):
+            out[stems[row[0]]] = self._entry(row)
+        return out
+
+    def xml(self, img_name: str) -> Optional[bytes]:
+        entry = self.entry(img_name)
+        return entry_to_voc_xml(entry) if entry is not None else None
+
+    def write(self, img_name: str, entry: Dict[str, Any], xml: Optional[bytes] = None):
+        self.write_many([(img_name, entry)])
+
+    def write_many(self, items: List[tuple]):
+        """Store (img_name, entry) pairs in one transaction."""
+        rev = time.time_ns()
+        rows = [(os.path.splitext(name)[0], e["filename"], e["w"], e["h"], e["object_count"],
+                 self._pack(e["boxes"]), rev) for name, e in items]
+        with get_db() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO annotation_records ({self._COLUMNS}) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def move_in(self, img_name: str, xml_path: str):
+        self.write(img_name, parse_voc_annotation(xml_path))
+        os.remove(xml_path)
+
+    def relabel(self, img_name: str, new_class: str) -> bool:
+        entry = self.entry(img_name)
+        if entry is None:
+            return False
+        boxes = [dict(b, label=new_class) for b in entry["boxes"]]
+        self.write(img_name, dict(entry, boxes=boxes, classes={new_class} if boxes else set()))
+        return True
+
+    def remap_labels(self, img_names: List[str], remap: Dict[str, str]):
+        """Rename boxes per `remap` (old label -> new) by rewriting label ids in the packed
+        records, all rows in one transaction. Returns the names changed and no errors."""
+        ids = self._ids(set(remap.values()))
+        id_map = {ids[old]: ids[new] for old, new in remap.items() if old in ids}
+        stems = {os.path.splitext(n)[0]: n for n in img_names}
+        pack, rev, rows = self.BOX_RECORD.pack, time.time_ns(), []
+        conn = get_db()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")  # no single-image save slips between read and write
+            for stem, _, _, _, _, blob, _ in self._select(list(stems)):
+                records = list(self.BOX_RECORD.iter_unpack(blob))
+                if any(r[0] in id_map for r in records):
+                    rows.append((b"".join(pack(id_map.get(i, i), *box) for i, *box in records), rev, stem))
+            conn.executemany("UPDATE annotation_records SET boxes = ?, rev = ? WHERE stem = ?", rows)
+        return [stems[stem] for _, _, stem in rows], []
+
+    def delete(self, img_name: str):
+        with get_db() as conn:
+            conn.execute("DELETE FROM annotation_records WHERE stem = ?", (os.path.splitext(img_name)[0],))
+
+    def import_xml(self, job: "Job" = None, batch_size: int = 1000) -> List[str]:
+        """Parse every XML in `directory` (in parallel) into the store. Returns the stems imported."""
+        with os.scandir(self.directory) as it:
+            names = [e.name for e in it if e.name.endswith(".xml") and not e.name.startswith(".")]
+        if job:
+            job.set_total(len(names))
+
+        def parse(name):
+            try:
+                return name, parse_voc_annotation(os.path.join(self.directory, name))
+            except (ET.ParseError, ValueError, OSError) as e:
+                app.logger.error(f"Skipping {name} in annotation store import: {e}")
+                return name, None
+
+        imported = []
+        with ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="store-import") as pool:
+            for i in range(0, len(names), batch_size):
+                items = [(n, e) for n, e in pool.map(parse, names[i:i + batch_size]) if e is not None]
+                self.write_many(items)
+                imported += [n[:-4] for n, _ in items]
+                if job:
+                    job.advance(len(names[i:i + batch_size]))
+        return imported
+
+    def export_xml(self, job: "Job" = None) -> int:
+        """Write every record back to `directory` as a VOC XML."""
+        if job:
+            job.set_total(get_db().execute("SELECT COUNT(*) FROM annotation_records").fetchone()[0])
+
+        def write(item):
+            stem, _, entry = item
+            atomic_write(os.path.join(self.directory, stem + ".xml"), entry_to_voc_xml(entry))
+
+        count = 0
+        with ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="store-export") as pool:
+            for _ in pool.map(write, self.scan()):
+                count += 1
+                if job:
+                    job.advance()
+        return count
+
+if ANNOTATION_STORE_KIND == "compact":
+    ANNOTATION_STORE = CompactAnnotationStore(ANNOTATION_CATALOG_DIR)
+else:
+    ANNOTATION_STORE = XmlAnnotationStore(ANNOTATION_CATALOG_DIR)
+
+def annotation_item(entry: Optional[Dict[str, Any]], img_path: str, probe_size: bool = True) -> Dict[str, Any]:
+    """Boxes and image size for one image, in the shape the annotation endpoints return.
+
+    With probe_size=False a missing <size> is left as -1 for the caller to batch-probe.
+    """
+    boxes, w, h = [], -1, -1
+    if entry:
+        boxes, w, h = entry["boxes"], entry["w"], entry["h"]
+    if w < 0 and probe_size:
+        w, h = img_size(img_path)
+    return {"boxes": boxes, "w": w, "h": h}
+
+def load_annotation(img: str, axml: str, image_dir: str) -> Dict[str, Any]:
+    return annotation_item(ANNOTATION_CACHE.read(axml), os.path.join(image_dir, img))
+
+def bulk_annotations(images: List[str]) -> Dict[str, Dict[str, Any]]:
+    entries = ANNOTATION_STORE.entries([n for n in images if is_safe_filename(n)])
+    out = {n: annotation_item(e, os.path.join(IMAGE_CATALOG_DIR, n), probe_size=False) for n, e in entries.items()}
+
+    unsized = {os.path.join(IMAGE_CATALOG_DIR, n): n for n, item in out.items() if item["w"] < 0}
+    if unsized:
+        for path, (w, h) in img_sizes(list(unsized)).items():
+            out[unsized[path]].update(w=w, h=h)
+    return out
+
+def annotation_etag(stamp: Optional[tuple], img_path: str) -> str:
+    """Validator for an annotation response: the annotation's stamp, plus the image's for the <size> fallback."""
+    return "-".join(f"{s[0]:x}.{s[1]:x}" if s else "0" for s in (stamp, file_stamp(img_path)))
+
+def bulk_annotations_etag(images: List[str]) -> str:
+    h = hashlib.sha1()
+    stamps = ANNOTATION_STORE.stamps_of([n for n in images if is_safe_filename(n)])
+    for name in images:
+        if name in stamps:
+            tag = annotation_etag(stamps[name], os.path.join(IMAGE_CATALOG_DIR, name))
+            h.update(f"{name}\0{tag}\n".encode())
+    return h.hexdigest()
+
+def conditional_json(etag: str, build) -> Response:
+    """jsonify(build()) tagged with etag, or an empty 304 if the client already holds that version."""
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify(build())
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def file_version(path: str) -> Optional[str]:
+    """Cache-busting token for a file URL; matches CatalogListing.versions."""
+    try:
+        return format(os.stat(path).st_mtime_ns, "x")
+    except OSError:
+        return None
+
+def send_versioned(directory: str, fname: str, version: Optional[str]) -> Response:
+    """Serve a file immutably when the URL carries its current ?v= token, else make the client revalidate."""
+    requested = request.args.get("v")
+    if requested and requested == version:
+        resp = send_from_directory(directory, fname, max_age=IMMUTABLE_MAX_AGE)
+        resp.cache_control.immutable = True
+    else:
+        resp = send_from_directory(directory, fname, max_age=0)
+        resp.cache_control.no_cache = True
+    return resp
+
+class AnnotationIndex:
+    """In-memory index of the catalog annotations, keyed by image basename (XML stem).
+
+    Loaded at startup from a snapshot file (or straight from a compact store) and
+    reconciled against the annotation store in the background (each entry's stamp is
+    kept to spot changes), then patched by every endpoint that writes or removes an
+    annotation, so class filters are set lookups instead of a directory-wide parse.
+    Every patch is also appended to the annotation_changes journal, which other worker
+    processes replay before answering a query.
+    """
+
+    JOURNAL_KEEP = 100000
+    CHANGES_KEEP = 20000
+    SNAPSHOT_FORMAT = 1
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._stamps: Dict[str, tuple] = {}  # stem -> store stamp of the annotation the entry came from
+        self._by_class: Dict[str, Set[str]] = {}
+        self._box_counts: Dict[str, int] = {}  # stem -> boxes excluding __null__ markers
+        self._box_keys: Dict[str, tuple] = {}  # stem -> (label, area bin, aspect bin) per real box
+        self._box_stats: Counter = Counter()  # sum of _box_keys over all stems
+        self._boxed = 0  # stems with at least one real box
+        self._annotated = 0  # stems with at least one object, __null__ markers included
+        self._changes: deque = deque(maxlen=self.CHANGES_KEEP)  # (generation, stem, old entry, old keys, new entry, new keys)
+        self._seq = 0
+        self.generation = 0  # bumped on every change, local or replayed
+        self._saved_generation = -1
+
+    @staticmethod
+    def _box_count(entry: Dict[str, Any]) -> int:
+        return sum(1 for b in entry["boxes"] if b["label"] != "__null__")
+
+    @staticmethod
+    def _keys(entry: Dict[str, Any]) -> tuple:
+        keys = []
+        for b in entry["boxes"]:
+            if b["label"] == "__null__":
+                continue
+            w, h = abs(b["x2"] - b["x1"]), abs(b["y2"] - b["y1"])
+            keys.append((b["label"], bisect.bisect_right(STATS_AREA_BINS, (w * h) ** 0.5),
+                         bisect.bisect_right(STATS_ASPECT_BINS, w / h) if h else len(STATS_ASPECT_BINS)))
+        return tuple(keys)
+
+    def _journal_head(self) -> int:
+        return get_db().execute("SELECT COALESCE(MAX(seq), 0) FROM annotation_changes").fetchone()[0]
+
+    def _install(self, entries: Dict[str, Dict[str, Any]], stamps: Dict[str, tuple], seq: int):
+        by_class: Dict[str, Set[str]] = {}
+        for stem, entry in entries.items():
+            for c in entry["classes"]:
+                by_class.setdefault(c, set()).add(stem)
+        box_counts = {stem: self._box_count(e) for stem, e in entries.items()}
+        box_keys = {stem: self._keys(e) for stem, e in entries.items()}
+        box_stats = Counter()
+        for keys in box_keys.values():
+            box_stats.update(keys)
+        with self._lock:
+            self._entries = entries
+            self._stamps = stamps
+            self._by_class = by_class
+            self._box_counts = box_counts
+            self._box_keys = box_keys
+            self._box_stats = box_stats
+            self._boxed = sum(1 for n in box_counts.values() if n)
+            self._annotated = sum(1 for e in entries.values() if e["object_count"] > 0)
+            self._seq = seq
+            self._changes.clear()
+            self.generation += 1
+
+    def build(self, job: "Job" = None):
+        seq = self._journal_head()
+        entries, stamps = {}, {}
+        for stem, stamp, entry in self.store.scan(job):
+            entries[stem], stamps[stem] = entry, stamp
+        self._install(entries, stamps, seq)
+
+    def rebuild(self, stems: List[str]):
+        """build() after a bulk change to `stems`, journaled so other workers pick it up."""
+        self.build()
+        if stems:
+            self._journal(stems)
+
+    def load_snapshot(self, path: str) -> bool:
+        """Install the entries saved by save_snapshot; reconcile() then catches up with the disk."""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("format") != self.SNAPSHOT_FORMAT or data.get("ann_dir") != self.store.directory:
+            return False
+        entries, stamps = {}, {}
+        for stem, (mtime_ns, size, entry) in data["entries"].items():
+            entry["classes"] = set(entry["classes"])
+            entries[stem], stamps[stem] = entry, (mtime_ns, size)
+        # Replay the journal from the snapshot on if it still reaches back that far
+        head = self._journal_head()
+        seq = data.get("seq", 0)
+        self._install(entries, stamps, seq if seq >= head - self.JOURNAL_KEEP else head)
+        self._saved_generation = self.generation
+        return True
+
+    def save_snapshot(self, path: str):
+        if self.store.kind != "xml":
+            return  # a compact store loads about as fast as its snapshot would
+        with self._lock:
+            generation = self.generation
+            if generation == self._saved_generation:
+                return
+            entries = dict(self._entries)
+            stamps = dict(self._stamps)
+            seq = self._seq
+        data = {
+            "format": self.SNAPSHOT_FORMAT, "ann_dir": self.store.directory, "seq": seq,
+            "entries": {stem: [*stamps[stem], dict(e, classes=sorted(e["classes"]))]
+                        for stem, e in entries.items() if stem in stamps},
+        }
+        # dumps uses the C encoder; dump streams through the pure-Python one
+        atomic_write(path, json.dumps(data, separators=(",", ":")).encode())
+        self._saved_generation = generation
+
+    def reconcile(self, job: "Job" = None) -> Dict[str, int]:
+        """Re-read annotations whose stamp no longer matches the index and drop the ones that are gone."""
+        stamps = self.store.stamps()
+        with self._lock:
+            known = dict(self._stamps)
+        stale = [stem for stem, stamp in stamps.items() if known.get(stem) != stamp]
+        gone = [stem for stem in known if stem not in stamps]
+        if job:
+            job.set_total(len(stale) + len(gone))
+        for stem in stale + gone:
+            self._reload(stem)
+            if job:
+                job.advance()
+        return {"xml_files": len(stamps), "reparsed": len(stale), "removed": len(gone)}
+
+    def _unlink(self, stem: str):
+        old = self._entries.pop(stem, None)
+        if self._box_counts.pop(stem, 0):
+            self._boxed -= 1
+        self._box_stats.subtract(self._box_keys.pop(stem, ()))
+        self._stamps.pop(stem, None)
+        if not old:
+            return
+        if old["object_count"] > 0:
+            self._annotated -= 1
+        for c in old["classes"]:
+            members = self._by_class.get(c)
+            if members is None: continue
+            members.discard(stem)
+            if not members:
+                del self._by_class[c]
+
+    def _apply(self, stem: str, entry: Optional[Dict[str, Any]], stamp: Optional[tuple] = None):
+        with self._lock:
+            self.generation += 1
+            old, old_keys, keys = self._entries.get(stem), self._box_keys.get(stem, ()), ()
+            self._unlink(stem)
+            if entry is not None:
+                self._entries[stem] = entry
+                self._box_counts[stem] = self._box_count(entry)
+                if self._box_counts[stem]:
+                    self._boxed += 1
+                self._box_keys[stem] = keys = self._keys(entry)
+                self._box_stats.update(keys)
+                if entry["object_count"] > 0:
+                    self._annotated += 1
+                if stamp:
+                    self._stamps[stem] = stamp
+                for c in entry["classes"]:
+                    self._by_class.setdefault(c, set()).add(stem)
+            self._changes.append((self.generation, stem, old, old_keys, entry, keys))
+
+    def _reload(self, stem: str):
+        stamp, entry = self.store.read(stem)
+        with self._lock:
+            if (self._stamps.get(stem) if stem in self._entries else None) == stamp:
+                return False  # same file as the one already indexed (or still missing)
+        self._apply(stem, entry, stamp)
+        return True
+
+    def _journal(self, stems: List[str]):
+        with get_db() as conn:
+            conn.executemany("INSERT INTO annotation_changes (stem) VALUES (?)", [(s,) for s in stems])
+            seq = conn.execute("SELECT MAX(seq) FROM annotation_changes").fetchone()[0]
+            if seq // 1000 != (seq - len(stems)) // 1000:
+                conn.execute("DELETE FROM annotation_changes WHERE seq <= ?", (seq - self.JOURNAL_KEEP,))
+
+    def sync(self):
+        """Replay changes journaled by other processes since our last look."""
+        rows = get_db().execute("SELECT seq, stem FROM annotation_changes WHERE seq > ? ORDER BY seq",
+                                (self._seq,)).fetchall()
+        if not rows:
+            return
+        if rows[0][0] > self._seq + 1 and self._seq < self._journal_head() - self.JOURNAL_KEEP:
+            self.build()  # fell behind the pruned journal
+            return
+        for stem in dict.fromkeys(stem for _, stem in rows):
+            self._reload(stem)
+        with self._lock:
+            self._seq = max(self._seq, rows[-1][0])
+
+    def refresh(self, img_name: str):
+        """Re-read the annotation for one image (or drop it if it is gone)."""
+        stem = os.path.splitext(img_name)[0]
+        self._reload(stem)
+        self._journal([stem])
+
+    def refresh_many(self, img_names: List[str], journal: bool = True) -> List[str]:
+        """refresh() for a batch, journaled in one transaction. Returns the stems that changed.
+
+        Pass journal=False for changes every process sees by itself (e.g. a file watcher).
+        """
+        stems = [s for s in dict.fromkeys(os.path.splitext(n)[0] for n in img_names) if self._reload(s)]
+        if stems and journal:
+            self._journal(stems)
+        return stems
+
+    def put(self, img_name: str, entry: Dict[str, Any]):
+        """Store an already-parsed entry (e.g. from an import that parsed the XML in memory)."""
+        stem = os.path.splitext(img_name)[0]
+        self._apply(stem, entry, self.store.stamps_of([img_name])[img_name])
+        self._journal([stem])
+
+    def remove(self, img_name: str):
+        stem = os.path.splitext(img_name)[0]
+        self._apply(stem, None)
+        self._journal([stem])
+
+    def get(self, img_name: str) -> Optional[Dict[str, Any]]:
+        self.sync()
+        with self._lock:
+            return self._entries.get(os.path.splitext(img_name)[0])
+
+    def get_many(self, img_names: List[str]) -> List[Optional[Dict[str, Any]]]:
+        self.sync()
+        with self._lock:
+            return [self._entries.get(os.path.splitext(n)[0]) for n in img_names]
+
+    def stems_with_class(self, class_name: str) -> Set[str]:
+        self.sync()
+        with self._lock:
+            return set(self._by_class.get(class_name, ()))
+
+    def stamp(self) -> int:
+        """Generation after replaying other workers' changes; cache keys use it."""
+        self.sync()
+        return self.generation
+
+    def box_counts(self) -> Dict[str, int]:
+        self.sync()
+        with self._lock:
+            return dict(self._box_counts)
+
+    def annotated_stems(self) -> Set[str]:
+        self.sync()
+        with self._lock:
+            return {stem for stem, e in self._entries.items() if e["object_count"] > 0}
+
+    def stats(self, stems: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """Aggregates over all stems (kept up to date on every change) or over `stems`."""
+        self.sync()
+        with self._lock:
+            if stems is None:
+                return {
+                    "generation": self.generation,
+                    "annotated": self._annotated,
+                    "boxed": self._boxed,
+                    "box_stats": +self._box_stats,
+                    "class_images": Counter({c: len(m) for c, m in self._by_class.items()}),
+                }
+            generation = self.generation
+            found = [s for s in stems if s in self._entries]
+            entries = [self._entries[s] for s in found]
+            keys = [self._box_keys[s] for s in found]
+        return {
+            "generation": generation,
+            "annotated": sum(1 for e in entries if e["object_count"] > 0),
+            "boxed": len(keys) - keys.count(()),
+            "box_stats": Counter(itertools.chain.from_iterable(keys)),
+            "class_images": Counter(itertools.chain.from_iterable(e["classes"] for e in entries)),
+        }
+
+    def update_stats(self, agg: Dict[str, Any], stems: Set[str]) -> Optional[Dict[str, Any]]:
+        """Brings stats(stems) taken at an earlier generation up to date from the change log,
+        or returns None when the log no longer reaches back that far."""
+        self.sync()
+        with self._lock:
+            since, generation = agg["generation"], self.generation
+            if since == generation:
+                return agg
+            if not self._changes or self._changes[0][0] > since + 1:
+                return None
+            changes = [c for c in self._changes if c[0] > since and c[1] in stems]
+        box_stats, class_images = agg["box_stats"].copy(), agg["class_images"].copy()
+        annotated, boxed = agg["annotated"], agg["boxed"]
+        for _, _, old, old_keys, new, keys in changes:
+            box_stats.subtract(old_keys)
+            box_stats.update(keys)
+            boxed += bool(keys) - bool(old_keys)
+            for entry, sign in ((old, -1), (new, 1)):
+                if entry is not None:
+                    annotated += sign * (entry["object_count"] > 0)
+                    class_images.update({c: sign for c in entry["classes"]})
+        return {"generation": generation, "annotated": annotated, "boxed": boxed,
+                "box_stats": +box_stats, "class_images": +class_images}
+
+    def changed_stems(self, since: int) -> Optional[Set[str]]:
+        """Stems changed after generation `since`, or None when the change log no longer reaches back that far."""
+        self.sync()
+        with self._lock:
+            if since == self.generation:
+                return set()
+            if not self._changes or self._changes[0][0] > since + 1:
+                return None
+            return {c[1] for c in self._changes if c[0] > since}
+
+    def stems(self) -> Set[str]:
+        self.sync()
+        with self._lock:
+            return set(self._entries)
+
+    def classes(self) -> Set[str]:
+        self.sync()
+        with self._lock:
+            return set(self._by_class)
+
+ANNOTATION_INDEX = AnnotationIndex(ANNOTATION_STORE)
+if ANNOTATION_STORE.kind == "compact":
+    ANNOTATION_INDEX.build()  # one indexed query; the store is its own snapshot
+else:
+    ANNOTATION_INDEX.load_snapshot(INDEX_SNAPSHOT_FILE)
+
+def thumb_path(img_name: str, size: int) -> str:
+    ext = ".webp" if THUMB_FORMAT == "webp" else ".jpg"
+    return os.path.join(THUMB_CACHE_DIR, str(size), img_name + ext)
+
+def ensure_thumbnail(img_name: str, size: int) -> Optional[str]:
+    """Return the cached thumbnail path, (re)generating it if the source mtime changed."""
+    src = os.path.join(IMAGE_CATALOG_DIR, img_name)
+    try:
+        st = os.stat(src)
+    except OSError:
+        return None
+    dest = thumb_path(img_name, size)
+    try:
+        if os.stat(dest).st_mtime_ns == st.st_mtime_ns:
+            return dest
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{threading.get_ident()}.tmp"
+    with Image.open(src) as im:
+        im.draft("RGB", (size, size))  # lets the JPEG decoder downscale while decoding
+        im.thumbnail((size, size))
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        if THUMB_FORMAT == "webp":
+            im.save(tmp, "WEBP", quality=80, method=4)
+        else:
+            im.save(tmp, "JPEG", quality=82, optimize=True)
+    # Stamp the thumbnail with the source mtime so staleness is a single stat comparison
+    os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp, dest)
+    return dest
+
+def remove_thumbnails(img_name: str):
+    for size in THUMB_SIZES:
+        try:
+            os.remove(thumb_path(img_name, size))
+        except OSError:
+            pass
+
+_thumb_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbs")
+
+def _prewarm_one(img_name: str):
+    for size in THUMB_SIZES:
+        try:
+            ensure_thumbnail(img_name, size)
+        except Exception as e:
+            app.logger.warning(f"Thumbnail pre-warm failed for {img_name}: {e}")
+            return
+
+def prewarm_thumbnails(img_names: List[str]):
+    if not THUMB_PREWARM:
+        return
+    for name in img_names:
+        _thumb_pool.submit(_prewarm_one, name)
+
+class _Inotify:
+    """Minimal Linux inotify binding over ctypes (raises OSError where unavailable)."""
+
+    IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_DELETE = 0x8, 0x40, 0x80, 0x200
+    IN_Q_OVERFLOW, IN_CLOEXEC = 0x4000, 0x80000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            init = self._libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify unavailable: {e}")
+        self.fd = init(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: Dict[int, str] = {}
+
+    def add(self, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.dirs[wd] = path
+
+    def read(self, timeout: Optional[float]):
+        """Yield (directory, name) for each event; (None, None) if the kernel queue overflowed."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        data = os.read(self.fd, 256 * 1024)
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, pos)
+            pos += self._EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            if mask & self.IN_Q_OVERFLOW:
+                yield None, None
+            elif wd in self.dirs and name:
+                yield self.dirs[wd], name
+
+class CatalogWatcher:
+    """Feeds files added, replaced or removed behind our back in IMAGE_CATALOG_DIR and
+    ANNOTATION_CATALOG_DIR into the listing, annotation index, categories and classes.
+    With a compact annotation store there is no annotation folder to watch (ann_dir is None).
+
+    Uses inotify where available; otherwise polls the two directories' mtimes every
+    WATCH_INTERVAL seconds and diffs their names (polling misses in-place rewrites,
+    which don't touch the directory mtime). Events are applied in small batches.
+    Endpoints still patch the indexes themselves, so re-applying their own writes is a no-op.
+    """
+
+    DEBOUNCE = 0.25
+
+    def __init__(self, image_dir: str, ann_dir: Optional[str], mode: str):
+        self.image_dir = image_dir
+        self.ann_dir = ann_dir
+        self.mode = mode
+        self.backend = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self):
+        if self._thread is not None or self.mode == "off":
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            inotify = None
+            if self.mode != "poll":
+                try:
+                    inotify = _Inotify()
+                    inotify.add(self.image_dir)
+                    if self.ann_dir:
+                        inotify.add(self.ann_dir)
+                except OSError as e:
+                    app.logger.info(f"File watcher falling back to polling: {e}")
+                    inotify = None
+            self.backend = "inotify" if inotify else "poll"
+            target = self._run_inotify if inotify else self._run_poll
+            self._thread = threading.Thread(target=self._run, args=(target, *((inotify,) if inotify else ())),
+                                            name="catalog-watcher", daemon=True)
+            # Before start(): a watcher that dies at once must still leave watched False
+            CATALOG_LISTING.watched = True
+            self._thread.start()
+
+    def _run(self, target, *args):
+        try:
+            target(*args)
+        except Exception:
+            app.logger.exception("File watcher stopped; the catalog listing goes back to checking the folder mtime")
+        finally:
+            # Not fed any more: let the listing notice changes itself again
+            CATALOG_LISTING.watched = False
+            self.backend = None
+
+    @staticmethod
+    def _names(directory: str) -> Set[str]:
+        with os.scandir(directory) as it:
+            return {e.name for e in it if not e.name.startswith(".")}
+
+    def _run_inotify(self, inotify: _Inotify):
+        while True:
+            touched: Dict[str, Set[str]] = {self.image_dir: set(), self.ann_dir: set()}
+            deadline = None
+            while deadline is None or time.monotonic() < deadline:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                for directory, name in inotify.read(timeout):
+                    if directory is None:
+                        self._resync()
+                    elif not name.startswith("."):
+                        touched[directory].add(name)
+                if deadline is None and any(touched.values()):
+                    deadline = time.monotonic() + self.DEBOUNCE
+            self._apply(touched[self.image_dir], touched[self.ann_dir])
+
+    def _run_poll(self):
+        stamps = {}
+        known = {}
+        while True:
+            changed = {}
+            for directory in filter(None, (self.image_dir, self.ann_dir)):
+                try:
+                    stamp = os.stat(directory).st_mtime_ns
+                    if stamps.get(directory) != stamp:
+                        names = self._names(directory)
+                        if directory in known:
+                            changed[directory] = names ^ known[directory]
+                        stamps[directory], known[directory] = stamp, names
+                except OSError:
+                    continue
+            if changed:
+                self._apply(changed.get(self.image_dir, set()), changed.get(self.ann_dir, set()))
+            time.sleep(WATCH_INTERVAL)
+
+    def _resync(self):
+        """After an inotify overflow: diff both directories against the indexes once."""
+        images = self._names(self.image_dir)
+        listed = CATALOG_LISTING.snapshot()[1]
+        stems = set()
+        if self.ann_dir:
+            stems = {os.path.splitext(n)[0] for n in self._names(self.ann_dir) if n.endswith(".xml")}
+            stems ^= ANNOTATION_INDEX.stems()
+        self._apply(images ^ listed.keys(), {s + ".xml" for s in stems})
+
+    def _apply(self, images: Set[str], xmls: Set[str]):
+        try:
+            if images:
+                present = [n for n in images if os.path.isfile(os.path.join(self.image_dir, n))]
+                gone = [n for n in images if n not in present]
+                listed = CATALOG_LISTING.snapshot()[1]
+                new = [n for n in present if n not in listed]
+                for n in gone:
+                    if n in listed:
+                        remove_thumbnails(n)
+                CATALOG_LISTING.discard(gone)
+                CATALOG_LISTING.add(present)
+                categorize_images(new)
+                prewarm_thumbnails(new)
+            xmls = [n for n in xmls if n.endswith(".xml")]
+            if xmls:
+                changed = ANNOTATION_INDEX.refresh_many(xmls, journal=False)
+                classes = set()
+                for stem in changed:
+                    entry = ANNOTATION_INDEX.get(stem + ".xml")
+                    if entry:
+                        classes |= entry["classes"]
+                if classes:
+                    add_classes(list(classes))
+        except Exception as e:
+            app.logger.error(f"File watcher failed to apply changes: {e}")
+
+WATCHER = CatalogWatcher(IMAGE_CATALOG_DIR, ANNOTATION_CATALOG_DIR if ANNOTATION_STORE.kind == "xml" else None, WATCH_MODE)
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    """Progress and outcome of one background task, polled through /api/jobs/<id>.
+
+    State is mirrored into the jobs table (at most every PERSIST_INTERVAL seconds
+    while running) so any worker process can answer a poll or accept a cancel.
+    """
+
+    PERSIST_INTERVAL = 0.5
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued | running | done | failed | cancelled
+        self.done = 0
+        self.total = 0
+        self.bytes = 0
+        self.errors: List[str] = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._persisted = 0.0
+
+    def persist(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._persisted < self.PERSIST_INTERVAL:
+            return
+        self._persisted = now
+        with get_db() as conn:
+            conn.execute("INSERT INTO jobs (id, state, updated) VALUES (?, ?, ?) "
+                         "ON CONFLICT(id) DO UPDATE SET state = excluded.state, updated = excluded.updated",
+                         (self.id, json.dumps(self.to_dict()), now))
+            if not self._cancel.is_set():
+                row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+                if row and row[0]:
+                    self._cancel.set()
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.total = total
+        self.persist()
+
+    def advance(self, n: int = 1, nbytes: int = 0, error: str = None):
+        """Record progress; raises JobCancelled once cancellation was requested."""
+        with self._lock:
+            self.done += n
+            self.bytes += nbytes
+            if error:
+                self.errors.append(error)
+        self.persist()
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            eta = None
+            if self.status == "running" and self.done and self.total > self.done:
+                elapsed = time.time() - self.started
+                eta = round(elapsed / self.done * (self.total - self.done), 1)
+            return {
+                "id": self.id, "kind": self.kind, "status": self.status,
+                "done": self.done, "total": self.total, "bytes": self.bytes, "eta_seconds": eta,
+                "errors": list(self.errors), "result": self.result, "error": self.error,
+                "created": self.created, "started": self.started, "finished": self.finished,
+            }
+
+class JobManager:
+    """Bounded worker pool for long-running imports, exports and rescans."""
+
+    def __init__(self, workers: int, keep: int = 200):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jobs")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._keep = keep
+
+    def submit(self, kind: str, fn, *args) -> Job:
+        job = Job(kind)
+        job.persist(force=True)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j.id for j in self._jobs.values() if j.finished]
+            for old_id in finished[:max(0, len(self._jobs) - self._keep)]:
+                del self._jobs[old_id]
+        with get_db() as conn:
+            conn.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - 7 * 86400,))
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn, args):
+        job.persist(force=True)
+        if job._cancel.is_set():
+            job.status, job.finished = "cancelled", time.time()
+            job.persist(force=True)
+            return
+        job.status, job.started = "running", time.time()
+        try:
+            job.result = fn(job, *args)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            app.logger.exception(f"Job {job.id} ({job.kind}) failed")
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished = time.time()
+            job.persist(force=True)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job state as a dict, from this process if it runs the job, else from the jobs table."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        row = get_db().execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, limit: int = 200) -> List[Dict[str, Any]]:
+        rows = get_db().execute("SELECT state FROM jobs ORDER BY updated DESC LIMIT ?", (limit,))
+        return [json.loads(r[0]) for r in rows]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job:
+            job._cancel.set()
+        with get_db() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        return self.get(job_id)
+
+JOBS = JobManager(JOB_WORKERS)
+
+def job_accepted(job: Job):
+    return jsonify({"ok": True, "job_id": job.id, "job_url": f"/api/jobs/{job.id}"}), 202
+
 @app.route("/")
 def index():
     return render_template("catalog.html", app_title=APP_TITLE, page_size=PAGE_SIZE_DEFAULT)
@@ -176,6 +2318,34 @@ def raw_review_classify_page():
 def add_from_catalog_page():
     return render_template("add_from_catalog.html", app_title=APP_TITLE)
 
+_available_cache_lock = threading.Lock()
+_available_cache: "OrderedDict[tuple, tuple]" = OrderedDict()  # (project, category) -> (versions, names)
+
+def available_catalog_images(project: Optional[str], category: Optional[str]) -> List[str]:
+    """Catalog images not in `project` (optionally only those in `category`), sorted by name.
+
+    Cached against the listing, project and category versions, like /api/query, so
+    paging doesn't redo the set difference and sort.
+    """
+    key = (project, category)
+    versions = (CATALOG_LISTING.snapshot()[0], project_version(project) if project else None,
+                categories_version() if category else None)
+    with _available_cache_lock:
+        hit = _available_cache.get(key)
+        if hit is not None and hit[0] == versions:
+            _available_cache.move_to_end(key)
+            return hit[1]
+    project_images = cached_project_image_set(project) if project else frozenset()
+    available = sorted(CATALOG_LISTING.names() - project_images)
+    if category:
+        in_category = images_in_category(category)
+        available = [f for f in available if f in in_category]
+    with _available_cache_lock:
+        _available_cache[key] = (versions, available)
+        while len(_available_cache) > QUERY_CACHE_SIZE:
+            _available_cache.popitem(last=False)
+    return available
+
 @app.route("/api/catalog/available")
 def api_catalog_available():
     try: page = int(request.args.get("page", "1"))
@@ -184,19 +2354,7 @@ def api_catalog_available():
     except: page_size = PAGE_SIZE_DEFAULT
 
     dirs = get_active_project_dirs()
-    project_images = set()
-    if dirs:
-        with open(dirs["project_images"], "r") as f:
-            project_images = {line.strip() for line in f}
-
-    category = request.args.get("category")
-
-    catalog_images = {f for f in os.listdir(IMAGE_CATALOG_DIR) if os.path.isfile(os.path.join(IMAGE_CATALOG_DIR, f))}
-    available_images = sorted(list(catalog_images - project_images))
-
-    if category:
-        categories = load_image_categories()
-        available_images = [f for f in available_images if categories.get(f) == category]
+    available_images = available_catalog_images(dirs["name"] if dirs else None, request.args.get("category"))
 
     total = len(available_images)
     start = max(0, (page - 1) * page_size)
@@ -206,7 +2364,8 @@ def api_catalog_available():
         "total": total,
         "page": page,
         "page_size": page_size,
-        "images": available_images[start:end]
+        "images": available_images[start:end],
+        "versions": CATALOG_LISTING.versions(available_images[start:end])
     })
 
 @app.route("/api/catalog/images")
@@ -218,17 +2377,21 @@ def api_catalog_images():
     category = request.args.get("category")
     class_filter = request.args.get("class_filter")
 
-    all_files = sorted(
-        [f for f in os.listdir(IMAGE_CATALOG_DIR) if os.path.isfile(os.path.join(IMAGE_CATALOG_DIR, f))],
-        key=lambda f: (-os.path.getmtime(os.path.join(IMAGE_CATALOG_DIR, f)), f.lower())
-    )
-
+    all_files = CATALOG_LISTING.files()
+    # Both paging modes filter the whole catalog with the same predicates
+    keeps = []
     if category:
-        categories = load_image_categories()
-        all_files = [f for f in all_files if categories.get(f) == category]
-
+        in_category = images_in_category(category)
+        keeps.append(lambda f: f in in_category)
     if class_filter:
-        all_files = get_images_by_class(class_filter, images_to_check=all_files)
+        keeps.append(class_predicate(class_filter))
+    keep = (lambda f: all(k(f) for k in keeps)) if keeps else None
+
+    if "cursor" in request.args:
+        return cursor_listing(all_files, catalog_order_key(CATALOG_LISTING.snapshot()[1]), keep)
+
+    if keep:
+        all_files = [f for f in all_files if keep(f)]
 
     total = len(all_files)
     start = max(0, (page - 1) * page_size)
@@ -238,24 +2401,13 @@ def api_catalog_images():
         "total": total,
         "page": page,
         "page_size": page_size,
-        "images": all_files[start:end]
+        "images": all_files[start:end],
+        "versions": CATALOG_LISTING.versions(all_files[start:end])
     })
 
 @app.route("/api/catalog/project_associations")
 def api_catalog_project_associations():
-    associations = {}
-    projects = [d for d in os.listdir(PROJECTS_ROOT_DIR) if os.path.isdir(os.path.join(PROJECTS_ROOT_DIR, d))]
-    for project in projects:
-        project_images_file = os.path.join(PROJECTS_ROOT_DIR, project, "project_images.txt")
-        if os.path.exists(project_images_file):
-            with open(project_images_file, "r") as f:
-                for line in f:
-                    image = line.strip()
-                    if image:
-                        if image not in associations:
-                            associations[image] = []
-                        associations[image].append(project)
-    return jsonify(associations)
+    return jsonify(project_associations())
 
 @app.route("/api/catalog/delete", methods=["POST"])
 def api_catalog_delete():
@@ -270,15 +2422,16 @@ def api_catalog_delete():
             continue
 
         try:
-            # Delete the image file
-            image_path = os.path.join(IMAGE_CATALOG_DIR, filename)
-            if os.path.exists(image_path):
-                os.remove(image_path)
-
-            # Delete the annotation file
-            annotation_path = catalog_voc_xml_path(filename)
-            if os.path.exists(annotation_path):
-                os.remove(annotation_path)
+            # Under the annotation's lock, so a relabel or import of the same file can't
+            # write it back between the image and the annotation going
+            with file_lock(catalog_voc_xml_path(filename)):
+                image_path = os.path.join(IMAGE_CATALOG_DIR, filename)
+                if os.path.exists(image_path):
+                    os.remove(image_path)
+                ANNOTATION_STORE.delete(filename)
+                ANNOTATION_INDEX.remove(filename)
+            CATALOG_LISTING.discard([filename])
+            remove_thumbnails(filename)
 
             deleted_count += 1
         except Exception as e:
@@ -294,11 +2447,7 @@ def api_catalog_move_category():
     if new_category not in ["TrapNode", "CageNode"]:
         return jsonify({"error": "Invalid category"}), 400
 
-    categories = load_image_categories()
-    for filename in files_to_move:
-        if filename in categories:
-            categories[filename] = new_category
-    save_image_categories(categories)
+    set_image_category(files_to_move, new_category)
 
     return jsonify({"ok": True})
 
@@ -317,21 +2466,75 @@ def api_catalog_change_class():
             errors.append({"file": filename, "error": "Invalid filename"})
             continue
 
-        annotation_path = catalog_voc_xml_path(filename)
-        if os.path.exists(annotation_path):
-            try:
-                tree = ET.parse(annotation_path)
-                root = tree.getroot()
-                for obj in root.findall("object"):
-                    obj.find("name").text = new_class
-                tree.write(annotation_path)
-            except Exception as e:
-                errors.append({"file": filename, "error": str(e)})
-        else:
-            errors.append({"file": filename, "error": "No annotation file found"})
+        try:
+            with file_lock(catalog_voc_xml_path(filename)):
+                if ANNOTATION_STORE.relabel(filename, new_class):
+                    ANNOTATION_INDEX.refresh(filename)
+                else:
+                    errors.append({"file": filename, "error": "No annotation file found"})
+        except Exception as e:
+            errors.append({"file": filename, "error": str(e)})
 
     return jsonify({"ok": True, "errors": errors})
 
+def remap_class_list(remap: Dict[str, str]):
+    """Rename classes in the stored class list after a bulk relabel, in one write.
+
+    A source class keeps its entry while any annotation still uses it; targets take the
+    position of their first source, or are appended.
+    """
+    current = get_classes() or []
+    classes = []
+    for c in current:
+        if c in remap and not ANNOTATION_INDEX.stems_with_class(c):
+            c = remap[c]
+        if c not in classes:
+            classes.append(c)
+    classes += [c for c in dict.fromkeys(remap.values()) if c not in classes]
+    if classes != current:
+        set_classes(classes)
+
+def run_bulk_relabel(job: Job, img_names: List[str], remap: Dict[str, str], batch_size: int = 1000) -> Dict[str, Any]:
+    job.set_total(len(img_names))
+    changed = 0
+    try:
+        for i in range(0, len(img_names), batch_size):
+            batch = img_names[i:i + batch_size]
+            names, errors = ANNOTATION_STORE.remap_labels(batch, remap)
+            # Re-read from the store rather than trusting our own result, in case a save raced us
+            ANNOTATION_INDEX.refresh_many(names)
+            changed += len(names)
+            for name, error in errors:
+                app.logger.error(f"Skipping {name} in relabel: {error}")
+                job.advance(0, error=f"{name}: {error}")
+            job.advance(len(batch))
+    finally:
+        if changed:
+            remap_class_list(remap)
+    return {"changed": changed, "remap": remap}
+
+@app.route("/api/catalog/relabel", methods=["POST"])
+def api_catalog_relabel():
+    """Queue a job renaming labels per `remap` in the selected files, the images matching
+    `query` (/api/query filters), or the whole catalog."""
+    data = request.get_json(force=True, silent=True) or {}
+    remap = parse_remap(data.get("remap", []))
+    remap = {old: new for old, new in remap.items() if old != new}
+    if not remap or not all(isinstance(v, str) and v.strip() for v in remap.values()):
+        return jsonify({"error": "Provide a remap with a non-empty target class for each entry"}), 400
+    if "__null__" in remap or "__null__" in remap.values():
+        return jsonify({"error": "__null__ can't be relabeled"}), 400
+    if "files" in data:
+        names = [f for f in data["files"] if is_safe_filename(f)]
+    elif isinstance(data.get("query"), dict):
+        names = query_catalog_images(MultiDict(data["query"]))
+    else:
+        names = CATALOG_LISTING.files()
+    # Only images that carry one of the source labels have anything to rewrite
+    stems = set().union(*(ANNOTATION_INDEX.stems_with_class(c) for c in remap))
+    names = [n for n in names if os.path.splitext(n)[0] in stems]
+    return job_accepted(JOBS.submit("relabel", run_bulk_relabel, names, remap))
+
 @app.route("/api/catalog/add_to_project", methods=["POST"])
 def api_catalog_add_to_project():
     data = request.get_json(force=True, silent=True) or {}
@@ -342,13 +2545,14 @@ def api_catalog_add_to_project():
         errors.append({"error": "No active project"})
         return jsonify({"ok": False, "errors": errors})
 
+    valid = []
+    for file in files:
+        if is_safe_filename(file):
+            valid.append(file)
+        else:
+            errors.append({"file": file, "error": "Invalid filename"})
     try:
-        with open(dirs["project_images"], "a") as f:
-            for file in files:
-                if is_safe_filename(file):
-                    f.write(file + "\n")
-                else:
-                    errors.append({"file": file, "error": "Invalid filename"})
+        add_project_images(dirs["name"], valid)
     except Exception as e:
         errors.append({"error": str(e)})
 
@@ -361,55 +2565,153 @@ def annotate_page():
     path = os.path.join(IMAGE_CATALOG_DIR, img)
     if not os.path.exists(path): abort(404, "Image not found.")
     w,h = img_size(path)
-    return render_template("annotate.html", image_name=img, image_w=w, image_h=h, app_title=APP_TITLE)
+    return render_template("annotate.html", image_name=img, image_version=file_version(path) or "",
+                           image_w=w, image_h=h, app_title=APP_TITLE)
 
 def get_unannotated_images() -> List[str]:
-    all_images = set(list_images_sorted())
-    annotated_images = set()
+    annotated = ANNOTATION_INDEX.annotated_stems()
+    return [img for img in list_images_sorted() if os.path.splitext(img)[0] not in annotated]
 
-    for ann_file in glob.glob(os.path.join(ANNOTATION_CATALOG_DIR, "*.xml")):
-        try:
-            tree = ET.parse(ann_file)
-            if len(tree.findall("object")) > 0:
-                filename = tree.findtext("filename")
-                if filename and is_safe_filename(filename):
-                    annotated_images.add(filename)
-        except ET.ParseError:
-            continue
-
-    unannotated = sorted(list(all_images - annotated_images), key=lambda p: p.lower())
-    return unannotated
-
-def get_images_by_class(class_name: str, images_to_check: List[str] = None) -> List[str]:
-    img_files = set()
+def get_images_by_class(class_name: str) -> List[str]:
+    """The active project's images in `class_name` (or __unannotated__), in listing order."""
     if class_name == "__unannotated__":
         return get_unannotated_images()
+    stems = ANNOTATION_INDEX.stems_with_class(class_name)
+    return [img for img in list_images_sorted() if os.path.splitext(img)[0] in stems]
 
-    annotation_files = glob.glob(os.path.join(ANNOTATION_CATALOG_DIR, "*.xml"))
-    image_to_annotation = {os.path.splitext(os.path.basename(f))[0]: f for f in annotation_files}
-
-    images_to_scan = images_to_check
-    if images_to_scan is None:
-        images_to_scan = list_images_sorted()
-
-    for img_name in images_to_scan:
-        base_name = os.path.splitext(img_name)[0]
-        ann_file = image_to_annotation.get(base_name)
-        if not ann_file:
-            continue
-        try:
-            tree = ET.parse(ann_file)
-            root = tree.getroot()
-            if class_name == "__null__":
-                if any(o.findtext("name") == "__null__" for o in root.findall("object")):
-                    img_files.add(img_name)
-            else:
-                if any(o.findtext("name") == class_name for o in root.findall("object")):
-                    img_files.add(img_name)
-        except ET.ParseError:
-            continue
-
-    return [img for img in images_to_scan if img in img_files]
+def filtered_project_images(class_filter: Optional[str]) -> List[str]:
+    if class_filter and class_filter != "All Classes":
+        return get_images_by_class(class_filter)
+    return list_images_sorted()
+
+def listing_order_key():
+    """Sort key of filtered_project_images (whatever the filter), for resolving name cursors."""
+    return catalog_order_key(CATALOG_LISTING.snapshot()[1])
+
+def index_after(images: List[str], after: str) -> int:
+    """Position just past `after` in a filtered_project_images listing, even if `after` has left it."""
+    key = listing_order_key()
+    return bisect.bisect_right(images, key(after), key=key)
+
+def class_predicate(class_filter: str):
+    if class_filter == "__unannotated__":
+        annotated = ANNOTATION_INDEX.annotated_stems()
+        return lambda img: os.path.splitext(img)[0] not in annotated
+    stems = ANNOTATION_INDEX.stems_with_class(class_filter)
+    return lambda img: os.path.splitext(img)[0] in stems
+
+QUERY_CLASS_MODES = ("any", "all", "none")
+QUERY_STATUSES = ("annotated", "unannotated", "null")
+
+QUERY_PAGING_ARGS = ("cursor", "page", "page_size", "collapse")
+_query_cache_lock = threading.Lock()
+_query_cache: "OrderedDict[tuple, List[str]]" = OrderedDict()
+
+def cached_query_catalog_images(args) -> List[str]:
+    """query_catalog_images, memoized so paging through one result doesn't re-run it.
+
+    The key includes every version the result depends on, so any write
+    (here or in another worker) misses the cache instead of serving stale rows.
+    """
+    filters = tuple(sorted((k, tuple(v)) for k, v in args.lists() if k not in QUERY_PAGING_ARGS))
+    projects = tuple(project_version(args[k]) for k in ("project", "not_in_project") if args.get(k))
+    key = (filters, CATALOG_LISTING.snapshot()[0], ANNOTATION_INDEX.stamp(), projects,
+           categories_version() if args.get("category") else None)
+    with _query_cache_lock:
+        hit = _query_cache.get(key)
+        if hit is not None:
+            _query_cache.move_to_end(key)
+            return hit
+    result = query_catalog_images(args)
+    with _query_cache_lock:
+        _query_cache[key] = result
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return result
+
+def query_catalog_images(args) -> List[str]:
+    """Evaluate a /api/query filter against the in-memory indexes, in catalog order.
+
+    Set-valued filters (project, category, class, status, min_boxes > 0) are
+    intersected first, so a selective query only sorts its own matches; the
+    rest run as predicates over the narrowed pool.
+    """
+    class_mode = args.get("class_mode", "any")
+    status = args.get("status", "")
+    if class_mode not in QUERY_CLASS_MODES: abort(400, "Invalid class_mode.")
+    if status and status not in QUERY_STATUSES: abort(400, "Invalid status.")
+    try:
+        min_boxes = int(args["min_boxes"]) if args.get("min_boxes") else None
+        max_boxes = int(args["max_boxes"]) if args.get("max_boxes") else None
+    except ValueError:
+        abort(400, "min_boxes and max_boxes must be integers.")
+
+    # Everything reduces to set algebra over the precomputed indexes; only the
+    # final ordering walks the listing
+    candidates: Optional[Set[str]] = None
+    excluded: Set[str] = set()
+
+    def narrow(names: Set[str]):
+        nonlocal candidates
+        candidates = names if candidates is None else candidates & names
+
+    if args.get("project"):
+        narrow(cached_project_image_set(args["project"]))
+    if args.get("not_in_project"):
+        excluded |= cached_project_image_set(args["not_in_project"])
+    if args.get("category"):
+        narrow(images_in_category(args["category"]))
+
+    classes = [c for c in args.getlist("class") if c]
+    if classes:
+        class_sets = [ANNOTATION_INDEX.stems_with_class(c) for c in classes]
+        if class_mode == "none":
+            excluded |= CATALOG_LISTING.names_for_stems(set().union(*class_sets))
+        else:
+            stems = set.intersection(*class_sets) if class_mode == "all" else set().union(*class_sets)
+            narrow(CATALOG_LISTING.names_for_stems(stems))
+
+    if status == "null":
+        narrow(CATALOG_LISTING.names_for_stems(ANNOTATION_INDEX.stems_with_class("__null__")))
+    elif status == "annotated":
+        narrow(CATALOG_LISTING.names_for_stems({s for s, n in ANNOTATION_INDEX.box_counts().items() if n > 0}))
+    elif status == "unannotated":
+        excluded |= CATALOG_LISTING.names_for_stems(ANNOTATION_INDEX.annotated_stems())
+
+    if min_boxes is not None or max_boxes is not None:
+        lo = min_boxes or 0
+        hi = max_boxes if max_boxes is not None else float("inf")
+        counts = ANNOTATION_INDEX.box_counts()
+        if lo > 0:
+            narrow(CATALOG_LISTING.names_for_stems({s for s, n in counts.items() if lo <= n <= hi}))
+        else:
+            # Images without an XML count as zero boxes, so exclude the ones above the range instead
+            excluded |= CATALOG_LISTING.names_for_stems({s for s, n in counts.items() if n > hi})
+
+    if args.get("q", "").strip():
+        narrow(CATALOG_LISTING.search(args["q"].strip()))
+    if args.get("prefix"):
+        narrow(CATALOG_LISTING.search(args["prefix"], prefix=True))
+
+    if candidates is None:
+        files = CATALOG_LISTING.files()
+        return [n for n in files if n not in excluded] if excluded else files
+    return CATALOG_LISTING.in_order(candidates - excluded)
+
+def cursor_listing(images: List[str], key, keep=None, hidden: Optional[Dict[str, int]] = None,
+                   extra: Optional[Dict[str, Any]] = None):
+    """Cursor-mode response for a listing endpoint; `total` is only counted for the first page."""
+    try: limit = max(1, int(request.args.get("page_size", str(PAGE_SIZE_DEFAULT))))
+    except ValueError: limit = PAGE_SIZE_DEFAULT
+    cursor = request.args.get("cursor", "")
+    page, next_cursor = cursor_page(images, cursor, limit, key, keep)
+    out = {"images": page, "versions": CATALOG_LISTING.versions(page), "next_cursor": next_cursor}
+    if hidden is not None:
+        out["duplicates"] = {n: hidden[n] for n in page if n in hidden}
+    if not cursor:
+        out["total"] = len(images) if keep is None else sum(1 for p in images if keep(p))
+    out.update(extra or {})
+    return jsonify(out)
 
 @app.route("/api/images")
 def api_images():
@@ -417,23 +2719,334 @@ def api_images():
     except: page = 1
     try: page_size = int(request.args.get("page_size", str(PAGE_SIZE_DEFAULT)))
     except: page_size = PAGE_SIZE_DEFAULT
-
     class_filter = request.args.get("class", None)
+    collapse = collapse_requested()
 
-    if class_filter and class_filter != "All Classes":
-        imgs = get_images_by_class(class_filter)
-    else:
-        imgs = list_images_sorted()
+    if "cursor" in request.args:
+        # Filter lazily over the cached project order instead of materialising the class list
+        if class_filter and class_filter != "All Classes" and not collapse:
+            return cursor_listing(list_images_sorted(), listing_order_key(), class_predicate(class_filter))
+        imgs, hidden = filtered_project_images(class_filter), None
+        if collapse:
+            imgs, hidden = collapse_duplicates(imgs)
+        return cursor_listing(imgs, listing_order_key(), hidden=hidden)
+
+    imgs = filtered_project_images(class_filter)
+    if collapse:
+        imgs, hidden = collapse_duplicates(imgs)
 
     total = len(imgs)
     start = max(0, (page-1)*page_size)
     end = min(total, start+page_size)
-    return jsonify({"total": total, "page": page, "page_size": page_size, "images": imgs[start:end]})
+    page_imgs = imgs[start:end]
+    out = {"total": total, "page": page, "page_size": page_size, "images": page_imgs,
+           "versions": CATALOG_LISTING.versions(page_imgs)}
+    if collapse:
+        out["duplicates"] = {n: hidden[n] for n in page_imgs if n in hidden}
+    return jsonify(out)
+
+@app.route("/api/query")
+def api_query():
+    """Combined catalog search; pages by cursor= or page=, like the listing endpoints.
+
+    With project=, `missing` counts the project's members that aren't in the catalog.
+    """
+    imgs, hidden = cached_query_catalog_images(request.args), None
+    if collapse_requested():
+        imgs, hidden = collapse_duplicates(imgs)
+    extra = {"missing": len(project_order(request.args["project"])[1])} if request.args.get("project") else {}
+    if "cursor" in request.args:
+        return cursor_listing(imgs, catalog_order_key(CATALOG_LISTING.snapshot()[1]), hidden=hidden, extra=extra)
+
+    try: page = int(request.args.get("page", "1"))
+    except ValueError: page = 1
+    try: page_size = int(request.args.get("page_size", str(PAGE_SIZE_DEFAULT)))
+    except ValueError: page_size = PAGE_SIZE_DEFAULT
+    start = max(0, (page - 1) * page_size)
+    page_imgs = imgs[start:start + page_size]
+    out = {"total": len(imgs), "page": page, "page_size": page_size, "images": page_imgs,
+           "versions": CATALOG_LISTING.versions(page_imgs), **extra}
+    if hidden is not None:
+        out["duplicates"] = {n: hidden[n] for n in page_imgs if n in hidden}
+    return jsonify(out)
+
+_stats_lock = threading.Lock()
+_stats_cache: Dict[str, tuple] = {}  # project -> (project version, image count, stems, aggregates)
+
+def project_stats(project: str) -> Dict[str, Any]:
+    """Index aggregates over a project's images; annotation edits are applied as deltas."""
+    version = project_version(project)
+    with _stats_lock:
+        cached = _stats_cache.get(project)
+    agg = None
+    if cached and cached[0] == version:
+        _, images, stems, agg = cached
+        agg = ANNOTATION_INDEX.update_stats(agg, stems)
+    if agg is None:
+        names = cached_project_image_set(project)
+        images, stems = len(names), {os.path.splitext(n)[0] for n in names}
+        agg = ANNOTATION_INDEX.stats(stems)
+    with _stats_lock:
+        _stats_cache[project] = (version, images, stems, agg)
+    return dict(agg, images=images)
+
+_catalog_orphans = None  # (listing version, stems annotated without a catalog image, their aggregates)
+
+def catalog_stats() -> Dict[str, Any]:
+    """The index's running totals minus annotations whose image isn't in the catalog (orphans).
+
+    The orphan set is found once per listing version; annotation edits only move the
+    stems they touch, so a request costs O(classes + orphans).
+    """
+    global _catalog_orphans
+    version = CATALOG_LISTING.snapshot()[0]
+    with _stats_lock:
+        cached = _catalog_orphans
+    orphans = None
+    if cached and cached[0] == version:
+        _, orphans, orphan_agg = cached
+        changed = ANNOTATION_INDEX.changed_stems(orphan_agg["generation"])
+        if changed is None:
+            orphans = None
+        elif changed:
+            # stats(stems) skips stems without an entry, so deleted orphans can stay in the set
+            orphans = orphans | {s for s in changed if s not in CATALOG_LISTING.stems()}
+            orphan_agg = ANNOTATION_INDEX.stats(orphans)
+    if orphans is None:
+        catalog = CATALOG_LISTING.stems()
+        orphans = frozenset(s for s in ANNOTATION_INDEX.stems() if s not in catalog)
+        orphan_agg = ANNOTATION_INDEX.stats(orphans)
+    with _stats_lock:
+        _catalog_orphans = (version, orphans, orphan_agg)
+    agg = ANNOTATION_INDEX.stats()
+    return {"generation": agg["generation"],
+            "annotated": agg["annotated"] - orphan_agg["annotated"],
+            "boxed": agg["boxed"] - orphan_agg["boxed"],
+            "box_stats": agg["box_stats"] - orphan_agg["box_stats"],
+            "class_images": agg["class_images"] - orphan_agg["class_images"]}
+
+def histogram(edges, counts) -> Dict[str, list]:
+    return {"edges": list(edges), "counts": counts}
+
+@app.route("/api/stats")
+def api_stats():
+    """Dataset statistics for the whole catalog, or one project with ?project=."""
+    project = request.args.get("project", "")
+    if project:
+        if project_version(project) < 0: abort(404, "Project not found.")
+        agg = project_stats(project)
+    else:
+        agg = dict(catalog_stats(), images=len(CATALOG_LISTING.files()))
+
+    boxes, area, aspect = Counter(), [0] * (len(STATS_AREA_BINS) + 1), [0] * (len(STATS_ASPECT_BINS) + 1)
+    for (label, a, r), n in agg["box_stats"].items():
+        boxes[label] += n
+        area[a] += n
+        aspect[r] += n
+    class_images = agg["class_images"]
+    stats = {
+        "scope": project or "catalog",
+        "images": agg["images"],
+        "annotated": agg["boxed"],
+        "null": class_images.get("__null__", 0),
+        "unannotated": agg["images"] - agg["annotated"],
+        "boxes": sum(boxes.values()),
+        "classes": {c: {"boxes": boxes.get(c, 0), "images": class_images.get(c, 0)}
+                    for c in sorted(set(boxes) | set(class_images)) if c != "__null__"},
+    }
+    if request.args.get("histograms", "").lower() in ("1", "true", "yes"):
+        stats["histograms"] = {"box_size": histogram(STATS_AREA_BINS, area),
+                               "aspect_ratio": histogram(STATS_ASPECT_BINS, aspect)}
+    return jsonify(stats)
+
+DEDUP_SCOPES = ("catalog", "raw")
+DEDUP_MAX_DISTANCE = 8  # multi-index lookups degrade towards all-pairs beyond this
+_dedup_lock = threading.Lock()
+_dedup_cache: Dict[tuple, tuple] = {}  # (scope, distance) -> (versions, clusters)
+_hash_scans: Dict[str, "Job"] = {}
+
+def dedup_targets(scope: str) -> Dict[str, str]:
+    """Key (catalog name, or path relative to the raw folder) -> absolute path, in listing order."""
+    if scope == "raw":
+        return {rel: os.path.join(RAW_IMAGES_DIR, rel) for _, rel in RAW_TREE.files()}
+    return {n: os.path.join(IMAGE_CATALOG_DIR, n) for n in CATALOG_LISTING.files()}
+
+def run_hash_scan(job: Job, scope: str) -> Dict[str, Any]:
+    if scope == "raw":
+        RAW_TREE.refresh()
+    targets = dedup_targets(scope)
+    hashes, computed, failed = image_hashes(list(targets.values()), job)
+    if scope == "catalog":
+        duplicate_clusters(scope, DEDUP_DISTANCE)  # warm the cache collapsed listings read
+    return {"scope": scope, "images": len(targets), "hashed": len(hashes), "computed": computed, "unreadable": failed}
+
+def start_hash_scan(scope: str) -> Job:
+    """Queue a job hashing the scope's new or changed images, unless one is still running."""
+    with _dedup_lock:
+        job = _hash_scans.get(scope)
+        if job is None or job.finished is not None:
+            job = _hash_scans[scope] = JOBS.submit("hash_" + scope, run_hash_scan, scope)
+        return job
+
+def running_hash_scan(scope: str) -> Optional[Job]:
+    scan = _hash_scans.get(scope)
+    return scan if scan and scan.finished is None else None
+
+def duplicate_clusters(scope: str, distance: int, stale_ok: bool = False) -> Optional[Dict[str, Any]]:
+    """Near-duplicate clusters over the scope's stored hashes, each in listing order, largest first.
+
+    Cached until the listing or the stored hashes change. Images not hashed yet are
+    counted in `unhashed` and a scan is queued for them. With `stale_ok`, a running
+    scan's caller gets the last cached result (None if there is none) instead of
+    clustering again; the scan refreshes the cache when it finishes.
+    """
+    if scope == "raw":
+        RAW_TREE.refresh()
+        listing_version = RAW_TREE.version
+    else:
+        listing_version = CATALOG_LISTING.snapshot()[0]
+    versions = (listing_version, get_meta("image_hashes_version"))
+    with _dedup_lock:
+        cached = _dedup_cache.get((scope, distance))
+    if cached and cached[0] == versions:
+        result = cached[1]
+    elif stale_ok and running_hash_scan(scope):
+        return cached[1] if cached else None
+    else:
+        targets = dedup_targets(scope)
+        stored, unhashed = {}, 0
+        conn = get_db()
+        paths = list(targets.values())
+        for chunk in _chunks(paths):
+            stored.update(conn.execute(
+                f"SELECT path, dhash FROM image_hashes WHERE path IN ({','.join('?' * len(chunk))})", chunk))
+        hashes = {}
+        for key, path in targets.items():
+            if path not in stored:
+                unhashed += 1
+            elif stored[path] is not None:
+                hashes[key] = stored[path] & 0xFFFFFFFFFFFFFFFF
+        position = {key: i for i, key in enumerate(targets)}
+        clusters = [sorted(c, key=position.get) for c in hash_clusters(hashes, distance)]
+        clusters.sort(key=lambda c: (-len(c), position[c[0]]))
+        result = {"clusters": clusters, "cluster_of": {k: i for i, c in enumerate(clusters) for k in c},
+                  "hashed": len(hashes), "unhashed": unhashed}
+        with _dedup_lock:
+            _dedup_cache[(scope, distance)] = (versions, result)
+    if result["unhashed"]:
+        start_hash_scan(scope)
+    return result
+
+def collapse_requested() -> bool:
+    return request.args.get("collapse", "").lower() in ("1", "true", "yes")
+
+def collapse_duplicates(images: List[str]):
+    """Keep only the first image of each catalog near-duplicate cluster present in `images`.
+
+    Returns (kept images, {kept image: number of later images hidden behind it}). While a
+    hash scan runs this uses the last clusters computed, or collapses nothing yet.
+    """
+    result = duplicate_clusters("catalog", DEDUP_DISTANCE, stale_ok=True)
+    if result is None:
+        return images, {}
+    cluster_of = result["cluster_of"]
+    kept, hidden, first = [], {}, {}
+    for name in images:
+        cluster = cluster_of.get(name)
+        if cluster is None:
+            kept.append(name)
+        elif cluster in first:
+            hidden[first[cluster]] += 1
+        else:
+            first[cluster] = name
+            hidden[name] = 0
+            kept.append(name)
+    return kept, {n: c for n, c in hidden.items() if c}
+
+@app.route("/api/duplicates")
+def api_duplicates():
+    """Near-duplicate clusters among catalog (or raw) images, largest first."""
+    scope = request.args.get("scope", "catalog")
+    if scope not in DEDUP_SCOPES: abort(400, "Invalid scope.")
+    try:
+        distance = int(request.args.get("distance", str(DEDUP_DISTANCE)))
+    except ValueError:
+        abort(400, "distance must be an integer.")
+    if not 0 <= distance <= DEDUP_MAX_DISTANCE: abort(400, f"distance must be between 0 and {DEDUP_MAX_DISTANCE}.")
+    try: page = int(request.args.get("page", "1"))
+    except ValueError: page = 1
+    try: page_size = int(request.args.get("page_size", str(PAGE_SIZE_DEFAULT)))
+    except ValueError: page_size = PAGE_SIZE_DEFAULT
+
+    result = duplicate_clusters(scope, distance)
+    clusters = result["clusters"]
+    start = max(0, (page - 1) * page_size)
+    scan = running_hash_scan(scope)
+    return jsonify({
+        "scope": scope,
+        "distance": distance,
+        "hashed": result["hashed"],
+        "unhashed": result["unhashed"],
+        "scan_job": scan.id if scan else None,
+        "total": len(clusters),
+        "duplicates": sum(len(c) - 1 for c in clusters),
+        "page": page,
+        "page_size": page_size,
+        "clusters": [{"images": c, "size": len(c)} for c in clusters[start:start + page_size]],
+    })
+
+@app.route("/api/duplicates/scan", methods=["POST"])
+def api_duplicates_scan():
+    scope = (request.get_json(force=True, silent=True) or {}).get("scope", "catalog")
+    if scope not in DEDUP_SCOPES:
+        return jsonify({"error": "Invalid scope"}), 400
+    return job_accepted(start_hash_scan(scope))
+
+@app.route("/api/review/batch")
+def api_review_batch():
+    """The next `count` images after the `after` cursor, with their annotations and sizes."""
+    try: count = max(1, min(REVIEW_BATCH_MAX, int(request.args.get("count", "20"))))
+    except ValueError: count = 20
+    class_filter = request.args.get("class", None)
+    after = request.args.get("after", "")
+
+    collapse = collapse_requested()
+    imgs = filtered_project_images(class_filter)
+    if collapse:
+        imgs, hidden = collapse_duplicates(imgs)
+    start = index_after(imgs, after) if after else 0
+    batch = imgs[start:start + count]
+    dirs = get_active_project_dirs()
+    out = {
+        "total": len(imgs),
+        "missing": len(project_order(dirs["name"])[1]) if dirs else 0,
+        "start": start,
+        "images": batch,
+        "items": bulk_annotations(batch),
+        "versions": CATALOG_LISTING.versions(batch),
+        "next": batch[-1] if start + count < len(imgs) else None,
+    }
+    if collapse:
+        out["duplicates"] = {n: hidden[n] for n in batch if n in hidden}
+    return jsonify(out)
 
 @app.route("/image/<path:fname>")
 def serve_image(fname):
     if not is_safe_filename(fname): abort(400, "Invalid image name.")
-    return send_from_directory(IMAGE_CATALOG_DIR, fname)
+    return send_versioned(IMAGE_CATALOG_DIR, fname, file_version(os.path.join(IMAGE_CATALOG_DIR, fname)))
+
+@app.route("/thumb/<int:size>/<path:fname>")
+def serve_thumb(size, fname):
+    if not is_safe_filename(fname): abort(400, "Invalid image name.")
+    if size not in THUMB_SIZES: abort(400, "Invalid thumbnail size.")
+    try:
+        path = ensure_thumbnail(fname, size)
+    except Exception as e:
+        app.logger.error(f"Thumbnail generation failed for {fname}: {e}")
+        return send_versioned(IMAGE_CATALOG_DIR, fname, file_version(os.path.join(IMAGE_CATALOG_DIR, fname)))
+    if path is None: abort(404, "Image not found.")
+    # Thumbnails carry their source's mtime, so their version is the source image's
+    return send_versioned(os.path.dirname(path), os.path.basename(path), file_version(path))
 
 @app.route("/api/delete", methods=["POST"])
 def api_delete():
@@ -446,20 +3059,9 @@ def api_delete():
     if not dirs:
         errors.append({"error": "No active project"})
         return jsonify({"deleted_count": 0, "errors": errors})
-    images_file = dirs["project_images"]
 
     try:
-        with open(images_file, "r") as f:
-            all_images = [line.strip() for line in f if line.strip()]
-
-        updated_images = [img for img in all_images if img not in files_to_delete]
-
-        with open(images_file, "w") as f:
-            for img in updated_images:
-                f.write(img + "\n")
-
-        deleted_count = len(all_images) - len(updated_images)
-
+        deleted_count = remove_project_images(dirs["name"], list(files_to_delete))
     except Exception as e:
         errors.append({"error": str(e)})
 
@@ -470,127 +3072,25 @@ def api_get_annotation():
     img = request.args.get("image","")
     if not is_safe_filename(img): abort(400, "Invalid image name.")
 
-    axml = catalog_voc_xml_path(img)
+    img_path = os.path.join(IMAGE_CATALOG_DIR, img)
 
-    boxes = []
-    w, h = -1, -1
-    if os.path.exists(axml):
+    def build():
         try:
-            root = ET.parse(axml).getroot()
-            size_el = root.find("size")
-            if size_el:
-                w = int(size_el.findtext("width", "-1"))
-                h = int(size_el.findtext("height", "-1"))
-
-            for obj in root.findall("object"):
-                bnd = obj.find("bndbox")
-                if bnd is None: continue
-                boxes.append({
-                    "label": obj.findtext("name","object"),
-                    "x1": int(bnd.findtext("xmin","0")),
-                    "y1": int(bnd.findtext("ymin","0")),
-                    "x2": int(bnd.findtext("xmax","0")),
-                    "y2": int(bnd.findtext("ymax","0")),
-                })
-        except Exception as e:
-            resp = jsonify({"boxes": boxes, "error": str(e), "w": w, "h": h})
-            resp.headers["Cache-Control"] = "no-store, max-age=0"
-            return resp, 200
+            return annotation_item(ANNOTATION_STORE.entry(img), img_path)
+        except (ET.ParseError, ValueError) as e:
+            return {"boxes": [], "error": str(e), "w": -1, "h": -1}
 
-    if w < 0:
-        w, h = img_size(os.path.join(IMAGE_CATALOG_DIR, img))
-
-    resp = jsonify({"boxes": boxes, "w": w, "h": h})
-    resp.headers["Cache-Control"] = "no-store, max-age=0"
-    return resp
+    return conditional_json(annotation_etag(ANNOTATION_STORE.stamps_of([img])[img], img_path), build)
 
 @app.route("/api/catalog/annotations_bulk", methods=["POST"])
 def api_catalog_annotations_bulk():
-    data = request.get_json(force=True, silent=True) or {}
-    images = data.get("images", [])
-    out = {}
-
-    for name in images:
-        if not is_safe_filename(name):
-            continue
-
-        axml = catalog_voc_xml_path(name)
-
-        boxes = []
-        w,h = -1,-1
-        if os.path.exists(axml):
-            try:
-                root = ET.parse(axml).getroot()
-                size_el = root.find("size")
-                if size_el:
-                    w = int(size_el.findtext("width", "-1"))
-                    h = int(size_el.findtext("height", "-1"))
-
-                for obj in root.findall("object"):
-                    bnd = obj.find("bndbox")
-                    if bnd is None: continue
-                    boxes.append({
-                        "label": obj.findtext("name", "object"),
-                        "x1": int(bnd.findtext("xmin", "0")),
-                        "y1": int(bnd.findtext("ymin", "0")),
-                        "x2": int(bnd.findtext("xmax", "0")),
-                        "y2": int(bnd.findtext("ymax", "0")),
-                    })
-            except Exception:
-                boxes = []
-
-        if w < 0:
-            w, h = img_size(os.path.join(IMAGE_CATALOG_DIR, name))
-
-        out[name] = {"boxes": boxes, "w": w, "h": h}
-
-    resp = jsonify({"items": out})
-    resp.headers["Cache-control"] = "no-store, max-age=0"
-    return resp
+    images = (request.get_json(force=True, silent=True) or {}).get("images", [])
+    return conditional_json(bulk_annotations_etag(images), lambda: {"items": bulk_annotations(images)})
 
 @app.route("/api/annotations_bulk", methods=["POST"])
 def api_annotations_bulk():
-    data = request.get_json(force=True, silent=True) or {}
-    images = data.get("images", [])
-    out = {}
-
-    for name in images:
-        if not is_safe_filename(name):
-            continue
-
-        axml = catalog_voc_xml_path(name)
-
-        boxes = []
-        w,h = -1,-1
-        if os.path.exists(axml):
-            try:
-                root = ET.parse(axml).getroot()
-                size_el = root.find("size")
-                if size_el:
-                    w = int(size_el.findtext("width", "-1"))
-                    h = int(size_el.findtext("height", "-1"))
-
-                for obj in root.findall("object"):
-                    bnd = obj.find("bndbox")
-                    if bnd is None: continue
-                    boxes.append({
-                        "label": obj.findtext("name", "object"),
-                        "x1": int(bnd.findtext("xmin", "0")),
-                        "y1": int(bnd.findtext("ymin", "0")),
-                        "x2": int(bnd.findtext("xmax", "0")),
-                        "y2": int(bnd.findtext("ymax", "0")),
-                    })
-            except Exception:
-                boxes = []
-
-        if w < 0:
-            w, h = img_size(os.path.join(IMAGE_CATALOG_DIR, name))
-
-        out[name] = {"boxes": boxes, "w": w, "h": h}
-
-    resp = jsonify({"items": out})
-    resp.headers["Cache-control"] = "no-store, max-age=0"
-    return resp
+    images = (request.get_json(force=True, silent=True) or {}).get("images", [])
+    return conditional_json(bulk_annotations_etag(images), lambda: {"items": bulk_annotations(images)})
 
 @app.route("/api/annotate", methods=["POST"])
 def api_post_annotate():
@@ -600,269 +3100,732 @@ def api_post_annotate():
     path = os.path.join(IMAGE_CATALOG_DIR, img)
     if not os.path.exists(path): abort(404, "Image not found.")
     w,h = img_size(path)
-    with open(catalog_voc_xml_path(img), "wb") as f:
-        f.write(boxes_to_voc_xml(img, w, h, boxes))
+    with file_lock(catalog_voc_xml_path(img)):
+        ANNOTATION_STORE.write(img, voc_entry(img, w, h, boxes))
+        ANNOTATION_INDEX.refresh(img)
     return jsonify({"ok": True})
 
 @app.route("/api/classes", methods=["GET", "POST"])
 def api_classes():
-    classes_file = os.path.join(PROJECTS_ROOT_DIR, "classes.json")
     if request.method == "GET":
-        if not os.path.exists(classes_file):
+        classes = get_classes()
+        if classes is None and not startup_ready():
+            # Don't persist a class list from a half-reconciled index
+            classes = sorted(ANNOTATION_INDEX.classes() - {"__null__"})
+        elif classes is None:
             update_classes_from_annotations()
-
-        if os.path.exists(classes_file):
-            try:
-                with open(classes_file, "r") as f:
-                    resp = jsonify({"classes": json.load(f)})
-                resp.headers["Cache-Control"] = "no-store, max-age=0"
-                return resp
-            except Exception:
-                pass
-        resp = jsonify({"classes": []})
+            classes = get_classes() or []
+        resp = jsonify({"classes": classes})
         resp.headers["Cache-Control"] = "no-store, max-age=0"
         return resp
     else:
         data = request.get_json(force=True, silent=True) or {}
         classes = data.get("classes", [])
-        with open(classes_file, "w") as f: json.dump(classes, f, indent=2)
+        set_classes(classes)
         return jsonify({"ok": True})
 
 def update_classes_from_annotations():
-    """Scan all XML files and update classes.json"""
-    classes = set()
-
-    for ann_file in glob.glob(os.path.join(ANNOTATION_CATALOG_DIR, "*.xml")):
-        try:
-            tree = ET.parse(ann_file)
-            for obj in tree.findall("object"):
-                class_name = obj.findtext("name")
-                if class_name and class_name != "__null__":
-                    classes.add(class_name)
-        except ET.ParseError:
-            continue
+    """Replace the stored class list with the classes found in the annotation index"""
+    classes = ANNOTATION_INDEX.classes()
+    classes.discard("__null__")
+    set_classes(sorted(classes))
 
-    classes_file = os.path.join(PROJECTS_ROOT_DIR, "classes.json")
-    all_classes = sorted(list(classes))
-
-    with open(classes_file, "w") as f:
-        json.dump(all_classes, f, indent=2)
-
-@app.route("/api/import_voc", methods=["POST"])
-def api_import_voc():
+def stage_zip_upload():
+    """Validate the uploaded ZIP and save it for a background job. Returns (path, error response)."""
     if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
+        return None, (jsonify({"error": "No file part"}), 400)
     file = request.files['file']
     if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+        return None, (jsonify({"error": "No selected file"}), 400)
     if not file.filename.lower().endswith('.zip'):
-        return jsonify({"error": "Invalid file type, must be a .zip file"}), 400
+        return None, (jsonify({"error": "Invalid file type, must be a .zip file"}), 400)
+
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    path = os.path.join(UPLOADS_DIR, f"{uuid.uuid4().hex}.zip")
+    file.save(path)
+    if not zipfile.is_zipfile(path):
+        os.remove(path)
+        return None, (jsonify({"error": "Invalid or corrupted zip file."}), 400)
+    return path, None
+
+_import_local = threading.local()
+
+def _import_zip_member(zip_path: str, member: zipfile.ZipInfo, with_annotations: bool):
+    """Extract and validate one ZIP member. Runs on the import pool.
+
+    Returns ("image", name, (w, h, size, mtime)), ("xml", name, entry), None for
+    members that aren't imported, or raises ValueError with the failure reason.
+    """
+    # One ZipFile per worker thread so members are read and inflated in parallel
+    zf = getattr(_import_local, "zf", None)
+    if zf is None or zf.filename != zip_path:
+        zf = zipfile.ZipFile(zip_path, "r")
+        _import_local.zf = zf
+
+    base_filename = os.path.basename(member.filename)
+    if not base_filename:
+        return None
+    lower = base_filename.lower()
+
+    if any(lower.endswith(ext) for ext in ALLOWED_EXTS):
+        if not is_safe_filename(base_filename):
+            raise ValueError("unsafe name")
+        target_path = os.path.join(IMAGE_CATALOG_DIR, base_filename)
+        tmp_path = os.path.join(IMAGE_CATALOG_DIR, f".{base_filename}.{threading.get_ident()}.part")
+        try:
+            with zf.open(member) as src, open(tmp_path, "wb") as f:
+                shutil.copyfileobj(src, f, 1024 * 1024)
+            try:
+                with Image.open(tmp_path) as im:
+                    w, h = im.size
+                    # verify() only checks structure; decoding catches truncated data.
+                    # draft() lets JPEGs decode at reduced scale, which still reads every scan.
+                    im.draft("RGB", (max(1, w // 8), max(1, h // 8)))
+                    im.load()
+            except Exception:
+                raise ValueError("not a valid image")
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        st = os.stat(target_path)
+        return "image", base_filename, (w, h, st.st_size, st.st_mtime_ns)
+
+    if with_annotations and lower.endswith(".xml"):
+        data = zf.read(member)
+        try:
+            entry = voc_entry_from_root(ET.fromstring(data))
+        except (ET.ParseError, ValueError) as e:
+            raise ValueError(f"invalid annotation: {e}")
+        with file_lock(catalog_voc_xml_path(base_filename)):
+            ANNOTATION_STORE.write(base_filename, entry, xml=data)
+        return "xml", base_filename, entry
 
-    try:
-        imported_images = []
-        failed_files = []
-        dirs = get_active_project_dirs()
-        if not dirs:
-            return jsonify({"error": "No active project"}), 400
-
-        with zipfile.ZipFile(file, 'r') as z:
-            for item in z.infolist():
-                try:
-                    if item.is_dir() or '__MACOSX' in item.filename:
-                        continue
+    return None
 
-                    base_filename = os.path.basename(item.filename)
-                    if not base_filename: continue
-
-                    if any(base_filename.lower().endswith(ext) for ext in ALLOWED_EXTS):
-                        if not is_safe_filename(base_filename):
-                            failed_files.append(f"{item.filename} (unsafe name)")
-                            continue
-                        target_path = os.path.join(IMAGE_CATALOG_DIR, base_filename)
-                        with z.open(item) as zf, open(target_path, 'wb') as f:
-                            shutil.copyfileobj(zf, f)
-                        imported_images.append(base_filename)
-                    elif base_filename.lower().endswith('.xml'):
-                        target_path = os.path.join(ANNOTATION_CATALOG_DIR, base_filename)
-                        with z.open(item) as zf, open(target_path, 'wb') as f:
-                            shutil.copyfileobj(zf, f)
-                except Exception as e:
-                    app.logger.error(f"Error importing {item.filename}: {str(e)}")
-                    failed_files.append(item.filename)
-
-        # Add imported images to the current project
+def run_zip_import(job: Job, zip_path: str, project: str, with_annotations: bool) -> Dict[str, Any]:
+    image_info: Dict[str, tuple] = {}
+    imported_classes: Set[str] = set()
+    failed_files = []
+    pool = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            members = [i for i in z.infolist() if not i.is_dir() and '__MACOSX' not in i.filename]
+        job.set_total(len(members))
+        futures = {pool.submit(_import_zip_member, zip_path, m, with_annotations): m for m in members}
+        for fut in as_completed(futures):
+            member = futures[fut]
+            error = None
+            try:
+                result = fut.result()
+                if result:
+                    kind, name, info = result
+                    if kind == "image":
+                        image_info[name] = info
+                    else:
+                        ANNOTATION_INDEX.put(name, info)
+                        imported_classes |= info["classes"]
+            except ValueError as e:
+                error = f"{member.filename} ({e})"
+            except Exception as e:
+                app.logger.error(f"Error importing {member.filename}: {str(e)}")
+                error = member.filename
+            if error:
+                failed_files.append(error)
+            job.advance(nbytes=member.file_size, error=error)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        # Register whatever landed before a failure or cancellation
+        imported_images = list(image_info)
         if imported_images:
-            images_file = dirs["project_images"]
-            with open(images_file, "a") as f:
-                for img in imported_images:
-                    f.write(img + "\n")
-
-        update_classes_from_annotations()
-        scan_and_categorize_images()
+            CATALOG_LISTING.add(imported_images)
+            prewarm_thumbnails(imported_images)
+            add_project_images(project, imported_images)
+            categorize_images(imported_images, sizes={n: info[2] for n, info in image_info.items()})
+            record_image_dims_bulk([(os.path.join(IMAGE_CATALOG_DIR, n), w, h, mtime_ns, size)
+                                    for n, (w, h, size, mtime_ns) in image_info.items()])
+        if imported_classes:
+            add_classes(sorted(imported_classes))
+        os.remove(zip_path)
+
+    message = f"Imported {len(imported_images)} images."
+    if failed_files:
+        message += f" Failed to import {len(failed_files)} files."
+    return {"message": message, "imported": len(imported_images), "failed_files": failed_files}
 
-        message = f"Imported {len(imported_images)} images."
-        if failed_files:
-            message += f" Failed to import {len(failed_files)} files."
-
-        scan_and_categorize_images()
-        return jsonify({"ok": True, "message": message, "failed_files": failed_files})
-    except zipfile.BadZipFile:
-        return jsonify({"error": "Invalid or corrupted zip file."}), 400
-    except Exception as e:
-        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+@app.route("/api/import_voc", methods=["POST"])
+def api_import_voc():
+    dirs = get_active_project_dirs()
+    if not dirs:
+        return jsonify({"error": "No active project"}), 400
+    zip_path, error = stage_zip_upload()
+    if error:
+        return error
+    return job_accepted(JOBS.submit("import_voc", run_zip_import, zip_path, dirs["name"], True))
 
 @app.route("/api/import_images", methods=["POST"])
 def api_import_images():
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
-    if not file.filename.lower().endswith('.zip'):
-        return jsonify({"error": "Invalid file type, must be a .zip file"}), 400
-
-    try:
-        imported_images = []
-        failed_files = []
-        dirs = get_active_project_dirs()
-        if not dirs:
-            return jsonify({"error": "No active project"}), 400
-        with zipfile.ZipFile(file, 'r') as z:
-            for item in z.infolist():
-                try:
-                    if item.is_dir() or '__MACOSX' in item.filename:
-                        continue
-                    base_filename = os.path.basename(item.filename)
-                    if not base_filename: continue
-                    if any(base_filename.lower().endswith(ext) for ext in ALLOWED_EXTS):
-                        if not is_safe_filename(base_filename):
-                            failed_files.append(f"{item.filename} (unsafe name)")
-                            continue
-                        target_path = os.path.join(IMAGE_CATALOG_DIR, base_filename)
-                        with z.open(item) as zf, open(target_path, 'wb') as f:
-                            shutil.copyfileobj(zf, f)
-                        imported_images.append(base_filename)
-                except Exception as e:
-                    app.logger.error(f"Error importing {item.filename}: {str(e)}")
-                    failed_files.append(item.filename)
-
-        if imported_images:
-            images_file = dirs["project_images"]
-            with open(images_file, "a") as f:
-                for img in imported_images:
-                    f.write(img + "\n")
-
-        message = f"Imported {len(imported_images)} images."
-        if failed_files:
-            message += f" Failed to import {len(failed_files)} files."
-
-        return jsonify({"ok": True, "message": message, "failed_files": failed_files})
-    except zipfile.BadZipFile:
-        return jsonify({"error": "Invalid or corrupted zip file."}), 400
-    except Exception as e:
-        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
-
-@app.route("/api/export_options", methods=["GET"])
-def api_export_options():
-    classes_file = os.path.join(PROJECTS_ROOT_DIR, "classes.json")
-    if os.path.exists(classes_file):
-        try:
-            with open(classes_file) as f:
-                classes = json.load(f)
-            return jsonify({"classes": classes})
-        except Exception:
-            pass
-    return jsonify({"classes": []})
-
-@app.route("/api/export_voc", methods=["POST"])
-def api_export_voc():
-    data = request.get_json(force=True, silent=True) or {}
-    export_classes = data.get("classes", [])
-    remap = data.get("remap", [])
-    null_handling = data.get("null_handling", "unclassified")
-
-    remap_dict = {}
-    for r in remap:
-        for f in r.get("from", []):
-            remap_dict[f] = r.get("to")
-
     dirs = get_active_project_dirs()
     if not dirs:
         return jsonify({"error": "No active project"}), 400
-    exports_dir = dirs["exports"]
+    zip_path, error = stage_zip_upload()
+    if error:
+        return error
+    return job_accepted(JOBS.submit("import_images", run_zip_import, zip_path, dirs["name"], False))
 
-    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    out_root = os.path.join(exports_dir, f"VOC_{ts}")
-    pj = os.path.join(out_root, "JPEGImages")
-    pa = os.path.join(out_root, "Annotations")
-    pm = os.path.join(out_root, "ImageSets", "Main")
-    os.makedirs(pj, exist_ok=True); os.makedirs(pa, exist_ok=True); os.makedirs(pm, exist_ok=True)
+@app.route("/api/export_options", methods=["GET"])
+def api_export_options():
+    return jsonify({"classes": get_classes() or []})
 
-    imgs = list_images_sorted()
-    kept = []
+def prepare_voc_export_item(name: str, export_classes: Set[str], remap_dict: Dict[str, str], null_handling: str):
+    """Filter/remap one image's XML for export.
 
-    for name in imgs:
-        src_img = os.path.join(IMAGE_CATALOG_DIR, name)
+    Returns (name, xml_bytes) where xml_bytes is None for null images exported
+    without an annotation, or None if the image is left out of the export.
+    """
+    if not os.path.exists(os.path.join(IMAGE_CATALOG_DIR, name)):
+        return None
+    data = ANNOTATION_STORE.xml(name)
+    if data is None:
+        return None
 
-        axml_src = catalog_voc_xml_path(name)
+    try:
+        root = ET.fromstring(data)
+        objects = root.findall("object")
 
-        if not os.path.exists(axml_src):
-            continue
+        if any(o.findtext("name") == "__null__" for o in objects):
+            if null_handling == "exclude":
+                return None
+            # For "unclassified", we just don't add an annotation
+            return name, None
 
-        try:
-            tree = ET.parse(axml_src)
-            root = tree.getroot()
-            objects = root.findall("object")
+        filtered_objects = [obj for obj in objects if obj.findtext("name") in export_classes]
+        if not filtered_objects:
+            return None
 
-            is_null = any(o.findtext("name") == "__null__" for o in objects)
+        for obj in objects:
+            if obj not in filtered_objects:
+                root.remove(obj)
+        for obj in filtered_objects:
+            original_class = obj.findtext("name")
+            if original_class in remap_dict:
+                obj.find("name").text = remap_dict[original_class]
 
-            if is_null:
-                if null_handling == "exclude":
-                    continue
-                # For "unclassified", we just don't add an annotation
-                shutil.copy2(src_img, os.path.join(pj, name))
-                kept.append(name)
+        return name, ET.tostring(root, encoding="utf-8")
+    except Exception as e:
+        app.logger.error(f"Error processing {name} for export: {e}")
+        return None
+
+def iter_voc_export_items(imgs: List[str], export_classes, remap_dict, null_handling, batch_size: int = 256):
+    """Run prepare_voc_export_item on a worker pool, yielding every result (None for skipped images) in catalog order.
+
+    Work is submitted in bounded batches so a huge export never holds more than a
+    couple of batches of serialized XML in memory.
+    """
+    with ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export") as pool:
+        pending = None
+        for i in range(0, len(imgs) + batch_size, batch_size):
+            batch = imgs[i:i + batch_size]
+            submitted = [pool.submit(prepare_voc_export_item, n, export_classes, remap_dict, null_handling) for n in batch]
+            if pending:
+                for fut in pending:
+                    yield fut.result()
+            pending = submitted
+
+class ExportManifest:
+    """sha1 of every member of one export, saved in the exports table.
+
+    Given the members of the previous export with the same options (`base`), changed()
+    tells which members differ, so an incremental export writes only those. The saved
+    manifest always lists the full dataset, so the next increment builds on it. Image
+    hashes are cached in file_hashes while the file's (mtime_ns, size) is unchanged; a
+    full export hashes images as it copies them, so it reads each file only once.
+    """
+
+    def __init__(self, project: str, options_key: str, base_name: Optional[str] = None,
+                 base: Optional[Dict[str, str]] = None):
+        self.project = project
+        self.options_key = options_key
+        self.base_name = base_name
+        self.base = base
+        self.members: Dict[str, str] = {}
+        self.written = 0
+        self._new_hashes: List[tuple] = []
+
+    @classmethod
+    def latest(cls, project: str, options_key: str, exports_dir: str) -> "ExportManifest":
+        """A manifest based on the newest export of `project` with the same options whose ZIP
+        is still on disk (so the delta chain can always be rebuilt), or a full one."""
+        rows = get_db().execute("SELECT zip_name, members FROM exports WHERE project = ? AND options_key = ? "
+                                "ORDER BY created DESC", (project, options_key))
+        for zip_name, members in rows:
+            if os.path.exists(os.path.join(exports_dir, zip_name)):
+                return cls(project, options_key, zip_name, json.loads(members))
+        return cls(project, options_key)
+
+    def cached_sha1(self, path: str, st: os.stat_result) -> Optional[str]:
+        row = get_db().execute("SELECT mtime_ns, size, sha1 FROM file_hashes WHERE path = ?", (path,)).fetchone()
+        return row[2] if row and row[:2] == (st.st_mtime_ns, st.st_size) else None
+
+    def remember_sha1(self, path: str, st: os.stat_result, digest: str):
+        self._new_hashes.append((path, st.st_mtime_ns, st.st_size, digest))
+        if len(self._new_hashes) >= 1000:
+            self._flush_hashes()
+
+    def file_sha1(self, path: str, st: os.stat_result) -> str:
+        digest = self.cached_sha1(path, st)
+        if digest is None:
+            h = hashlib.sha1()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self.remember_sha1(path, st, digest)
+        return digest
+
+    def _flush_hashes(self):
+        if self._new_hashes:
+            with get_db() as conn:
+                conn.executemany("INSERT OR REPLACE INTO file_hashes (path, mtime_ns, size, sha1) VALUES (?, ?, ?, ?)",
+                                 self._new_hashes)
+            self._new_hashes = []
+
+    def changed(self, arcname: str, digest: str) -> bool:
+        self.members[arcname] = digest
+        if self.base is not None and self.base.get(arcname) == digest:
+            return False
+        self.written += 1
+        return True
+
+    def removed(self) -> List[str]:
+        return sorted(set(self.base or ()) - set(self.members))
+
+    def save(self, zip_name: str):
+        self._flush_hashes()
+        with get_db() as conn:
+            conn.execute("INSERT OR REPLACE INTO exports (project, zip_name, options_key, base, created, members) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (self.project, zip_name, self.options_key, self.base_name,
+                                                       time.time(), json.dumps(self.members, separators=(",", ":"))))
+
+def zip_put(zf: zipfile.ZipFile, arcname: str, path: Optional[str] = None, data: Optional[bytes] = None,
+            manifest: Optional[ExportManifest] = None) -> int:
+    """Add a file (stored) or bytes (deflated) unless the manifest's base export already has them.
+    Returns the bytes added."""
+    if path is None:
+        if manifest is not None and not manifest.changed(arcname, hashlib.sha1(data).hexdigest()):
+            return 0
+        zf.writestr(arcname, data)
+        return len(data)
+    if manifest is None:
+        # JPEG/PNG are already compressed; deflating them again only burns CPU
+        zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+        return os.path.getsize(path)
+    st = os.stat(path)
+    digest = manifest.cached_sha1(path, st)
+    if digest is None and manifest.base is None:
+        # Nothing to compare against: hash while copying instead of reading the file twice
+        info = zipfile.ZipInfo.from_file(path, arcname)
+        info.compress_type = zipfile.ZIP_STORED
+        h = hashlib.sha1()
+        with open(path, "rb") as src, zf.open(info, "w") as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                h.update(chunk)
+                dst.write(chunk)
+        manifest.remember_sha1(path, st, h.hexdigest())
+        manifest.changed(arcname, h.hexdigest())
+        return st.st_size
+    if not manifest.changed(arcname, digest or manifest.file_sha1(path, st)):
+        return 0
+    zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+    return st.st_size
+
+def write_voc_zip(zf: zipfile.ZipFile, items, manifest: Optional[ExportManifest] = None):
+    """Stream images and rewritten XML into an open ZipFile.
+
+    Yields the number of bytes added for every input item (None for skipped ones)
+    so callers can report progress; train.txt is written once the items run out.
+    """
+    kept = []
+    for item in items:
+        if item is None:
+            yield None
+            continue
+        name, xml_bytes = item
+        nbytes = zip_put(zf, f"JPEGImages/{name}", path=os.path.join(IMAGE_CATALOG_DIR, name), manifest=manifest)
+        if xml_bytes is not None:
+            nbytes += zip_put(zf, f"Annotations/{os.path.splitext(name)[0]}.xml", data=xml_bytes, manifest=manifest)
+        kept.append(name)
+        yield nbytes
+    zip_put(zf, "ImageSets/Main/train.txt", data="".join(os.path.splitext(k)[0] + "\n" for k in kept).encode(),
+            manifest=manifest)
+
+def yolo_class_names(export_classes: Set[str], remap_dict: Dict[str, str]) -> List[str]:
+    """Exported class names after remapping, in class-list order; a name's index is its YOLO class id."""
+    listed = get_classes() or []
+    order = [c for c in listed if c in export_classes] + sorted(export_classes - set(listed))
+    return list(dict.fromkeys(remap_dict.get(c) or c for c in order if c != "__null__"))
+
+def yolo_label_batch(names: List[str], export_classes: Set[str], remap_dict: Dict[str, str],
+                     class_ids: Dict[str, int], null_handling: str) -> List[Optional[str]]:
+    """YOLO label file text for each of `names`, or None for images left out of the export.
+
+    Boxes come from the annotation index; those of the whole batch are gathered into
+    flat columns and normalized in one pass rather than image by image.
+    """
+    out: List[Optional[str]] = [None] * len(names)
+    owners, ids, x1, y1, x2, y2 = [], [], [], [], [], []
+    dims, unsized = {}, []
+    for i, (name, entry) in enumerate(zip(names, ANNOTATION_INDEX.get_many(names))):
+        if entry is None or not os.path.exists(os.path.join(IMAGE_CATALOG_DIR, name)):
+            continue
+        if "__null__" in entry["classes"]:
+            if null_handling != "exclude":
+                out[i] = ""  # background image: empty label file
+            continue
+        boxes = [b for b in entry["boxes"] if b["label"] in export_classes]
+        if not boxes:
+            continue
+        out[i] = ""
+        for b in boxes:
+            owners.append(i)
+            ids.append(class_ids[remap_dict.get(b["label"]) or b["label"]])
+            x1.append(b["x1"]); y1.append(b["y1"]); x2.append(b["x2"]); y2.append(b["y2"])
+        if entry["w"] > 0 and entry["h"] > 0:
+            dims[i] = (entry["w"], entry["h"])
+        else:
+            unsized.append(i)
+    if unsized:
+        sizes = img_sizes([os.path.join(IMAGE_CATALOG_DIR, names[i]) for i in unsized])
+        for i in unsized:
+            dims[i] = sizes[os.path.join(IMAGE_CATALOG_DIR, names[i])]
+
+    ws = [dims[o][0] for o in owners]
+    hs = [dims[o][1] for o in owners]
+    left = [max(0.0, min(a, b) / w) for a, b, w in zip(x1, x2, ws)]
+    right = [min(1.0, max(a, b) / w) for a, b, w in zip(x1, x2, ws)]
+    top = [max(0.0, min(a, b) / h) for a, b, h in zip(y1, y2, hs)]
+    bottom = [min(1.0, max(a, b) / h) for a, b, h in zip(y1, y2, hs)]
+    lines: Dict[int, List[str]] = {}
+    for o, c, l, t, r, b in zip(owners, ids, left, top, right, bottom):
+        if r > l and b > t:  # boxes clipped away entirely are dropped
+            lines.setdefault(o, []).append(f"{c} {(l + r) / 2:.6f} {(t + b) / 2:.6f} {r - l:.6f} {b - t:.6f}\n")
+    for o, rows in lines.items():
+        out[o] = "".join(rows)
+    return out
+
+def iter_yolo_export_items(imgs: List[str], export_classes, remap_dict, class_names, null_handling, batch_size: int = 1024):
+    """Yield (name, label text) for every exported image, None for skipped ones, in catalog order."""
+    class_ids = {c: i for i, c in enumerate(class_names)}
+    for i in range(0, len(imgs), batch_size):
+        batch = imgs[i:i + batch_size]
+        for name, labels in zip(batch, yolo_label_batch(batch, export_classes, remap_dict, class_ids, null_handling)):
+            yield None if labels is None else (name, labels)
+
+def write_yolo_zip(zf: zipfile.ZipFile, items, class_names: List[str], manifest: Optional[ExportManifest] = None):
+    """Stream images, label files and data.yaml (Ultralytics layout) into an open ZipFile.
+
+    Yields the number of bytes added for every input item, like write_voc_zip.
+    """
+    # JSON strings are valid YAML scalars, so any class name survives quoting
+    data_yaml = ("path: .\ntrain: images/train\nval: images/train\n"
+                 f"nc: {len(class_names)}\nnames:\n" + "".join(f"  {i}: {json.dumps(c)}\n" for i, c in enumerate(class_names)))
+    zip_put(zf, "data.yaml", data=data_yaml.encode(), manifest=manifest)
+    for item in items:
+        if item is None:
+            yield None
+            continue
+        name, labels = item
+        nbytes = zip_put(zf, f"images/train/{name}", path=os.path.join(IMAGE_CATALOG_DIR, name), manifest=manifest)
+        nbytes += zip_put(zf, f"labels/train/{os.path.splitext(name)[0]}.txt", data=labels.encode(), manifest=manifest)
+        yield nbytes
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Unseekable sink that lets zipfile write into a chunked HTTP response."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def run_zip_export(job: Job, write, total: int, zip_path: str, manifest: ExportManifest) -> Dict[str, Any]:
+    """Job body: write(zf, manifest) yields per-item byte counts (None for skipped items) while filling the ZIP.
+
+    An incremental export (a manifest with a base) also lists the members dropped since
+    the base in removed.txt.
+    """
+    job.set_total(total)
+    tmp_path = zip_path + ".part"
+    count = 0
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for nbytes in write(zf, manifest):
+                if nbytes is not None:
+                    count += 1
+                job.advance(nbytes=nbytes or 0)
+            removed = manifest.removed()
+            if removed:
+                zf.writestr("removed.txt", "".join(r + "\n" for r in removed))
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    zip_name = os.path.basename(zip_path)
+    manifest.save(zip_name)
+    prune_exports(manifest.project, os.path.dirname(zip_path))
+    return {"count": count, "zip_name": zip_name, "zip_url": f"/exports/{zip_name}",
+            "base": manifest.base_name, "changed": manifest.written, "removed": len(removed)}
+
+EXPORT_STAGING_PREFIXES = ("VOC_", "YOLO_")
+
+def prune_exports(project: str, exports_dir: str):
+    """Retention: keep the newest EXPORT_KEEP ZIPs plus every earlier ZIP a kept delta builds
+    on (back to its full export), and drop our staging folders and stale partial ZIPs.
+
+    Other files and folders in exports/ are left alone. Manifest rows go with their ZIP.
+    """
+    cutoff = time.time() - 3600
+    zips = []
+    with os.scandir(exports_dir) as it:
+        for e in it:
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    if e.name.startswith(EXPORT_STAGING_PREFIXES):
+                        shutil.rmtree(e.path, ignore_errors=True)  # unzipped trees from older versions
+                elif e.name.startswith(EXPORT_STAGING_PREFIXES) and e.name.endswith(".zip"):
+                    zips.append((e.stat().st_mtime, e.name))
+                elif e.name.startswith(EXPORT_STAGING_PREFIXES) and e.name.endswith(".part") and e.stat().st_mtime < cutoff:
+                    os.remove(e.path)
+            except OSError:
                 continue
+    if EXPORT_KEEP <= 0:
+        return
+    zips.sort(reverse=True)
+    bases = dict(get_db().execute("SELECT zip_name, base FROM exports WHERE project = ?", (project,)).fetchall())
+    kept = set()
+    for _, name in zips[:EXPORT_KEEP]:
+        while name and name not in kept:
+            kept.add(name)
+            name = bases.get(name)
+    removed = [name for _, name in zips if name not in kept]
+    for name in removed:
+        try:
+            os.remove(os.path.join(exports_dir, name))
+        except OSError:
+            pass
+    with get_db() as conn:
+        conn.executemany("DELETE FROM exports WHERE project = ? AND zip_name = ?", [(project, n) for n in removed])
 
-            filtered_objects = []
-            for obj in objects:
-                original_class = obj.findtext("name")
-                if original_class in export_classes:
-                    filtered_objects.append(obj)
+def parse_remap(remap: List[Dict[str, Any]]) -> Dict[str, str]:
+    """[{"from": ["cat", "kitten"], "to": "feline"}, ...] -> {"cat": "feline", "kitten": "feline"}"""
+    remap_dict = {}
+    for r in remap:
+        for f in r.get("from", []):
+            remap_dict[f] = r.get("to")
+    return remap_dict
 
-            if not filtered_objects:
-                continue
+def parse_export_options(data: Dict[str, Any]):
+    export_classes = data.get("classes", [])
+    null_handling = data.get("null_handling", "unclassified")
+    return set(export_classes), parse_remap(data.get("remap", [])), null_handling
+
+def export_options_key(fmt: str, export_classes: Set[str], remap_dict: Dict[str, str], null_handling: str) -> str:
+    """Identifies exports an incremental export may build on: same format and options."""
+    options = [fmt, sorted(export_classes), sorted(remap_dict.items()), null_handling]
+    return hashlib.sha1(json.dumps(options).encode()).hexdigest()
+
+def start_export(kind: str, prefix: str, imgs: List[str], write, data: Dict[str, Any], dirs: Dict[str, str],
+                 options_key: str):
+    """Stream the ZIP that write(zf, manifest) produces as the response, or queue a job saving it
+    under exports/ (only the changes since the last export with the same options if `incremental`)."""
+    # The suffix keeps exports queued within the same second off each other's .part file and manifest row
+    zip_name = f"{prefix}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.zip"
+    if data.get("stream"):
+        if data.get("incremental"):
+            return jsonify({"error": "Incremental exports can't be streamed"}), 400
+
+        def generate():
+            sink = _ZipStreamBuffer()
+            with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+                for _ in write(zf, None):
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            yield sink.drain()
+
+        resp = Response(stream_with_context(generate()), mimetype="application/zip")
+        resp.headers["Content-Disposition"] = f"attachment; filename={zip_name}"
+        return resp
 
-            # Remap classes
-            for obj in filtered_objects:
-                original_class = obj.findtext("name")
-                if original_class in remap_dict:
-                    obj.find("name").text = remap_dict[original_class]
+    if data.get("incremental"):
+        manifest = ExportManifest.latest(dirs["name"], options_key, dirs["exports"])
+        if manifest.base_name:
+            zip_name = zip_name[:-4] + "_delta.zip"
+    else:
+        manifest = ExportManifest(dirs["name"], options_key)
+    os.makedirs(dirs["exports"], exist_ok=True)
+    return job_accepted(JOBS.submit(kind, run_zip_export, write, len(imgs), os.path.join(dirs["exports"], zip_name), manifest))
 
-            # Write the modified XML
-            new_tree = ET.ElementTree(root)
-            # Remove old objects and add new ones
-            for obj in objects:
-                root.remove(obj)
-            for obj in filtered_objects:
-                root.append(obj)
+@app.route("/api/export_voc", methods=["POST"])
+def api_export_voc():
+    data = request.get_json(force=True, silent=True) or {}
+    export_classes, remap_dict, null_handling = parse_export_options(data)
 
-            with open(os.path.join(pa, os.path.basename(axml_src)), "wb") as f:
-                new_tree.write(f, encoding="utf-8")
+    dirs = get_active_project_dirs()
+    if not dirs:
+        return jsonify({"error": "No active project"}), 400
+    imgs = list_images_sorted()
+    items = iter_voc_export_items(imgs, export_classes, remap_dict, null_handling)
+    return start_export("export_voc", "VOC", imgs, lambda zf, manifest: write_voc_zip(zf, items, manifest), data, dirs,
+                        export_options_key("voc", export_classes, remap_dict, null_handling))
 
-            shutil.copy2(src_img, os.path.join(pj, name))
-            kept.append(name)
+@app.route("/api/export_yolo", methods=["POST"])
+def api_export_yolo():
+    data = request.get_json(force=True, silent=True) or {}
+    export_classes, remap_dict, null_handling = parse_export_options(data)
 
-        except Exception as e:
-            app.logger.error(f"Error processing {name} for export: {e}")
-            pass
+    dirs = get_active_project_dirs()
+    if not dirs:
+        return jsonify({"error": "No active project"}), 400
+    imgs = list_images_sorted()
+    class_names = yolo_class_names(export_classes, remap_dict)
+    items = iter_yolo_export_items(imgs, export_classes, remap_dict, class_names, null_handling)
+    return start_export("export_yolo", "YOLO", imgs, lambda zf, manifest: write_yolo_zip(zf, items, class_names, manifest),
+                        data, dirs, export_options_key("yolo", export_classes, remap_dict, null_handling))
+
+def run_rescan(job: Job) -> Dict[str, Any]:
+    ANNOTATION_INDEX.build(job)
+    ANNOTATION_INDEX.save_snapshot(INDEX_SNAPSHOT_FILE)
+    update_classes_from_annotations()
+    scan_and_categorize_images()
+    return {"annotations": job.done, "images": len(CATALOG_LISTING.files())}
+
+_startup = {"job": None, "lock": threading.Lock()}
+
+def run_reconcile(job: Job) -> Dict[str, Any]:
+    """Background catch-up after a fast start: index, categories, class list, listing."""
+    for directory in (IMAGE_CATALOG_DIR, ANNOTATION_CATALOG_DIR):
+        remove_stale_temp_files(directory)
+    if ANNOTATION_STORE.kind == "compact":
+        import_store_once()
+    result = ANNOTATION_INDEX.reconcile(job)
+    ANNOTATION_INDEX.save_snapshot(INDEX_SNAPSHOT_FILE)
+    scan_and_categorize_images()
+    if get_classes() is None:
+        update_classes_from_annotations()
+    result["images"] = len(CATALOG_LISTING.files())
+    return result
+
+def start_reconcile():
+    if _startup["job"] is not None:
+        return
+    with _startup["lock"]:
+        if _startup["job"] is None:
+            _startup["job"] = JOBS.submit("reconcile", run_reconcile)
+
+def startup_ready() -> bool:
+    job = _startup["job"]
+    return job is not None and job.finished is not None
+
+@app.route("/api/status")
+def api_status():
+    job = _startup["job"]
+    return jsonify({
+        "ready": startup_ready(),
+        "startup_seconds": round(STARTUP_SECONDS, 3),
+        "uptime_seconds": round(time.time() - PROCESS_STARTED, 1),
+        "reconcile": job.to_dict() if job else None,
+        "watcher": WATCHER.backend,
+        "annotation_store": ANNOTATION_STORE.kind,
+        "annotations": len(ANNOTATION_INDEX.stems()),
+    })
 
-    with open(os.path.join(pm, "train.txt"), "w") as f:
-        for k in kept: f.write(os.path.splitext(k)[0] + "\n")
+@app.route("/api/rescan", methods=["POST"])
+def api_rescan():
+    return job_accepted(JOBS.submit("rescan", run_rescan))
+
+def run_store_import(job: Optional[Job]) -> Dict[str, Any]:
+    stems = ANNOTATION_STORE.import_xml(job)
+    with get_db() as conn:
+        set_meta(conn, "annotation_store_imported", "1")
+    ANNOTATION_INDEX.rebuild(stems)
+    if stems:
+        add_classes(sorted(ANNOTATION_INDEX.classes()))
+    return {"imported": len(stems)}
+
+STORE_IMPORT_STALE_SECONDS = 3600  # a claim this old is taken to be from a worker that died
+
+def import_store_once():
+    """First start on a compact store: bring in the existing XML folder once.
+
+    Several gunicorn workers reconcile at the same time, so the import is claimed
+    atomically in the meta table; the other workers wait for it to finish, so their
+    index sees the imported records.
+    """
+    key, claim = "annotation_store_imported", f"claimed {time.time()}"
+    while True:
+        with get_db() as conn:
+            if conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO NOTHING",
+                            (key, claim)).rowcount:
+                break
+        value = get_meta(key)
+        if value is None:
+            continue  # the claiming worker failed and released it
+        if not value.startswith("claimed "):
+            return
+        if time.time() - float(value.split()[1]) > STORE_IMPORT_STALE_SECONDS:
+            with get_db() as conn:
+                if conn.execute("UPDATE meta SET value = ? WHERE key = ? AND value = ?", (claim, key, value)).rowcount:
+                    break
+        time.sleep(0.5)
+    try:
+        run_store_import(None)
+    except BaseException:
+        with get_db() as conn:
+            conn.execute("DELETE FROM meta WHERE key = ? AND value = ?", (key, claim))
+        raise
+
+def run_store_export(job: Job) -> Dict[str, Any]:
+    return {"exported": ANNOTATION_STORE.export_xml(job), "directory": ANNOTATION_CATALOG_DIR}
+
+@app.route("/api/annotation_store/<action>", methods=["POST"])
+def api_annotation_store(action):
+    """Copy VOC XMLs from the annotation folder into the compact store, or write the store back out as XML."""
+    if ANNOTATION_STORE.kind != "compact":
+        return jsonify({"error": "Annotations are already stored as VOC XML files"}), 400
+    if action == "import":
+        return job_accepted(JOBS.submit("store_import", run_store_import))
+    if action == "export":
+        return job_accepted(JOBS.submit("store_export", run_store_export))
+    abort(404)
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs():
+    return jsonify({"jobs": JOBS.list()})
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def api_job(job_id):
+    job = JOBS.get(job_id)
+    if not job: abort(404, "Job not found.")
+    resp = jsonify(job)
+    resp.headers["Cache-Control"] = "no-store, max-age=0"
+    return resp
 
-    zip_path = os.path.join(exports_dir, f"VOC_{ts}.zip")
-    shutil.make_archive(base_name=zip_path[:-4], format="zip", root_dir=out_root)
-    return jsonify({"ok": True, "count": len(kept), "zip_name": os.path.basename(zip_path), "zip_url": f"/exports/{os.path.basename(zip_path)}"})
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def api_job_cancel(job_id):
+    job = JOBS.cancel(job_id)
+    if not job: abort(404, "Job not found.")
+    return jsonify({"ok": True, "status": job["status"]})
 
 @app.route("/exports/<path:fname>")
 def serve_export(fname):
@@ -875,7 +3838,8 @@ def serve_export(fname):
 
 @app.route("/api/projects", methods=["GET"])
 def api_get_projects():
-    projects = [d for d in os.listdir(PROJECTS_ROOT_DIR) if os.path.isdir(os.path.join(PROJECTS_ROOT_DIR, d)) and d != "exports"]
+    projects = [d for d in os.listdir(PROJECTS_ROOT_DIR)
+                if os.path.isdir(os.path.join(PROJECTS_ROOT_DIR, d)) and d != "exports" and not d.startswith(".")]
     return jsonify({
         "projects": sorted(projects),
         "active": get_active_project(),
@@ -931,40 +3895,33 @@ def api_raw_browser():
     recursive = request.args.get("recursive", "false").lower() == "true"
     network_filter = request.args.get("network", "")
     device_filter = request.args.get("device", "")
+    scope = os.path.relpath(abs_path, RAW_IMAGES_DIR)
+    scope = "" if scope == "." else scope
 
-    items = []
+    RAW_TREE.refresh()
+    start = max(0, (page - 1) * page_size)
     if recursive:
-        for root, dirs, files in os.walk(abs_path):
-            # Filtering logic for recursive view
-            if network_filter and not any(f.startswith(network_filter) for f in root.split(os.sep)):
-                continue
-
-            for name in files:
-                if device_filter and device_filter not in name:
-                    continue
-                if any(name.lower().endswith(ext) for ext in ALLOWED_EXTS):
-                    path = os.path.relpath(os.path.join(root, name), RAW_IMAGES_DIR)
-                    items.append({"name": name, "type": "file", "path": path})
+        files = RAW_TREE.files(scope, network_filter, device_filter)
+        total = len(files)
+        items = [{"name": name, "type": "file", "path": path} for name, path in files[start:start + page_size]]
     else:
-        for item in os.listdir(abs_path):
-            item_abs_path = os.path.join(abs_path, item)
-            if os.path.isdir(item_abs_path):
-                items.append({"name": item, "type": "dir"})
-            elif any(item.lower().endswith(ext) for ext in ALLOWED_EXTS):
-                items.append({"name": item, "type": "file", "path": os.path.relpath(item_abs_path, RAW_IMAGES_DIR)})
-
-    # Sort directories first, then files
-    items.sort(key=lambda x: (x.get("type", "file") != "dir", x.get("name").lower()))
-
-    total = len(items)
-    start = max(0, (page - 1) * page_size)
-    end = min(total, start + page_size)
+        listing = RAW_TREE.listdir(scope)
+        if listing is None:
+            abort(404, "Directory not found.")
+        subdirs, files = listing
+        total = len(subdirs) + len(files)
+        # Directories first, then files
+        items = [{"name": d, "type": "dir"} for d in subdirs[start:start + page_size]]
+        offset = max(0, start - len(subdirs))
+        items += [{"name": f, "type": "file", "path": os.path.join(scope, f)}
+                  for f in files[offset:offset + page_size - len(items)]]
 
     return jsonify({
         "total": total,
         "page": page,
         "page_size": page_size,
-        "items": items[start:end]
+        "items": items,
+        "facets": RAW_TREE.facets(scope),
     })
 
 @app.route("/raw_image/<path:fname>")
@@ -977,7 +3934,7 @@ def serve_raw_image(fname):
     if ext.lower() not in ALLOWED_EXTS:
         abort(400, "Invalid file type.")
 
-    return send_from_directory(RAW_IMAGES_DIR, fname)
+    return send_versioned(RAW_IMAGES_DIR, fname, file_version(os.path.join(RAW_IMAGES_DIR, fname)))
 
 @app.route("/api/raw/annotation", methods=["GET", "POST"])
 def api_raw_annotation():
@@ -985,33 +3942,14 @@ def api_raw_annotation():
         img = request.args.get("image","")
         if ".." in img or os.path.isabs(img): abort(400, "Invalid image name.")
         axml = raw_voc_xml_path(img)
-        boxes = []
-        w, h = -1, -1
-        if os.path.exists(axml):
-            try:
-                root = ET.parse(axml).getroot()
-                size_el = root.find("size")
-                if size_el:
-                    w = int(size_el.findtext("width", "-1"))
-                    h = int(size_el.findtext("height", "-1"))
-
-                for obj in root.findall("object"):
-                    bnd = obj.find("bndbox")
-                    if bnd is None: continue
-                    boxes.append({
-                        "label": obj.findtext("name","object"),
-                        "x1": int(bnd.findtext("xmin","0")), "y1": int(bnd.findtext("ymin","0")),
-                        "x2": int(bnd.findtext("xmax","0")), "y2": int(bnd.findtext("ymax","0")),
-                    })
-            except Exception as e:
-                return jsonify({"boxes": boxes, "error": str(e), "w": w, "h": h}), 200
 
-        if w < 0:
-            w, h = img_size(os.path.join(RAW_IMAGES_DIR, img))
+        def build():
+            try:
+                return load_annotation(img, axml, RAW_IMAGES_DIR)
+            except (ET.ParseError, ValueError) as e:
+                return {"boxes": [], "error": str(e), "w": -1, "h": -1}
 
-        resp = jsonify({"boxes": boxes, "w": w, "h": h})
-        resp.headers["Cache-Control"] = "no-store, max-age=0"
-        return resp
+        return conditional_json(annotation_etag(file_stamp(axml), os.path.join(RAW_IMAGES_DIR, img)), build)
     else: # POST
         data = request.get_json(force=True, silent=True) or {}
         img = data.get("image"); boxes = data.get("boxes", [])
@@ -1024,62 +3962,103 @@ def api_raw_annotation():
         os.makedirs(xml_dir, exist_ok=True)
 
         w,h = img_size(path)
-        with open(xml_path, "wb") as f:
-            f.write(boxes_to_voc_xml(img, w, h, boxes))
+        atomic_write(xml_path, boxes_to_voc_xml(img, w, h, boxes))
         return jsonify({"ok": True})
 
-@app.route("/api/raw/accept", methods=["POST"])
-def api_raw_accept():
-    data = request.get_json(force=True, silent=True) or {}
-    files = data.get("files", [])
-    label = data.get("label")
-    accepted_files = []
-    errors = []
-
-    for f in files:
-        src_path = os.path.join(RAW_IMAGES_DIR, f)
-        raw_axml_path = raw_voc_xml_path(f)
-
-        if not os.path.abspath(src_path).startswith(os.path.abspath(RAW_IMAGES_DIR)):
-            errors.append({"file": f, "error": "Invalid path"})
-            continue
-        if not os.path.exists(src_path):
-            errors.append({"file": f, "error": "Not found"})
-            continue
-
-        new_name = f.replace(os.sep, "_")
-        dest_path = os.path.join(IMAGE_CATALOG_DIR, new_name)
-        dest_axml_path = catalog_voc_xml_path(new_name)
-
+def raw_file_path(f: str) -> Optional[str]:
+    """Absolute path of a raw image given relative to RAW_IMAGES_DIR, or None if it escapes it."""
+    path = os.path.abspath(os.path.join(RAW_IMAGES_DIR, f))
+    return path if path.startswith(os.path.abspath(RAW_IMAGES_DIR) + os.sep) else None
+
+def prune_empty_raw_dirs(paths: List[str]):
+    """Remove the parent folders of `paths` that are now empty, up to (not including) RAW_IMAGES_DIR."""
+    RAW_TREE.expire()
+    root = os.path.abspath(RAW_IMAGES_DIR)
+    # Deepest first, so a folder emptied by pruning its children goes too
+    for d in sorted({os.path.dirname(os.path.abspath(p)) for p in paths}, key=len, reverse=True):
+        while d != root and d.startswith(root + os.sep):
+            try:
+                os.rmdir(d)
+            except OSError:
+                break
+            d = os.path.dirname(d)
+
+def _accept_raw_file(f: str, label: Optional[str], size: Optional[tuple]):
+    """Move one raw image (and its raw XML) into the catalog.
+
+    Returns (new name, image_dims row or None, raw paths moved away); raises ValueError.
+    """
+    src_path = raw_file_path(f)
+    if src_path is None:
+        raise ValueError("Invalid path")
+    if not os.path.exists(src_path):
+        raise ValueError("Not found")
+    raw_axml_path = raw_voc_xml_path(f)
+    has_xml = os.path.exists(raw_axml_path)
+    if not has_xml and not label:
+        raise ValueError("No label provided for un-annotated image")
+
+    new_name = f.replace(os.sep, "_")
+    dest_path = os.path.join(IMAGE_CATALOG_DIR, new_name)
+    if not os.path.exists(dest_path):
+        shutil.move(src_path, dest_path)
+
+    dims_row = None
+    if has_xml:
+        with file_lock(catalog_voc_xml_path(new_name)):
+            ANNOTATION_STORE.move_in(new_name, raw_axml_path)
+    else:
+        w, h = size or img_size(dest_path)
+        box = {"label": label, "x1": 0, "y1": 0, "x2": w, "y2": h}
+        with file_lock(catalog_voc_xml_path(new_name)):
+            ANNOTATION_STORE.write(new_name, voc_entry(new_name, w, h, [box]))
+        # The move keeps mtime and size, so the probe stays valid under the new path
+        st = os.stat(dest_path)
+        dims_row = (dest_path, w, h, st.st_mtime_ns, st.st_size)
+    return new_name, dims_row, [src_path, raw_axml_path]
+
+def accept_raw_files(files: List[str], label: Optional[str]):
+    """Move a batch of raw images into the catalog in parallel, then update the indexes once."""
+    accepted_files, errors, dims_rows, touched = [], [], [], []
+
+    # Header-probe every image that will need a full-frame box in one parallel batch
+    sizes = {}
+    if label:
+        sizes = img_sizes([raw_file_path(f) for f in files
+                           if raw_file_path(f) and not os.path.exists(raw_voc_xml_path(f))])
+
+    def accept_one(f):
         try:
-            # Move image
-            if not os.path.exists(dest_path):
-                shutil.move(src_path, dest_path)
-
-            # Move annotation if it exists, otherwise create a basic one
-            if os.path.exists(raw_axml_path):
-                shutil.move(raw_axml_path, dest_axml_path)
-            else:
-                if not label:
-                    errors.append({"file": f, "error": "No label provided for un-annotated image"})
-                    continue
-                w, h = img_size(dest_path)
-                box = {"label": label, "x1": 0, "y1": 0, "x2": w, "y2": h}
-                with open(dest_axml_path, "wb") as axml:
-                    axml.write(boxes_to_voc_xml(new_name, w, h, [box]))
-
-            accepted_files.append({"original": f, "new": new_name})
+            return _accept_raw_file(f, label, sizes.get(raw_file_path(f)))
         except Exception as e:
-            errors.append({"file": f, "error": str(e)})
+            return e
 
-    for root, dirs, files in os.walk(RAW_IMAGES_DIR, topdown=False):
-        if not dirs and not files:
-            try:
-                os.rmdir(root)
-            except OSError:
-                pass
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="raw-accept") as pool:
+        for f, result in zip(files, pool.map(accept_one, files)):
+            if isinstance(result, Exception):
+                errors.append({"file": f, "error": str(result)})
+                continue
+            new_name, dims_row, moved = result
+            accepted_files.append({"original": f, "new": new_name})
+            touched += moved
+            if dims_row:
+                dims_rows.append(dims_row)
+
+    new_names = [a["new"] for a in accepted_files]
+    if dims_rows:
+        record_image_dims_bulk(dims_rows)
+    ANNOTATION_INDEX.refresh_many(new_names)
+    CATALOG_LISTING.add(new_names)
+    categorize_images(new_names)
+    prewarm_thumbnails(new_names)
+    prune_empty_raw_dirs(touched)
+    return accepted_files, errors
 
-    return jsonify({"accepted": accepted_files, "errors": errors})
+@app.route("/api/raw/accept", methods=["POST"])
+def api_raw_accept():
+    data = request.get_json(force=True, silent=True) or {}
+    accepted, errors = accept_raw_files(data.get("files", []), data.get("label"))
+    return jsonify({"accepted": accepted, "errors": errors})
 
 @app.route("/api/raw/delete", methods=["POST"])
 def api_raw_delete():
@@ -1087,14 +4066,13 @@ def api_raw_delete():
     files = data.get("files", [])
     deleted = []
     errors = []
+    touched = []
 
     for f in files:
-        path = os.path.join(RAW_IMAGES_DIR, f)
-
-        if not os.path.abspath(path).startswith(os.path.abspath(RAW_IMAGES_DIR)):
+        path = raw_file_path(f)
+        if path is None:
             errors.append({"file": f, "error": "Invalid path"})
             continue
-
         if not os.path.exists(path):
             errors.append({"file": f, "error": "Not found"})
             continue
@@ -1102,26 +4080,87 @@ def api_raw_delete():
         try:
             os.remove(path)
             deleted.append(f)
+            touched.append(path)
+            # Drop a raw annotation drawn for it, too
+            axml = raw_voc_xml_path(f)
+            if os.path.exists(axml):
+                os.remove(axml)
+                touched.append(axml)
         except Exception as e:
             errors.append({"file": f, "error": str(e)})
 
-    for root, dirs, files in os.walk(RAW_IMAGES_DIR, topdown=False):
-        if not dirs and not files:
-            try:
-                os.rmdir(root)
-            except OSError:
-                pass
-
+    prune_empty_raw_dirs(touched)
     return jsonify({"deleted": deleted, "errors": errors})
 
-if __name__ == "__main__":
+def resolve_ssl_files():
+    """Return (cert, key) paths, ("adhoc", None) for a throwaway cert, or (None, None) for plain HTTP."""
     use_https = os.environ.get("RB_USE_HTTPS", "").lower() in ("1","true","yes")
     cert = os.environ.get("RB_SSL_CERT_FILE")
     key = os.environ.get("RB_SSL_KEY_FILE")
-    ssl_context = None
     if cert and key:
-        ssl_context = (cert, key)
-        use_https = True
-    elif use_https:
-        ssl_context = "adhoc"
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT","8000")), debug=True, threaded=True, ssl_context=ssl_context)
\ No newline at end of file
+        return cert, key
+    if use_https:
+        return "adhoc", None
+    return None, None
+
+def run_production_server():
+    """Serve the app with gunicorn: RB_WORKERS processes x RB_THREADS threads each.
+
+    Workers import this module themselves (no preload), so each gets its own
+    SQLite connections and in-memory caches; cross-process state goes through the
+    metadata store and the annotation journal.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("RB_SERVER=gunicorn requires gunicorn: pip install gunicorn")
+
+    cert, key = resolve_ssl_files()
+    if cert == "adhoc":
+        # gunicorn has no ad-hoc mode, so persist a self-signed pair like the dev server would generate
+        from werkzeug.serving import make_ssl_devcert
+        base = os.path.join(PROJECTS_ROOT_DIR, ".ssl", "devcert")
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        if not os.path.exists(base + ".crt"):
+            make_ssl_devcert(base, host="localhost")
+        cert, key = base + ".crt", base + ".key"
+
+    options = {
+        "bind": f"0.0.0.0:{int(os.environ.get('PORT', '8000'))}",
+        "workers": int(os.environ.get("RB_WORKERS", str(min(8, (os.cpu_count() or 1) * 2)))),
+        "threads": int(os.environ.get("RB_THREADS", "4")),
+        "worker_class": "gthread",
+        "timeout": int(os.environ.get("RB_WORKER_TIMEOUT", "120")),
+        "preload_app": False,
+        "accesslog": "-",
+    }
+    if cert and key:
+        options.update(certfile=cert, keyfile=key)
+
+    # Don't let forked workers inherit this process's SQLite handle
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _db_local.conn = None
+
+    class ReviewBoxApplication(BaseApplication):
+        def load_config(self):
+            for k, v in options.items():
+                self.cfg.set(k, v)
+
+        def load(self):
+            # Import by name so a worker never reuses state created by this (parent) process
+            import importlib
+            return importlib.import_module("app").app
+
+    ReviewBoxApplication().run()
+
+STARTUP_SECONDS = time.time() - PROCESS_STARTED  # module import, i.e. time before the app can serve
+
+if __name__ == "__main__":
+    if os.environ.get("RB_SERVER", "").lower() == "gunicorn":
+        run_production_server()
+    else:
+        cert, key = resolve_ssl_files()
+        ssl_context = (cert, key) if key else cert
+        app.run(host="0.0.0.0", port=int(os.environ.get("PORT","8000")), debug=True, threaded=True, ssl_context=ssl_context)
@@ -17,27 +17,29 @@
     lastClickedIndex: null,
     filter: "",
     category: "",
+    project: null,
   };
 
   async function fetchImages() {
-    let url = `/api/catalog/available?page=${state.page}&page_size=${state.pageSize}`;
-    if (state.category) {
-      url += `&category=${encodeURIComponent(state.category)}`;
+    if (state.project === null) {
+      const res = await fetch("/api/projects");
+      state.project = (await res.json()).active || "";
     }
-    const res = await fetch(url);
+    const params = new URLSearchParams({ page: state.page, page_size: state.pageSize });
+    if (state.project) params.set("not_in_project", state.project);
+    if (state.category) params.set("category", state.category);
+    if (state.filter.trim()) params.set("q", state.filter.trim());
+    const res = await fetch(`/api/query?${params}`);
     const data = await res.json();
     state.images = data.images || [];
+    rememberVersions(data.versions);
     state.total = data.total || 0;
     await render();
   }
 
   async function render() {
     grid.innerHTML = "";
-    let imgs = state.images;
-    if (state.filter.trim()) {
-      const q = state.filter.toLowerCase();
-      imgs = imgs.filter(n => n.toLowerCase().includes(q));
-    }
+    const imgs = state.images;
 
     pageInfo.textContent = `Page ${state.page} of ${Math.max(1, Math.ceil(state.total / state.pageSize))} — ${state.total} images`;
 
@@ -49,7 +51,7 @@
       if (state.selected.has(name)) tile.classList.add("selected");
 
       const img = document.createElement("img");
-      img.src = `/image/${encodeURIComponent(name)}`;
+      img.src = thumbUrl(name, 224);
       img.className = "thumb";
       img.loading = "lazy";
       img.width = 224;
@@ -109,9 +111,12 @@
   }
 
   btnAdd.addEventListener("click", addSelected);
+  let filterTimer = null;
   filterText.addEventListener("input", (e) => {
     state.filter = e.target.value;
-    render();
+    state.page = 1;
+    clearTimeout(filterTimer);
+    filterTimer = setTimeout(fetchImages, 200);
   });
 
   btnPrev.addEventListener("click", () => {
@@ -147,11 +152,7 @@
       addSelected();
     } else if (e.key === "a") {
       e.preventDefault();
-      let imgs = state.images;
-      if (state.filter.trim()) {
-        const q = state.filter.toLowerCase();
-        imgs = imgs.filter(n => n.toLowerCase().includes(q));
-      }
+      const imgs = state.images;
       const allSelected = imgs.length > 0 && imgs.every(name => state.selected.has(name));
       if (allSelected) {
         imgs.forEach(name => state.selected.delete(name));
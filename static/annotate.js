@@ -91,7 +91,7 @@
   });
 
   async function loadBoxes() {
-    const res = await fetch(`/api/annotation?image=${encodeURIComponent(window.annConfig.image)}&t=${Date.now()}`, { cache: "no-store" });
+    const res = await fetch(`/api/annotation?image=${encodeURIComponent(window.annConfig.image)}`);
     const data = await res.json();
     boxes = (data.boxes || []).map(b => ({...b})); activeIdx = boxes.length ? 0 : -1;
     drawAll(); refreshList();
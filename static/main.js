@@ -13,15 +13,22 @@
   const thumbSizeSel = document.getElementById("thumbSize");
   const filterText = document.getElementById("filterText");
   const classFilter = document.getElementById("classFilter");
+  const collapseDuplicates = document.getElementById("collapseDuplicates");
 
   const exportModal = document.getElementById("exportModal");
   const exportClassList = document.getElementById("exportClassList");
   const exportRemap = document.getElementById("exportRemap");
   const addRemapRow = document.getElementById("addRemapRow");
   const nullHandling = document.getElementById("nullHandling");
+  const exportIncremental = document.getElementById("exportIncremental");
+  const exportFormat = document.getElementById("exportFormat");
   const runExport = document.getElementById("runExport");
   const cancelExport = document.getElementById("cancelExport");
   const exportSpinner = document.getElementById("exportSpinner");
+  const exportProgress = document.getElementById("exportProgress");
+  const cancelExportJob = document.getElementById("cancelExportJob");
+  const jobStatus = document.getElementById("jobStatus");
+  let exportJobId = null;
 
   const projectSwitcher = document.getElementById("projectSwitcher");
   const btnNewProject = document.getElementById("btnNewProject");
@@ -31,24 +38,46 @@
   const runCreateProject = document.getElementById("runCreateProject");
   const cancelCreateProject = document.getElementById("cancelCreateProject");
 
-  let state = { page: 1, pageSize: window.appConfig?.pageSize || 200, total: 0,
-    images: [], selected: new Set(), lastClickedIndex: null, thumb: 112, filter: "", class: "All Classes", project: "default" };
-  let pageBoxes = {}; // name -> boxes[]
-
-  function applyThumbSize() {
-    const s = parseInt(state.thumb, 10);
-    grid.style.gridTemplateColumns = `repeat(auto-fill, minmax(${s}px, 1fr))`;
-  }
+  let state = { pageSize: window.appConfig?.pageSize || 200,
+    selected: new Set(), lastClickedIndex: null, thumb: 112, filter: "", class: "All Classes", project: "default", collapse: false };
+  let pageBoxes = {}; // name -> {boxes, w, h} for the tiles scrolled past so far
+  let hiddenDuplicates = {}; // name -> near-duplicates collapsed behind it
+  let missingFromCatalog = 0; // project members whose image is no longer in the catalog
+
+  const BOX_BLOCK = 100; // overlay annotations are fetched in index-aligned blocks so bulk ETags repeat
+
+  const vgrid = new VirtualGrid(grid, {
+    tileSize: state.thumb,
+    pageSize: state.pageSize,
+    fetchPage: async (cursor, limit) => {
+      const params = new URLSearchParams({ project: state.project, cursor, page_size: limit });
+      if (state.class === "__unannotated__") params.set("status", "unannotated");
+      else if (state.class === "__null__") params.set("status", "null");
+      else if (state.class && state.class !== "All Classes") params.set("class", state.class);
+      if (state.filter.trim()) params.set("q", state.filter.trim());
+      if (state.collapse) params.set("collapse", "1");
+      const res = await fetch(`/api/query?${params}`);
+      const data = await res.json();
+      Object.assign(hiddenDuplicates, data.duplicates || {});
+      if (data.missing !== undefined) missingFromCatalog = data.missing;
+      return data;
+    },
+    createTile,
+    renderTile,
+    onRangeChange: (names, first, last) => {
+      const count = vgrid.count;
+      pageInfo.textContent = (count ? `${first + 1}–${last + 1} of ${count} images` : "0 images") +
+        (missingFromCatalog ? ` (${missingFromCatalog} in the project but missing from the catalog)` : "");
+      loadBoxesForRange(first, last);
+    },
+  });
 
-  async function fetchImages() {
-    let url = `/api/images?page=${state.page}&page_size=${state.pageSize}`;
-    if (state.class && state.class !== "All Classes") {
-      url += `&class=${encodeURIComponent(state.class)}`;
-    }
-    const res = await fetch(url);
-    const data = await res.json();
-    state.total = data.total; state.images = data.images;
-    await render();
+  async function fetchImages({ toTop = false } = {}) {
+    pageBoxes = {};
+    hiddenDuplicates = {};
+    pendingBlocks.clear();
+    if (toTop) window.scrollTo(0, 0);
+    await vgrid.reload();
   }
 
   function drawOverlayForTile(tile, name){
@@ -107,15 +136,26 @@
     ctx.restore();
   }
 
-  async function fetchBoxesForPage(imgs){
+  const pendingBlocks = new Set();
+
+  function loadBoxesForRange(first, last) {
+    const loaded = vgrid.items;
+    for (let b = Math.floor(first / BOX_BLOCK); b <= Math.floor(last / BOX_BLOCK); b++) {
+      const names = loaded.slice(b * BOX_BLOCK, (b + 1) * BOX_BLOCK);
+      const key = `${b}:${names[0]}`;
+      if (!names.length || pendingBlocks.has(key) || names.every(n => pageBoxes[n])) continue;
+      pendingBlocks.add(key);
+      fetchBoxes(names).then(items => {
+        Object.assign(pageBoxes, items);
+        vgrid.forEachMounted((tile, name) => { if (items[name]) drawOverlayForTile(tile, name); });
+      }).finally(() => pendingBlocks.delete(key));
+    }
+  }
+
+  async function fetchBoxes(imgs){
     // Try bulk endpoint first
     try{
-      const res = await fetch("/api/annotations_bulk", {
-        method: "POST", headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ images: imgs })
-      });
-      if (!res.ok) throw new Error(`bulk ${res.status}`);
-      const data = await res.json();
+      const data = await postJsonCached("/api/annotations_bulk", { images: imgs });
       return data.items || {};
     } catch(e){
       // Fallback: per-image fetch with small concurrency
@@ -125,7 +165,7 @@
         while(queue.length){
           const name = queue.shift();
           try{
-            const r = await fetch(`/api/annotation?image=${encodeURIComponent(name)}&t=${Date.now()}`, { cache: "no-store" });
+            const r = await fetch(`/api/annotation?image=${encodeURIComponent(name)}`);
             const d = await r.json();
             out[name] = { boxes: d.boxes || [], w: d.w, h: d.h };
           }catch{ out[name] = { boxes: [] }; }
@@ -136,69 +176,50 @@
     }
   }
 
-  async function render() {
-    pageInfo.textContent = `Page ${state.page} of ${Math.max(1, Math.ceil(state.total / state.pageSize))} — ${state.total} images`;
-    grid.innerHTML = "";
-    let imgs = state.images;
-    if (state.filter.trim()) {
-      const q = state.filter.toLowerCase();
-      imgs = imgs.filter(n => n.toLowerCase().includes(q));
-    }
+  function createTile() {
+    const tile = document.createElement("div"); tile.className = "tile";
 
-    imgs.forEach((name, i) => {
-      const idx = i;
-      const tile = document.createElement("div"); tile.className = "tile"; tile.dataset.name = name;
-      if (state.selected.has(name)) tile.classList.add("selected");
-
-      const a = document.createElement("a"); a.className = "annotate"; a.href = `/annotate?image=${encodeURIComponent(name)}`;
-      a.textContent = "✏️"; a.title = "Annotate"; a.addEventListener("click", (ev) => ev.stopPropagation());
-      tile.appendChild(a);
-
-      const badge = document.createElement("div"); badge.className = "badge";
-      badge.textContent = `${(state.page - 1) * state.pageSize + i + 1}`; tile.appendChild(badge);
-
-      const img = document.createElement("img"); img.src = `/image/${encodeURIComponent(name)}`; img.className = "thumb";
-      img.loading = "lazy"; img.width = state.thumb; img.height = state.thumb; tile.appendChild(img);
-
-      tile.addEventListener("click", (e) => {
-        const sel = state.selected;
-        if (e.shiftKey && state.lastClickedIndex !== null) {
-          const start = Math.min(state.lastClickedIndex, idx);
-          const end = Math.max(state.lastClickedIndex, idx);
-          for (let j = start; j <= end; j++) {
-            const name2 = imgs[j];
-            const tile2 = grid.children[j];
-            if (sel.has(name2)) {
-              sel.delete(name2);
-              if(tile2) tile2.classList.remove("selected");
-            } else {
-              sel.add(name2);
-              if(tile2) tile2.classList.add("selected");
-            }
-          }
-        } else {
-          if (sel.has(name)) sel.delete(name); else sel.add(name);
-          state.lastClickedIndex = idx;
-        }
-        tile.classList.toggle("selected", sel.has(name));
-      });
+    const a = document.createElement("a"); a.className = "annotate";
+    a.textContent = "✏️"; a.title = "Annotate"; a.addEventListener("click", (ev) => ev.stopPropagation());
+    tile.appendChild(a);
 
-      grid.appendChild(tile);
-    });
+    const badge = document.createElement("div"); badge.className = "badge"; tile.appendChild(badge);
 
-    // Fetch page boxes and draw overlays
-    try{
-      pageBoxes = await fetchBoxesForPage(imgs);
-    }catch(e){
-      pageBoxes = {};
-    }
-    if (!pageBoxes || typeof pageBoxes !== 'object') pageBoxes = {};
+    const img = document.createElement("img"); img.className = "thumb"; img.decoding = "async";
+    img.addEventListener("load", () => drawOverlayForTile(tile, tile.dataset.name));
+    tile.appendChild(img);
 
-    Array.from(grid.children).forEach(tile => {
+    tile.addEventListener("click", (e) => {
+      const idx = parseInt(tile.dataset.index, 10);
       const name = tile.dataset.name;
-      if (!name) return;
-      drawOverlayForTile(tile, name);
+      const sel = state.selected;
+      if (e.shiftKey && state.lastClickedIndex !== null) {
+        const start = Math.min(state.lastClickedIndex, idx);
+        const end = Math.max(state.lastClickedIndex, idx);
+        const imgs = vgrid.items;
+        for (let j = start; j <= end; j++) {
+          if (sel.has(imgs[j])) sel.delete(imgs[j]); else sel.add(imgs[j]);
+        }
+        vgrid.forEachMounted((t, n) => t.classList.toggle("selected", sel.has(n)));
+      } else {
+        if (sel.has(name)) sel.delete(name); else sel.add(name);
+        state.lastClickedIndex = idx;
+        tile.classList.toggle("selected", sel.has(name));
+      }
     });
+    return tile;
+  }
+
+  // Fills a new or recycled tile; the overlay canvas is cleared rather than recreated
+  function renderTile(tile, name, i) {
+    tile.dataset.name = name; tile.dataset.index = String(i);
+    tile.classList.toggle("selected", state.selected.has(name));
+    tile.querySelector("a.annotate").href = `/annotate?image=${encodeURIComponent(name)}`;
+    tile.querySelector(".badge").textContent = hiddenDuplicates[name] ? `${i + 1} +${hiddenDuplicates[name]}` : `${i + 1}`;
+    const img = tile.querySelector("img.thumb");
+    const src = thumbUrl(name, state.thumb);
+    if (img.getAttribute("src") !== src) img.src = src;
+    drawOverlayForTile(tile, name);
   }
 
   async function deleteSelected() {
@@ -259,30 +280,37 @@
         classes,
         remap,
         null_handling: nullHandling.value,
+        incremental: exportIncremental.checked,
       };
 
-      const res = await fetch("/api/export_voc", {
+      const res = await fetch(`/api/export_${exportFormat.value}`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(payload)
       });
       const data = await res.json();
-      if (data.ok) {
+      if (!data.ok) { alert("Export failed."); return; }
+
+      exportJobId = data.job_id;
+      const job = await pollJob(data.job_id, j => { exportProgress.textContent = formatJobProgress(j); });
+      if (job.status === "done") {
         const a = document.createElement("a");
-        a.href = data.zip_url;
-        a.download = data.zip_name;
+        a.href = job.result.zip_url;
+        a.download = job.result.zip_name;
         document.body.appendChild(a);
         a.click();
         a.remove();
         exportModal.style.display = "none";
-      } else {
-        alert("Export failed.");
+      } else if (job.status === "failed") {
+        alert(`Export failed: ${job.error || 'Unknown error'}`);
       }
     } catch (e) {
       alert(`An error occurred: ${e.message}`);
     } finally {
+      exportJobId = null;
       runExport.disabled = false;
       exportSpinner.style.display = "none";
+      exportProgress.textContent = "";
     }
   }
 
@@ -296,14 +324,12 @@
     formData.append('file', file);
 
     try {
+      jobStatus.textContent = "Uploading…";
       const res = await fetch("/api/import_voc", { method: "POST", body: formData });
       const data = await res.json();
       if (res.ok && data.ok) {
-        let alertMsg = data.message || "Import finished.";
-        if (data.failed_files && data.failed_files.length > 0) {
-          alertMsg += `\n\nCould not import:\n- ${data.failed_files.join("\n- ")}`;
-        }
-        alert(alertMsg);
+        const job = await pollJob(data.job_id, j => { jobStatus.textContent = `Import: ${formatJobProgress(j)}`; });
+        reportImportJob(job);
         await fetchClasses();
         await fetchImages();
       } else {
@@ -312,6 +338,7 @@
     } catch (e) {
       alert(`An error occurred: ${e.message}`);
     } finally {
+      jobStatus.textContent = "";
       importFile.value = ""; // Reset file input
     }
   }
@@ -325,14 +352,12 @@
     formData.append('file', file);
 
     try {
+      jobStatus.textContent = "Uploading…";
       const res = await fetch("/api/import_images", { method: "POST", body: formData });
       const data = await res.json();
       if (res.ok && data.ok) {
-        let alertMsg = data.message || "Import finished.";
-        if (data.failed_files && data.failed_files.length > 0) {
-          alertMsg += `\n\nCould not import:\n- ${data.failed_files.join("\n- ")}`;
-        }
-        alert(alertMsg);
+        const job = await pollJob(data.job_id, j => { jobStatus.textContent = `Import: ${formatJobProgress(j)}`; });
+        reportImportJob(job);
         await fetchImages();
       } else {
         alert(`Import failed: ${data.error || 'Unknown error'}`);
@@ -340,15 +365,23 @@
     } catch (e) {
       alert(`An error occurred: ${e.message}`);
     } finally {
+      jobStatus.textContent = "";
       importImagesFile.value = ""; // Reset file input
     }
   }
 
-  btnPrev.addEventListener("click", () => { if (state.page > 1) { state.page -= 1; fetchImages(); }});
-  btnNext.addEventListener("click", () => {
-    const maxPage = Math.max(1, Math.ceil(state.total / state.pageSize));
-    if (state.page < maxPage) { state.page += 1; fetchImages(); }
-  });
+  function reportImportJob(job) {
+    if (job.status === "failed") { alert(`Import failed: ${job.error || 'Unknown error'}`); return; }
+    if (job.status === "cancelled") { alert("Import cancelled."); return; }
+    let alertMsg = job.result.message || "Import finished.";
+    if (job.result.failed_files && job.result.failed_files.length > 0) {
+      alertMsg += `\n\nCould not import:\n- ${job.result.failed_files.join("\n- ")}`;
+    }
+    alert(alertMsg);
+  }
+
+  btnPrev.addEventListener("click", () => vgrid.scrollPages(-1));
+  btnNext.addEventListener("click", () => vgrid.scrollPages(1));
   btnDelete.addEventListener("click", deleteSelected);
   btnExport.addEventListener("click", exportVOC);
   btnImport.addEventListener("click", () => importFile.click());
@@ -369,12 +402,21 @@
   addRemapRow.addEventListener("click", addRemapRowLogic);
   runExport.addEventListener("click", runExportLogic);
   cancelExport.addEventListener("click", () => { exportModal.style.display = "none"; });
+  cancelExportJob.addEventListener("click", () => {
+    if (exportJobId) fetch(`/api/jobs/${exportJobId}/cancel`, { method: "POST" });
+  });
   btnImportImages.addEventListener("click", () => importImagesFile.click());
   importImagesFile.addEventListener("change", importImages);
-  pageSizeSel.addEventListener("change", () => { state.pageSize = parseInt(pageSizeSel.value, 10); state.page = 1; fetchImages(); });
-  thumbSizeSel.addEventListener("change", () => { state.thumb = parseInt(thumbSizeSel.value, 10); applyThumbSize(); render(); });
-  filterText.addEventListener("input", (e) => { state.filter = e.target.value; render(); });
-  classFilter.addEventListener("change", () => { state.class = classFilter.value; state.page = 1; fetchImages(); });
+  pageSizeSel.addEventListener("change", () => { state.pageSize = parseInt(pageSizeSel.value, 10); vgrid.opts.pageSize = state.pageSize; });
+  thumbSizeSel.addEventListener("change", () => { state.thumb = parseInt(thumbSizeSel.value, 10); vgrid.setTileSize(state.thumb); });
+  let filterTimer = null;
+  filterText.addEventListener("input", (e) => {
+    state.filter = e.target.value;
+    clearTimeout(filterTimer);
+    filterTimer = setTimeout(() => fetchImages({ toTop: true }), 200);
+  });
+  classFilter.addEventListener("change", () => { state.class = classFilter.value; fetchImages({ toTop: true }); });
+  collapseDuplicates.addEventListener("change", () => { state.collapse = collapseDuplicates.checked; fetchImages({ toTop: true }); });
 
   async function fetchClasses() {
     const res = await fetch("/api/classes");
@@ -429,10 +471,9 @@
       });
       if (res.ok) {
         state.project = newProject;
-        state.page = 1;
         state.selected.clear();
         await fetchClasses();
-        await fetchImages();
+        await fetchImages({ toTop: true });
       } else {
         alert("Failed to switch project.");
         projectSwitcher.value = state.project; // Revert selection
@@ -470,10 +511,9 @@
         newProjectModal.style.display = "none";
         state.project = data.name;
         await fetchProjects();
-        state.page = 1;
         state.selected.clear();
         await fetchClasses();
-        await fetchImages();
+        await fetchImages({ toTop: true });
       } else {
         alert(`Failed to create project: ${data.error || 'Unknown error'}`);
       }
@@ -494,10 +534,10 @@
     if (e.key === "d" || e.key === "D") deleteSelected();
     if (e.key === "e" || e.key === "E") exportVOC();
     if (e.key === "a" || e.key === "A") {
-      const imgs = state.images;
+      const imgs = vgrid.items; // every loaded image matching the filters
       let all = true; for (const n of imgs) if (!state.selected.has(n)) { all = false; break; }
       if (all) imgs.forEach(n => state.selected.delete(n)); else imgs.forEach(n => state.selected.add(n));
-      render();
+      vgrid.refresh();
     }
     if (e.key === "ArrowLeft") btnPrev.click();
     if (e.key === "ArrowRight") btnNext.click();
@@ -505,7 +545,6 @@
 
   pageSizeSel.value = String(state.pageSize);
   thumbSizeSel.value = String(state.thumb);
-  applyThumbSize();
   (async () => {
     await fetchProjects();
     await fetchClasses();
@@ -35,6 +35,22 @@
     const data = await res.json();
     render(data.items);
     renderPagination(data.total, data.page, data.page_size);
+    renderFacets(data.facets || {});
+    document.getElementById("rawTotal").textContent = `${data.total} ${recursiveToggle.checked ? "images" : "entries"}`;
+  }
+
+  // Suggest the networks and devices under the current folder, with their image counts
+  function renderFacets(facets) {
+    [["networkOptions", facets.networks], ["deviceOptions", facets.devices]].forEach(([id, counts]) => {
+      const list = document.getElementById(id);
+      list.innerHTML = "";
+      Object.entries(counts || {}).forEach(([value, n]) => {
+        const opt = document.createElement("option");
+        opt.value = value;
+        opt.label = `${value} (${n})`;
+        list.appendChild(opt);
+      });
+    });
   }
 
   function renderPagination(total, page, page_size) {
@@ -126,7 +142,7 @@
   });
 
   [networkFilter, deviceFilter, recursiveToggle].forEach(el => {
-    el.addEventListener("change", fetchItems);
+    el.addEventListener("change", () => { state.page = 1; fetchItems(); });
   });
 
   btnDelete.addEventListener("click", async () => {
@@ -91,7 +91,7 @@
     let anns = annsCache[name];
     if(!anns){
       try{
-        const res = await fetch(`/api/raw/annotation?image=${encodeURIComponent(name)}&t=${Date.now()}`, {cache: "no-store"});
+        const res = await fetch(`/api/raw/annotation?image=${encodeURIComponent(name)}`);
         anns = await res.json();
         annsCache[name] = anns;
       }catch(e){
@@ -207,33 +207,70 @@
 
   async function goBack(){ if(idx>0){ idx-=1; await renderTriplet(); } }
   async function skip(){ if(idx<images.length-1){ idx+=1; await renderTriplet(); } }
+  // Accepts and deletes leave the carousel at once and reach the server in batches
+  const RAW_BATCH = 25, RAW_FLUSH_MS = 400;
+  const pendingAccepts = new Map(); // label -> [files]
+  let pendingDeletes = [];
+  let flushTimer = null;
+
+  function removeCurrent(){
+    images.splice(idx,1);
+    if(idx>=images.length)idx=Math.max(0,images.length-1);
+    return renderTriplet();
+  }
+  function queueRaw(kind, name, label){
+    if(kind === "accept"){
+      if(!pendingAccepts.has(label)) pendingAccepts.set(label, []);
+      pendingAccepts.get(label).push(name);
+    } else {
+      pendingDeletes.push(name);
+    }
+    clearTimeout(flushTimer);
+    const queued = pendingDeletes.length + [...pendingAccepts.values()].reduce((n, f) => n + f.length, 0);
+    if(queued >= RAW_BATCH) flushRaw();
+    else flushTimer = setTimeout(flushRaw, RAW_FLUSH_MS);
+  }
+  function takeBatches(){
+    const batches = [...pendingAccepts].map(([label, files]) => ["/api/raw/accept", {files, label}]);
+    if(pendingDeletes.length) batches.push(["/api/raw/delete", {files: pendingDeletes}]);
+    pendingAccepts.clear(); pendingDeletes = [];
+    return batches;
+  }
+  async function flushRaw(){
+    clearTimeout(flushTimer); flushTimer = null;
+    const failed = [];
+    await Promise.all(takeBatches().map(async ([url, body]) => {
+      try{
+        const res = await fetch(url, {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify(body)});
+        const data = await res.json();
+        (data.errors || []).forEach(e => failed.push(e));
+      }catch(e){
+        body.files.forEach(file => failed.push({file, error: String(e)}));
+      }
+    }));
+    if(failed.length){
+      // Put them back at the end so they can be retried
+      failed.forEach(e => { if(!images.includes(e.file)) images.push(e.file); });
+      alert("Some images could not be saved: " + JSON.stringify(failed));
+      await renderTriplet();
+    }
+  }
+  window.addEventListener("pagehide", () => {
+    // text/plain keeps the beacon CORS-safelisted (an application/json Blob throws); the server parses it with force=True
+    takeBatches().forEach(([url, body]) => navigator.sendBeacon(url, new Blob([JSON.stringify(body)], {type: "text/plain"})));
+  });
+
   async function deleteCurrent(){
     const name = images[idx]; if(!name) return;
-    const res = await fetch("/api/raw/delete",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({files:[name]})});
-    const data = await res.json();
-    if(data.errors && data.errors.length > 0){ alert("Delete failed."); }
-    else{ images.splice(idx,1); if(idx>=images.length)idx=Math.max(0,images.length-1); await renderTriplet(); }
+    queueRaw("delete", name);
+    await removeCurrent();
   }
 
   async function acceptCurrent() {
     const name = images[idx]; if(!name) return;
-
-    acceptBtn.disabled = true;
-    const res = await fetch("/api/raw/accept", {
-        method:"POST", headers:{"Content-Type":"application/json"},
-        body: JSON.stringify({ files:[name], label: labelSelect.value||"" })
-    });
-    const data = await res.json();
-    acceptBtn.disabled = false;
-
-    if(data.errors && data.errors.length > 0){
-      alert("Accept failed: " + JSON.stringify(data.errors));
-    } else {
-      delete annsCache[name];
-      images.splice(idx,1);
-      if(idx>=images.length)idx=Math.max(0,images.length-1);
-      await renderTriplet();
-    }
+    queueRaw("accept", name, labelSelect.value||"");
+    delete annsCache[name];
+    await removeCurrent();
   }
 
   backBtn.addEventListener("click", goBack);
@@ -1,5 +1,6 @@
 (() => {
   const classFilter = document.getElementById("classFilter");
+  const skipDuplicates = document.getElementById("skipDuplicates");
   const labelSelect = document.getElementById("labelSelect");
   const newLabel = document.getElementById("newLabel");
   const addLabelBtn = document.getElementById("addLabelBtn");
@@ -19,12 +20,82 @@
   currCtx.imageSmoothingEnabled = false;
   nextCtx.imageSmoothingEnabled = false;
 
+  const BATCH = 20;          // names + annotations per /api/review/batch call
+  const PREFETCH_AHEAD = 4;  // upcoming images kept decoded
+  const KEEP_BEHIND = 2;     // already-seen images kept decoded for Back
+
   let images = []; let idx = 0;
   const annsCache = {}; // name -> {boxes,w,h}
+  const decoded = new Map(); // name -> Promise<HTMLImageElement>
+  let fixedList = false;   // images came from sessionStorage rather than the batch API
+  let exhausted = false;   // the batch API has nothing after images[images.length-1]
+  let loading = null; let generation = 0;
+  let saveChain = Promise.resolve();
   let isDragging = false; let dragStart = null; let lastPos = null;
   let activeMouseUpHandler = null;
   let isSaving = false;
-  function imgUrl(n){ return `/image/${encodeURIComponent(n)}`; }
+  function imgUrl(n){ return imageUrl(n); }
+
+  function decodeImage(name){
+    let p = decoded.get(name);
+    if (!p) {
+      const img = new Image();
+      img.src = imgUrl(name);
+      p = img.decode().catch(e => console.error("Image decode error:", e)).then(() => img);
+      decoded.set(name, p);
+    }
+    return p;
+  }
+
+  async function loadMore(){
+    if (fixedList || exhausted) return;
+    if (loading) return loading;
+    const gen = generation;
+    let url = `/api/review/batch?count=${BATCH}`;
+    if (images.length) url += `&after=${encodeURIComponent(images[images.length-1])}`;
+    if (classFilter.value && classFilter.value !== "All Classes") {
+      url += `&class=${encodeURIComponent(classFilter.value)}`;
+    }
+    if (skipDuplicates.checked) url += "&collapse=1";
+    loading = (async () => {
+      const res = await fetch(url); const data = await res.json();
+      if (gen !== generation) return;
+      rememberVersions(data.versions);
+      for (const [name, item] of Object.entries(data.items || {})) {
+        if (!annsCache[name]) annsCache[name] = item;
+      }
+      images.push(...(data.images || []));
+      exhausted = !data.next;
+    })().finally(() => { if (gen === generation) loading = null; });
+    return loading;
+  }
+
+  async function fetchMissingAnnotations(names){
+    const missing = names.filter(n => !annsCache[n]);
+    if (!missing.length) return;
+    try {
+      const data = await postJsonCached("/api/annotations_bulk", { images: missing });
+      for (const [name, item] of Object.entries(data.items || {})) {
+        if (!annsCache[name]) annsCache[name] = item;
+      }
+    } catch (e) { console.error("Failed to fetch annotations:", e); }
+  }
+
+  // Keep a sliding window of decoded images and annotations around idx
+  async function prefetch(){
+    if (idx + PREFETCH_AHEAD >= images.length - BATCH / 2) await loadMore();
+    const lo = Math.max(0, idx - KEEP_BEHIND), hi = Math.min(images.length, idx + PREFETCH_AHEAD + 1);
+    const inWindow = images.slice(lo, hi);
+    if (fixedList) await fetchMissingAnnotations(images.slice(idx, idx + BATCH));
+    inWindow.forEach(decodeImage);
+    const keep = new Set(inWindow);
+    for (const name of decoded.keys()) { if (!keep.has(name)) decoded.delete(name); }
+  }
+
+  async function advance(){
+    if (idx >= images.length-1) await loadMore();
+    if (idx < images.length-1) idx += 1;
+  }
 
   async function loadClasses(){
     const res = await fetch("/api/classes"); const data = await res.json();
@@ -57,24 +128,24 @@
     idx = 0;
     loadImages();
   });
+  skipDuplicates.addEventListener("change", () => {
+    idx = 0;
+    loadImages();
+  });
 
   async function loadImages(){
+    generation += 1; loading = null;
+    images = []; idx = 0; exhausted = false; fixedList = false;
+    decoded.clear();
     const reviewImagesStr = sessionStorage.getItem('reviewImages');
     if (reviewImagesStr) {
         images = JSON.parse(reviewImagesStr);
         sessionStorage.removeItem('reviewImages');
-        idx = 0;
-        await renderTriplet();
-        return;
+        fixedList = true;
+        await fetchMissingAnnotations(images.slice(0, BATCH));
+    } else {
+        await loadMore();
     }
-
-    let url = `/api/images?page=1&page_size=2500`;
-    if (classFilter.value && classFilter.value !== "All Classes") {
-      url += `&class=${encodeURIComponent(classFilter.value)}`;
-    }
-    const res = await fetch(url); const data = await res.json();
-    images = data.images || [];
-    idx = 0;
     await renderTriplet();
   }
 
@@ -87,15 +158,15 @@
       ctx.fillStyle="#0b0b0c";
       ctx.fillRect(0,0,canvas.width,canvas.height);
     });
-    if (prevName) { await drawImageWithBoxes(prevCtx, prevName); }
-    if (currName) { await drawImageWithBoxes(currCtx, currName); }
-    if (nextName) { await drawImageWithBoxes(nextCtx, nextName); }
+    // Kick off decodes for the whole window before drawing, so the three draws overlap
+    prefetch().catch(e => console.error("Prefetch failed:", e));
+    await Promise.all([[prevCtx, prevName], [currCtx, currName], [nextCtx, nextName]]
+      .filter(([, name]) => name)
+      .map(([ctx, name]) => drawImageWithBoxes(ctx, name)));
     attachDrawHandlers(currName);
   }
   async function drawImageWithBoxes(ctx, name){
-    const img = new Image();
-    img.src = imgUrl(name);
-    await img.decode().catch(e => console.error("Image decode error:", e));
+    const img = await decodeImage(name);
 
     const { naturalWidth: w, naturalHeight: h } = img;
     const canvas = ctx.canvas;
@@ -111,7 +182,7 @@
     let anns = annsCache[name];
     if (!anns) {
       try {
-        const res = await fetch(`/api/annotation?image=${encodeURIComponent(name)}&t=${Date.now()}`, { cache: "no-store" });
+        const res = await fetch(`/api/annotation?image=${encodeURIComponent(name)}`);
         anns = await res.json();
         annsCache[name] = anns;
       } catch (e) {
@@ -247,10 +318,10 @@
         return;
       }
       isSaving = true; dragStart = null;
-      const updatedBoxes = await saveBox(currName, box);
-      annsCache[currName] = { ...(annsCache[currName] || {}), boxes: updatedBoxes };
+      // Advance straight away; the write is queued behind any earlier ones
+      saveBox(currName, box);
       localStorage.setItem("rb-last-label", box.label);
-      if (idx < images.length-1) idx += 1;
+      await advance();
       await renderTriplet();
       isSaving = false;
     }
@@ -258,19 +329,22 @@
     window.addEventListener("mouseup", onMouseUpOnce);
   }
 
-  async function saveBox(imageName, newBoxOrBoxes, overwrite = false){
-    try{
-      const existingAnns = annsCache[imageName] || { boxes: [] };
-      const existingBoxes = (existingAnns.boxes||[]).slice();
-      const newBoxes = Array.isArray(newBoxOrBoxes) ? newBoxOrBoxes : [newBoxOrBoxes];
-      const finalBoxes = overwrite ? newBoxes : [...existingBoxes, ...newBoxes];
-      await fetch("/api/annotate", { method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({ image:imageName, boxes: finalBoxes }) });
-      return finalBoxes;
-    }catch(e){ console.error("Save failed", e); return []; }
+  // Updates the local cache at once and returns a promise for the server write.
+  function saveBox(imageName, newBoxOrBoxes, overwrite = false){
+    const existingAnns = annsCache[imageName] || { boxes: [] };
+    const existingBoxes = (existingAnns.boxes||[]).slice();
+    const newBoxes = Array.isArray(newBoxOrBoxes) ? newBoxOrBoxes : [newBoxOrBoxes];
+    const finalBoxes = overwrite ? newBoxes : [...existingBoxes, ...newBoxes];
+    annsCache[imageName] = { ...existingAnns, boxes: finalBoxes };
+    saveChain = saveChain.then(async () => {
+      const res = await fetch("/api/annotate", { method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({ image:imageName, boxes: finalBoxes }) });
+      if (!res.ok) throw new Error(`annotate ${res.status}`);
+    }).catch(e => { console.error("Save failed", e); alert(`Saving ${imageName} failed.`); });
+    return saveChain;
   }
 
   async function goBack(){ if(idx>0){ idx-=1; await renderTriplet(); } }
-  async function skip(){ if(idx<images.length-1){ idx+=1; await renderTriplet(); } }
+  async function skip(){ const before = idx; await advance(); if(idx !== before) await renderTriplet(); }
   async function deleteCurrent(){
     const name = images[idx]; if(!name) return;
     if(!confirm(`Delete ${name} from this project? The image and its annotations will remain in the global catalog.`)) return;
@@ -286,9 +360,8 @@
     const name = images[idx]; if(!name) return;
     isSaving = true;
     const boxes = [{label: "__null__", x1: 0, y1: 0, x2: 0, y2: 0}];
-    const updatedBoxes = await saveBox(name, boxes, true); // Overwrite
-    annsCache[name] = { ...annsCache[name], boxes: updatedBoxes };
-    if (idx < images.length-1) idx += 1;
+    saveBox(name, boxes, true); // Overwrite
+    await advance();
     await renderTriplet();
     isSaving = false;
   }
@@ -11,4 +11,114 @@ function colorFromString(str) {
   }
   const h = Math.abs(hash % 360);
   return `hsl(${h}, 70%, 50%)`;
-}
\ No newline at end of file
+}
+
+const THUMB_SIZES = [112, 160, 224, 256];
+
+/**
+ * Builds a server-side thumbnail URL for a catalog image.
+ * Picks the smallest cached size that covers the tile at the device pixel ratio.
+ * @param {string} name The catalog image filename.
+ * @param {number} displaySize The tile edge in CSS pixels.
+ * @returns {string} The thumbnail URL.
+ */
+function thumbUrl(name, displaySize) {
+  const want = (displaySize || 112) * Math.min(window.devicePixelRatio || 1, 2);
+  const size = THUMB_SIZES.find(s => s >= want) || THUMB_SIZES[THUMB_SIZES.length - 1];
+  return versioned(`/thumb/${size}/${encodeURIComponent(name)}`, name);
+}
+
+/**
+ * Builds the full-size URL for a catalog image.
+ * @param {string} name The catalog image filename.
+ * @returns {string} The image URL.
+ */
+function imageUrl(name) {
+  return versioned(`/image/${encodeURIComponent(name)}`, name);
+}
+
+const IMAGE_VERSIONS = {};
+
+/**
+ * Records the per-image version tokens returned by the listing endpoints.
+ * @param {Object<string, string>} versions Map of image name to version.
+ */
+function rememberVersions(versions) {
+  Object.assign(IMAGE_VERSIONS, versions || {});
+}
+
+/**
+ * Appends the known version token so the server can mark the response immutable.
+ * @param {string} url The unversioned URL.
+ * @param {string} name The catalog image filename.
+ * @returns {string} The URL, with ?v= when the version is known.
+ */
+function versioned(url, name) {
+  const v = IMAGE_VERSIONS[name];
+  return v ? `${url}?v=${v}` : url;
+}
+
+/**
+ * POSTs JSON and revalidates against the last response kept in sessionStorage,
+ * since browsers never HTTP-cache POST responses themselves.
+ * @param {string} url The endpoint.
+ * @param {Object} payload The JSON request body.
+ * @returns {Promise<Object>} The (possibly cached) response body.
+ */
+async function postJsonCached(url, payload) {
+  const body = JSON.stringify(payload);
+  const key = `rb-cache:${url}:${body}`;
+  let cached = null;
+  try { cached = JSON.parse(sessionStorage.getItem(key) || "null"); } catch (e) { cached = null; }
+
+  const headers = { "Content-Type": "application/json" };
+  if (cached && cached.etag) headers["If-None-Match"] = cached.etag;
+  const res = await fetch(url, { method: "POST", headers, body });
+  if (res.status === 304 && cached) return cached.data;
+  if (!res.ok) throw new Error(`${url} ${res.status}`);
+
+  const data = await res.json();
+  const etag = res.headers.get("ETag");
+  if (etag) {
+    const entry = JSON.stringify({ etag, data });
+    try {
+      sessionStorage.setItem(key, entry);
+    } catch (e) {
+      // Quota exceeded: drop our old entries and try once more
+      Object.keys(sessionStorage).filter(k => k.startsWith("rb-cache:")).forEach(k => sessionStorage.removeItem(k));
+      try { sessionStorage.setItem(key, entry); } catch (e2) { /* not cacheable */ }
+    }
+  }
+  return data;
+}
+
+/**
+ * Formats a background job's progress for display.
+ * @param {object} job A job as returned by /api/jobs/<id>.
+ * @returns {string} e.g. "120 / 500 (24%) — 35 MB — ~12s left".
+ */
+function formatJobProgress(job) {
+  if (!job.total) return job.status === "queued" ? "Queued…" : "Working…";
+  const pct = Math.floor((job.done / job.total) * 100);
+  let text = `${job.done} / ${job.total} (${pct}%)`;
+  if (job.bytes) text += ` — ${(job.bytes / 1048576).toFixed(1)} MB`;
+  if (job.eta_seconds != null) text += ` — ~${Math.ceil(job.eta_seconds)}s left`;
+  return text;
+}
+
+/**
+ * Polls a background job until it finishes.
+ * @param {string} jobId The job id returned by the enqueueing endpoint.
+ * @param {function(object):void} onProgress Called with the job after every poll.
+ * @returns {Promise<object>} The finished job (status done, failed or cancelled).
+ */
+async function pollJob(jobId, onProgress) {
+  for (;;) {
+    const res = await fetch(`/api/jobs/${jobId}`);
+    if (!res.ok) throw new Error(`job ${res.status}`);
+    const job = await res.json();
+    if (onProgress) onProgress(job);
+    if (["done", "failed", "cancelled"].includes(job.status)) return job;
+    await new Promise(r => setTimeout(r, 1000));
+  }
+}
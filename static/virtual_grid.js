@@ -0,0 +1,165 @@
+/**
+ * Virtualized, infinitely scrolling grid of square image tiles.
+ *
+ * Only the rows in (and just around) the viewport are mounted; tiles that scroll
+ * out are recycled for the ones scrolling in, so the DOM stays a few hundred
+ * nodes whatever the listing size. Names are pulled from a cursor-paginated
+ * endpoint as the user scrolls.
+ *
+ * options:
+ *   fetchPage(cursor, limit) -> Promise<{images, next_cursor, total?, versions?}>
+ *   createTile() -> HTMLElement       builds an empty tile
+ *   renderTile(tile, name, index)     fills a (possibly recycled) tile
+ *   onRangeChange(names, first, last) called after the mounted range changes
+ *   tileSize, gap, pageSize, overscanRows
+ */
+class VirtualGrid {
+  constructor(container, options) {
+    this.container = container;
+    this.opts = Object.assign({ tileSize: 112, gap: 10, pageSize: 200, overscanRows: 3 }, options);
+    this.items = [];
+    this.total = 0;
+    this.cursor = "";
+    this.done = false;
+    this.loading = null;
+    this.generation = 0;
+    this.mounted = new Map(); // index -> tile
+    this.free = [];
+    this.range = [0, -1];
+    this.layout = { cols: 0, size: this.opts.tileSize, row: this.opts.tileSize + this.opts.gap, padLeft: 0, padTop: 0 };
+
+    container.classList.add("vgrid");
+    this.sizer = document.createElement("div");
+    this.sizer.className = "vgrid-sizer";
+    container.appendChild(this.sizer);
+
+    let queued = false;
+    this.schedule = () => {
+      if (queued) return;
+      queued = true;
+      requestAnimationFrame(() => { queued = false; this.update(); });
+    };
+    window.addEventListener("scroll", this.schedule, { passive: true });
+    window.addEventListener("resize", () => { this.measure(); this.update(true); });
+  }
+
+  /** Drops all loaded names and reloads from the first page, keeping the scroll position. */
+  async reload() {
+    this.generation += 1;
+    this.items = [];
+    this.cursor = ""; this.done = false; this.loading = null; this.total = 0;
+    this.unmountAll();
+    await this.loadMore();
+    this.update(true);
+  }
+
+  setTileSize(px) {
+    this.opts.tileSize = px;
+    this.measure();
+    this.update(true);
+  }
+
+  /** Re-renders every mounted tile in place (e.g. after a selection change). */
+  refresh() {
+    this.mounted.forEach((tile, i) => this.opts.renderTile(tile, this.items[i], i));
+  }
+
+  forEachMounted(fn) {
+    this.mounted.forEach((tile, i) => fn(tile, this.items[i], i));
+  }
+
+  /** Scrolls by a number of viewport heights (negative scrolls up). */
+  scrollPages(n) {
+    window.scrollBy({ top: n * Math.max(this.layout.row, window.innerHeight - this.layout.row) });
+  }
+
+  get count() {
+    return Math.max(this.total, this.items.length);
+  }
+
+  async loadMore(want) {
+    if (this.done) return;
+    if (this.loading) return this.loading;
+    const gen = this.generation;
+    // Jumping far down the scrollbar fetches the gap in one request rather than page by page
+    const limit = Math.min(5000, Math.max(this.opts.pageSize, (want || 0) - this.items.length));
+    this.loading = (async () => {
+      const data = await this.opts.fetchPage(this.cursor, limit);
+      if (gen !== this.generation) return;
+      if (data.total !== undefined) this.total = data.total;
+      rememberVersions(data.versions);
+      const page = data.images || [];
+      this.items.push(...page);
+      this.cursor = data.next_cursor || "";
+      this.done = !data.next_cursor;
+      if (this.done) this.total = this.items.length;
+    })().finally(() => { if (gen === this.generation) this.loading = null; });
+    return this.loading;
+  }
+
+  measure() {
+    const style = getComputedStyle(this.container);
+    const padLeft = parseFloat(style.paddingLeft) || 0;
+    const padTop = parseFloat(style.paddingTop) || 0;
+    const width = this.container.clientWidth - padLeft - (parseFloat(style.paddingRight) || 0);
+    const gap = this.opts.gap;
+    const cols = Math.max(1, Math.floor((width + gap) / (this.opts.tileSize + gap)));
+    const size = Math.floor((width - (cols - 1) * gap) / cols);
+    this.layout = { cols, size, row: size + gap, padLeft, padTop };
+  }
+
+  unmountAll() {
+    this.mounted.forEach(tile => { tile.style.display = "none"; this.free.push(tile); });
+    this.mounted.clear();
+    this.range = [0, -1];
+  }
+
+  update(force = false) {
+    if (!this.layout.cols || force) this.measure();
+    const { cols, size, row, padLeft, padTop } = this.layout;
+    const count = this.count;
+    const rows = Math.ceil(count / cols);
+    this.sizer.style.height = `${Math.max(0, rows * row - this.opts.gap)}px`;
+
+    const top = -this.container.getBoundingClientRect().top - padTop;
+    const firstRow = Math.max(0, Math.floor(top / row) - this.opts.overscanRows);
+    const lastRow = Math.min(rows - 1, Math.ceil((top + window.innerHeight) / row) + this.opts.overscanRows);
+    const first = firstRow * cols;
+    const last = Math.min(count, (lastRow + 1) * cols) - 1;
+
+    if (last >= this.items.length - cols && !this.done) {
+      this.loadMore(last + 1 + this.opts.pageSize).then(() => this.schedule());
+    }
+
+    // Indices past the loaded names stay blank until their page arrives
+    const end = Math.min(last, this.items.length - 1);
+    if (!force && first === this.range[0] && end === this.range[1]) return;
+    this.range = [first, end];
+
+    this.mounted.forEach((tile, i) => {
+      if (i < first || i > end) {
+        tile.style.display = "none";
+        this.free.push(tile);
+        this.mounted.delete(i);
+      }
+    });
+    for (let i = first; i <= end; i++) {
+      let tile = this.mounted.get(i);
+      const fresh = !tile;
+      if (fresh) {
+        tile = this.free.pop() || this.container.appendChild(this.opts.createTile());
+        this.mounted.set(i, tile);
+      }
+      const x = padLeft + (i % cols) * (size + this.opts.gap);
+      const y = padTop + Math.floor(i / cols) * row;
+      tile.style.display = "";
+      tile.style.width = `${size}px`;
+      tile.style.height = `${size}px`;
+      tile.style.transform = `translate(${x}px, ${y}px)`;
+      if (fresh || force) this.opts.renderTile(tile, this.items[i], i);
+    }
+    if (this.opts.onRangeChange) {
+      this.opts.onRangeChange(this.items.slice(first, end + 1), first, end);
+    }
+  }
+}
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TMP = tempfile.mkdtemp(prefix="reviewbox-tests-")
+os.environ.update(
+    RB_PROJECTS_DIR=os.path.join(_TMP, "projects"),
+    RB_RAW_IMAGES_DIR=os.path.join(_TMP, "raw"),
+    RB_IMAGE_CATALOG_DIR=os.path.join(_TMP, "catalog"),
+    RB_ANNOTATION_CATALOG_DIR=os.path.join(_TMP, "annotations"),
+    RB_THUMB_CACHE_DIR=os.path.join(_TMP, "thumbs"),
+    RB_WATCH="off",
+    RB_FSYNC="0",
+)
+for d in ("projects", "raw", "catalog", "annotations"):
+    os.makedirs(os.path.join(_TMP, d), exist_ok=True)
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app
+    client = app.app.test_client()
+    deadline = time.time() + 30
+    while not client.get("/api/status").get_json()["ready"] and time.time() < deadline:
+        time.sleep(0.02)
+    client.post("/api/project/create", json={"name": "default"})
+    client.post("/api/project/switch", json={"name": "default"})
+    return app
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+@pytest.fixture
+def make_image(app_module):
+    """Write a catalog image and return its name."""
+    def make(name, size=(64, 48), color=(0, 128, 0), directory=None):
+        path = os.path.join(directory or app_module.IMAGE_CATALOG_DIR, name)
+        Image.new("RGB", size, color).save(path)
+        return name
+    return make
+
+@pytest.fixture
+def wait_job(client):
+    def wait(response, timeout=30):
+        assert response.status_code == 202, response.data
+        job_id = response.get_json()["job_id"]
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = client.get(f"/api/jobs/{job_id}").get_json()
+            if job["status"] in ("done", "failed", "cancelled"):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"job {job_id} did not finish")
+    return wait
@@ -0,0 +1,67 @@
+"""Annotate, relabel and export through the API, then print what the exports hold as JSON.
+
+Run in a fresh process (the annotation store is chosen at import time) by
+test_store_parity.py, once per RB_ANNOTATION_STORE.
+"""
+import json
+import os
+import time
+import zipfile
+
+from PIL import Image
+
+import app
+
+client = app.app.test_client()
+while not client.get("/api/status").get_json()["ready"]:
+    time.sleep(0.02)
+client.post("/api/project/create", json={"name": "parity"})
+client.post("/api/project/switch", json={"name": "parity"})
+
+
+def wait(response):
+    assert response.status_code == 202, response.data
+    url = response.get_json()["job_url"]
+    while True:
+        job = client.get(url).get_json()
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        time.sleep(0.02)
+
+
+boxes = {
+    "p_cat_dog.jpg": [{"label": "cat", "x1": 1, "y1": 2, "x2": 30, "y2": 20},
+                      {"label": "dog", "x1": 5, "y1": 5, "x2": 60, "y2": 40}],
+    "p_cat.jpg": [{"label": "cat", "x1": 0, "y1": 0, "x2": 10, "y2": 10}],
+    "p_null.jpg": [{"label": "__null__", "x1": 0, "y1": 0, "x2": 64, "y2": 48}],
+    "p_bare.jpg": [],
+}
+for i, (name, image_boxes) in enumerate(boxes.items()):
+    Image.new("RGB", (64, 48), (50 * i, 80, 0)).save(os.path.join(app.IMAGE_CATALOG_DIR, name))
+    app.CATALOG_LISTING.add([name])
+    assert client.post("/api/annotate", json={"image": name, "boxes": image_boxes}).status_code == 200
+client.post("/api/catalog/add_to_project", json={"files": list(boxes)})
+
+relabel = wait(client.post("/api/catalog/relabel", json={"remap": [{"from": ["cat"], "to": "feline"}]}))
+options = {"classes": ["feline", "dog"], "null_handling": "unclassified"}
+# Exports and a second relabel run on the job pool at the same time
+concurrent = [client.post("/api/export_voc", json=options), client.post("/api/export_yolo", json=options),
+              client.post("/api/catalog/relabel", json={"remap": [{"from": ["dog"], "to": "dog"}, {"from": ["mouse"], "to": "rat"}]})]
+jobs = [wait(r) for r in concurrent]
+
+exports = app.get_project_dirs("parity")["exports"]
+out = {"relabel": relabel["result"]["changed"], "statuses": [relabel["status"]] + [j["status"] for j in jobs],
+       "classes": client.get("/api/classes").get_json()["classes"]}
+for fmt, job in zip(("voc", "yolo"), jobs[:2]):
+    members = {}
+    with zipfile.ZipFile(os.path.join(exports, job["result"]["zip_name"])) as zf:
+        for member in sorted(zf.namelist()):
+            data = zf.read(member)
+            if member.endswith(".xml"):
+                members[member] = app.voc_entry_from_root(app.ET.fromstring(data))
+            elif member.endswith((".txt", ".yaml")):
+                members[member] = data.decode()
+            else:
+                members[member] = len(data)
+    out[fmt] = members
+print(json.dumps(out, sort_keys=True, default=sorted))  # entries carry a set of class names
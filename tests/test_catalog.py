@@ -0,0 +1,29 @@
+def test_available_images_cached_until_listing_or_project_changes(app_module, client, make_image, monkeypatch):
+    make_image("avail_a.jpg")
+    names = client.get("/api/catalog/available?page_size=10000").get_json()["images"]
+    assert "avail_a.jpg" in names and names == sorted(names)
+
+    listed = []
+    names_of = app_module.CATALOG_LISTING.names
+    monkeypatch.setattr(app_module.CATALOG_LISTING, "names", lambda: listed.append(1) or names_of())
+    client.get("/api/catalog/available?page=2&page_size=1")
+    assert listed == []  # paging reuses the cached difference
+
+    app_module.add_project_images("default", ["avail_a.jpg"])
+    assert "avail_a.jpg" not in client.get("/api/catalog/available?page_size=10000").get_json()["images"]
+    make_image("avail_b.jpg")
+    assert "avail_b.jpg" in client.get("/api/catalog/available?page_size=10000").get_json()["images"]
+
+
+def test_catalog_images_page_and_cursor_modes_agree(app_module, client, make_image):
+    outside = make_image("catmode_outside.jpg")  # in the catalog, not in any project
+    boxed = make_image("catmode_boxed.jpg")
+    assert client.post("/api/annotate", json={"image": boxed, "boxes": [
+        {"label": "shrew", "x1": 1, "y1": 1, "x2": 20, "y2": 20}]}).status_code == 200
+
+    for class_filter in ("__unannotated__", "shrew"):
+        paged = client.get(f"/api/catalog/images?class_filter={class_filter}&page_size=100000").get_json()
+        cursor = client.get(f"/api/catalog/images?class_filter={class_filter}&cursor=&page_size=100000").get_json()
+        assert paged["images"] == cursor["images"] and paged["total"] == cursor["total"]
+    assert outside in client.get("/api/catalog/images?class_filter=__unannotated__&page_size=100000").get_json()["images"]
+    assert client.get("/api/catalog/images?class_filter=shrew&page_size=100000").get_json()["images"] == [boxed]
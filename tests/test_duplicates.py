@@ -0,0 +1,34 @@
+import threading
+import time
+
+
+def test_hash_scan_keeps_clusters_until_it_finishes(app_module, client, make_image, monkeypatch):
+    names = [make_image(f"dup_{i}.jpg", color=(40 * i, 0, 0)) for i in range(4)]
+    app_module.add_project_images("default", names)
+    release = threading.Event()
+    dhash = app_module.image_dhash
+
+    def slow_dhash(path):
+        release.wait(10)
+        return dhash(path)
+
+    monkeypatch.setattr(app_module, "image_dhash", slow_dhash)
+    job = app_module.start_hash_scan("catalog")
+    try:
+        before = app_module.get_meta("image_hashes_version")
+
+        def no_clustering(*args):
+            raise AssertionError("listing re-clustered during a scan")
+
+        monkeypatch.setattr(app_module, "hash_clusters", no_clustering)
+        resp = client.get("/api/images?page_size=1000&collapse=1")
+        assert resp.status_code == 200
+        assert set(names) <= set(resp.get_json()["images"])
+        assert app_module.get_meta("image_hashes_version") == before
+    finally:
+        monkeypatch.undo()
+        release.set()
+    deadline = time.time() + 30
+    while job.finished is None and time.time() < deadline:
+        time.sleep(0.02)
+    assert app_module.get_meta("image_hashes_version") != before
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+import zipfile
+
+
+def test_full_export_hashes_images_while_copying(app_module, client, make_image, wait_job):
+    name = make_image("export_full.jpg")
+    assert client.post("/api/annotate", json={"image": name, "boxes": [
+        {"label": "rat", "x1": 1, "y1": 1, "x2": 20, "y2": 20}]}).status_code == 200
+    app_module.add_project_images("default", [name])
+    job = wait_job(client.post("/api/export_voc", json={"classes": ["rat"]}))
+    assert job["status"] == "done", job
+
+    path = os.path.join(app_module.IMAGE_CATALOG_DIR, name)
+    row = app_module.get_db().execute("SELECT sha1 FROM file_hashes WHERE path = ?", (path,)).fetchone()
+    assert row is not None
+    members = json.loads(app_module.get_db().execute(
+        "SELECT members FROM exports WHERE project = 'default' ORDER BY created DESC LIMIT 1").fetchone()[0])
+    assert row[0] in members.values()
+
+
+def test_prune_keeps_user_folders_and_delta_bases(app_module, monkeypatch):
+    exports = app_module.get_project_dirs("default")["exports"]
+    os.makedirs(os.path.join(exports, "my_notes"), exist_ok=True)
+    os.makedirs(os.path.join(exports, "VOC_20200101_000000"), exist_ok=True)
+    future = time.time() + 3600  # newer than any ZIP the other tests left behind
+    chain = ["VOC_20200101_000001.zip", "VOC_20200101_000002_delta.zip", "VOC_20200101_000003_delta.zip"]
+    with app_module.get_db() as conn:
+        for i, zip_name in enumerate(chain):
+            with zipfile.ZipFile(os.path.join(exports, zip_name), "w"):
+                pass
+            os.utime(os.path.join(exports, zip_name), (future + i, future + i))
+            conn.execute("INSERT OR REPLACE INTO exports (project, zip_name, options_key, base, created, members) "
+                         "VALUES ('default', ?, 'prune-test', ?, ?, '{}')",
+                         (zip_name, chain[i - 1] if i else None, 1000 + i))
+    monkeypatch.setattr(app_module, "EXPORT_KEEP", 1)
+    app_module.prune_exports("default", exports)
+
+    left = set(os.listdir(exports))
+    assert "my_notes" in left
+    assert "VOC_20200101_000000" not in left
+    assert set(chain) <= left
+    assert not any(n.endswith(".zip") and n not in chain for n in left)
+
+
+def test_exports_queued_in_the_same_second_stay_apart(app_module, client, make_image, wait_job):
+    name = make_image("export_twice.jpg")
+    assert client.post("/api/annotate", json={"image": name, "boxes": [
+        {"label": "rat", "x1": 1, "y1": 1, "x2": 20, "y2": 20}]}).status_code == 200
+    app_module.add_project_images("default", [name])
+    first = client.post("/api/export_voc", json={"classes": ["rat"]})
+    second = client.post("/api/export_voc", json={"classes": ["rat"]})
+    jobs = [wait_job(first), wait_job(second)]
+    assert [j["status"] for j in jobs] == ["done", "done"], jobs
+    zip_names = [j["result"]["zip_name"] for j in jobs]
+    assert zip_names[0] != zip_names[1]
+
+    exports = app_module.get_project_dirs("default")["exports"]
+    for zip_name in zip_names:
+        with zipfile.ZipFile(os.path.join(exports, zip_name)) as zf:
+            assert zf.testzip() is None and f"JPEGImages/{name}" in zf.namelist()
+    rows = app_module.get_db().execute(
+        f"SELECT zip_name FROM exports WHERE zip_name IN ({','.join('?' * len(zip_names))})", zip_names).fetchall()
+    assert len(rows) == 2
@@ -0,0 +1,24 @@
+import io
+import os
+import zipfile
+
+from PIL import Image
+
+def jpeg_bytes(size=(320, 240)):
+    buf = io.BytesIO()
+    Image.effect_noise(size, 40).convert("RGB").save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+def test_import_rejects_truncated_jpeg(app_module, client, wait_job):
+    good = jpeg_bytes()
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("import_good.jpg", good)
+        zf.writestr("import_truncated.jpg", good[:len(good) // 2])
+    job = wait_job(client.post("/api/import_images", data={"file": (io.BytesIO(buf.getvalue()), "images.zip")},
+                               content_type="multipart/form-data"))
+    assert job["status"] == "done", job
+    assert job["result"]["imported"] == 1
+    assert any("import_truncated.jpg" in f for f in job["result"]["failed_files"])
+    assert os.path.exists(os.path.join(app_module.IMAGE_CATALOG_DIR, "import_good.jpg"))
+    assert not os.path.exists(os.path.join(app_module.IMAGE_CATALOG_DIR, "import_truncated.jpg"))
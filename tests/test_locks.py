@@ -0,0 +1,57 @@
+import io
+import threading
+import zipfile
+
+
+def stripe_of(app_module, name):
+    path = app_module.os.path.abspath(app_module.catalog_voc_xml_path(name))
+    return app_module._file_locks[app_module.zlib.crc32(path.encode()) % app_module._FILE_LOCK_STRIPES]
+
+
+def held_by_another_thread(lock):
+    """True if `lock` is taken, asked from a thread that doesn't hold it."""
+    free = []
+
+    def probe():
+        if lock.acquire(blocking=False):
+            lock.release()
+            free.append(True)
+
+    t = threading.Thread(target=probe)
+    t.start()
+    t.join(5)
+    return not free
+
+
+def test_catalog_delete_holds_the_annotation_lock(app_module, client, make_image, monkeypatch):
+    name = make_image("lock_delete.jpg")
+    seen = []
+    delete = app_module.ANNOTATION_STORE.delete
+
+    def checked_delete(img):
+        seen.append(held_by_another_thread(stripe_of(app_module, img)))
+        return delete(img)
+
+    monkeypatch.setattr(app_module.ANNOTATION_STORE, "delete", checked_delete)
+    assert client.post("/api/catalog/delete", json={"files": [name]}).get_json()["deleted_count"] == 1
+    assert seen == [True]
+
+
+def test_voc_import_writes_annotations_under_the_lock(app_module, client, wait_job, monkeypatch):
+    seen = []
+    write = app_module.ANNOTATION_STORE.write
+
+    def checked_write(img, entry, xml=None):
+        seen.append(held_by_another_thread(stripe_of(app_module, img)))
+        return write(img, entry, xml=xml)
+
+    monkeypatch.setattr(app_module.ANNOTATION_STORE, "write", checked_write)
+    xml = app_module.entry_to_voc_xml(app_module.voc_entry("lock_import.jpg", 64, 48, [
+        {"label": "rat", "x1": 1, "y1": 1, "x2": 9, "y2": 9}]))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("lock_import.xml", xml)
+    job = wait_job(client.post("/api/import_voc", data={"file": (io.BytesIO(buf.getvalue()), "voc.zip")},
+                               content_type="multipart/form-data"))
+    assert job["status"] == "done", job
+    assert seen == [True]
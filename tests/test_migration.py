@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_import_survives_corrupt_legacy_files(tmp_path):
+    """Legacy JSON is migrated at import time; an unreadable file is logged and skipped."""
+    dirs = {key: tmp_path / key.lower() for key in (
+        "RB_PROJECTS_DIR", "RB_RAW_IMAGES_DIR", "RB_IMAGE_CATALOG_DIR", "RB_ANNOTATION_CATALOG_DIR", "RB_THUMB_CACHE_DIR")}
+    for d in dirs.values():
+        d.mkdir()
+    (dirs["RB_PROJECTS_DIR"] / "image_categories.json").write_text("{bad")
+    (dirs["RB_PROJECTS_DIR"] / "classes.json").write_text("[oops")
+    (dirs["RB_PROJECTS_DIR"] / "legacy").mkdir()
+    (dirs["RB_PROJECTS_DIR"] / "legacy" / "project_images.txt").write_text("a.jpg\nb.jpg\n")
+    env = dict(os.environ, RB_WATCH="off", RB_FSYNC="0", **{k: str(v) for k, v in dirs.items()})
+    env.pop("RB_METADATA_DB", None)
+    script = ("import app; print(app.get_meta('legacy_files_migrated') is not None, "
+              "sorted(app.list_project_images('legacy')))")
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split("\n")[0] == "True ['a.jpg', 'b.jpg']"
+    assert "Skipping unreadable" in result.stderr
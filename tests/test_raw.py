@@ -0,0 +1,40 @@
+import json
+import os
+import stat
+
+def test_raw_accept_takes_text_plain_beacon_body(app_module, client, make_image):
+    os.makedirs(os.path.join(app_module.RAW_IMAGES_DIR, "beacon"), exist_ok=True)
+    make_image("frame.jpg", directory=os.path.join(app_module.RAW_IMAGES_DIR, "beacon"))
+    body = json.dumps({"files": [os.path.join("beacon", "frame.jpg")], "label": "rat"})
+    r = client.post("/api/raw/accept", data=body, content_type="text/plain")
+    assert r.status_code == 200, r.data
+    assert os.path.exists(os.path.join(app_module.IMAGE_CATALOG_DIR, "beacon_frame.jpg"))
+    entry = app_module.ANNOTATION_STORE.entry("beacon_frame.jpg")
+    assert [b["label"] for b in entry["boxes"]] == ["rat"]
+
+def test_raw_browser_walks_the_tree_once_per_interval(app_module, client, make_image, monkeypatch):
+    folder = os.path.join(app_module.RAW_IMAGES_DIR, "walk")
+    os.makedirs(folder, exist_ok=True)
+    make_image("a.jpg", directory=folder)
+    monkeypatch.setattr(app_module.RAW_TREE, "min_interval", 60)
+    app_module.RAW_TREE.expire()
+    stats = []
+    real_stat = os.stat
+    def counting_stat(path, *args, **kwargs):
+        st = real_stat(path, *args, **kwargs)
+        if stat.S_ISDIR(st.st_mode):
+            stats.append(path)
+        return st
+
+    monkeypatch.setattr(app_module.os, "stat", counting_stat)
+
+    assert client.get("/api/raw_browser?path=walk").get_json()["total"] == 1
+    walked = len(stats)
+    assert walked == len(app_module.RAW_TREE._dirs)  # each folder once, not once per listing
+    make_image("b.jpg", directory=folder)
+    assert client.get("/api/raw_browser?path=walk").get_json()["total"] == 1
+    assert len(stats) == walked
+
+    client.post("/api/raw/delete", json={"files": [os.path.join("walk", "a.jpg")]})
+    # the app's own changes show up at once, along with b.jpg
+    assert [i["name"] for i in client.get("/api/raw_browser?path=walk").get_json()["items"]] == ["b.jpg"]
@@ -0,0 +1,11 @@
+def test_relabel_job_errors_carry_the_reason(app_module, client, make_image, wait_job, monkeypatch):
+    name = make_image("relabel_broken.jpg")
+    assert client.post("/api/annotate", json={"image": name, "boxes": [
+        {"label": "gerbil", "x1": 1, "y1": 1, "x2": 20, "y2": 20}]}).status_code == 200
+    monkeypatch.setattr(app_module.ANNOTATION_STORE, "remap_labels",
+                        lambda names, remap: ([], [(n, "mismatched tag: line 1") for n in names]))
+
+    job = wait_job(client.post("/api/catalog/relabel", json={
+        "files": [name], "remap": [{"from": ["gerbil"], "to": "rodent"}]}))
+    assert job["status"] == "done", job
+    assert job["errors"] == [f"{name}: mismatched tag: line 1"]
@@ -0,0 +1,19 @@
+import os
+
+
+def test_review_batch_matches_grid_order_and_reports_missing(app_module, client, make_image):
+    names = [make_image(f"order_{c}.jpg") for c in "cab"]
+    for i, name in enumerate(names):  # newest first: order_c, order_a, order_b
+        t = 2_000_000_000 - i
+        os.utime(os.path.join(app_module.IMAGE_CATALOG_DIR, name), (t, t))
+    app_module.CATALOG_LISTING.add(names)
+    app_module.add_project_images("default", names + ["order_gone.jpg"])
+
+    for params in ("", "&status=unannotated"):
+        grid = client.get(f"/api/query?project=default&cursor=&page_size=10000{params}").get_json()
+        assert grid["missing"] >= 1
+        review_class = "&class=__unannotated__" if params else ""
+        review = client.get(f"/api/review/batch?count=200{review_class}").get_json()
+        assert review["missing"] == grid["missing"]
+        assert [n for n in review["images"] if n.startswith("order_")] == names
+        assert [n for n in grid["images"] if n.startswith("order_")] == names
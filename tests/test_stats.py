@@ -0,0 +1,50 @@
+def test_catalog_stats_ignore_orphan_annotations(app_module, client, make_image):
+    name = make_image("stats_kept.jpg")
+    assert client.post("/api/annotate", json={"image": name, "boxes": [
+        {"label": "rat", "x1": 1, "y1": 1, "x2": 20, "y2": 20}]}).status_code == 200
+    before = client.get("/api/stats").get_json()
+
+    # An annotation whose image is not in the catalog
+    boxes = [{"label": "orphan", "x1": 1, "y1": 1, "x2": 9, "y2": 9}]
+    app_module.ANNOTATION_STORE.write("stats_orphan.jpg", app_module.voc_entry("stats_orphan.jpg", 64, 48, boxes))
+    app_module.ANNOTATION_INDEX.refresh("stats_orphan.jpg")
+    assert "stats_orphan" in app_module.ANNOTATION_INDEX.stems()
+
+    after = client.get("/api/stats").get_json()
+    assert after["images"] == before["images"]
+    assert after["annotated"] == before["annotated"] <= after["images"]
+    assert after["unannotated"] == before["unannotated"] >= 0
+    assert "orphan" not in after["classes"]
+    assert after["classes"]["rat"]["images"] >= 1
+
+
+def test_catalog_stats_follow_edits_without_rescanning_the_index(app_module, client, make_image):
+    name = make_image("stats_edit.jpg")
+    client.get("/api/stats")  # finds the orphans for this listing version
+
+    class NoFullPass(dict):
+        def __iter__(self):
+            raise AssertionError("full pass over the annotation index")
+
+    index = app_module.ANNOTATION_INDEX
+    index._entries = NoFullPass(index._entries)
+    try:
+        check_stats_follow_edits(app_module, client, name)
+    finally:
+        index._entries = dict(index._entries)  # keeps the entries written meanwhile
+
+
+def check_stats_follow_edits(app_module, client, name):
+    before = client.get("/api/stats").get_json()
+
+    assert client.post("/api/annotate", json={"image": name, "boxes": [
+        {"label": "vole", "x1": 1, "y1": 1, "x2": 20, "y2": 20}]}).status_code == 200
+    boxes = [{"label": "ghost", "x1": 1, "y1": 1, "x2": 9, "y2": 9}]
+    app_module.ANNOTATION_STORE.write("stats_ghost.jpg", app_module.voc_entry("stats_ghost.jpg", 64, 48, boxes))
+    app_module.ANNOTATION_INDEX.refresh("stats_ghost.jpg")
+
+    after = client.get("/api/stats").get_json()
+    assert after["annotated"] == before["annotated"] + 1
+    assert after["boxes"] == before["boxes"] + 1
+    assert after["classes"]["vole"] == {"boxes": 1, "images": 1}
+    assert "ghost" not in after["classes"]
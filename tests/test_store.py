@@ -0,0 +1,38 @@
+import threading
+import time
+
+import pytest
+
+
+def test_first_start_import_runs_once_across_workers(app_module, monkeypatch):
+    with app_module.get_db() as conn:
+        conn.execute("DELETE FROM meta WHERE key = 'annotation_store_imported'")
+    calls = []
+
+    def fake_import(job):
+        calls.append(job)
+        time.sleep(0.3)  # long enough for every worker to find the claim
+        with app_module.get_db() as conn:
+            app_module.set_meta(conn, "annotation_store_imported", "1")
+
+    monkeypatch.setattr(app_module, "run_store_import", fake_import)
+    workers = [threading.Thread(target=app_module.import_store_once) for _ in range(4)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join(10)
+    assert len(calls) == 1
+    assert app_module.get_meta("annotation_store_imported") == "1"
+
+
+def test_failed_import_releases_the_claim(app_module, monkeypatch):
+    with app_module.get_db() as conn:
+        conn.execute("DELETE FROM meta WHERE key = 'annotation_store_imported'")
+
+    def failing_import(job):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(app_module, "run_store_import", failing_import)
+    with pytest.raises(OSError):
+        app_module.import_store_once()
+    assert app_module.get_meta("annotation_store_imported") is None
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def run_scenario(tmp_path, store):
+    dirs = {key: tmp_path / store / key.lower() for key in (
+        "RB_PROJECTS_DIR", "RB_RAW_IMAGES_DIR", "RB_IMAGE_CATALOG_DIR", "RB_ANNOTATION_CATALOG_DIR", "RB_THUMB_CACHE_DIR")}
+    for d in dirs.values():
+        d.mkdir(parents=True)
+    env = dict(os.environ, PYTHONPATH=ROOT, RB_WATCH="off", RB_FSYNC="0", RB_ANNOTATION_STORE=store,
+               **{k: str(v) for k, v in dirs.items()})
+    env.pop("RB_METADATA_DB", None)
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "tests", "store_scenario.py")], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    xml_files = [f for f in os.listdir(dirs["RB_ANNOTATION_CATALOG_DIR"]) if f.endswith(".xml")]
+    return json.loads(result.stdout.strip().splitlines()[-1]), xml_files
+
+
+def test_compact_store_exports_and_relabels_like_xml(tmp_path):
+    (xml, xml_files), (compact, compact_files) = run_scenario(tmp_path, "xml"), run_scenario(tmp_path, "compact")
+    assert xml_files and not compact_files  # each run really used its own store
+    assert xml["statuses"] == ["done"] * 4
+    assert xml["relabel"] == 2
+    assert "Annotations/p_cat_dog.xml" in xml["voc"] and "labels/train/p_cat.txt" in xml["yolo"]
+    assert [b["label"] for b in xml["voc"]["Annotations/p_cat_dog.xml"]["boxes"]] == ["feline", "dog"]
+    assert compact == xml
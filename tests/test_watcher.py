@@ -0,0 +1,30 @@
+import threading
+
+
+def test_dead_watcher_hands_change_detection_back_to_the_listing(app_module, make_image, monkeypatch):
+    listing = app_module.CATALOG_LISTING
+    watcher = app_module.CatalogWatcher(app_module.IMAGE_CATALOG_DIR, None, "poll")
+    stopped = threading.Event()
+
+    def broken_poll():
+        stopped.set()
+        raise OSError("catalog folder unmounted")
+
+    class EagerThread(threading.Thread):
+        """Runs to completion inside start(): the watcher dies before ensure_started returns."""
+
+        def start(self):
+            super().start()
+            self.join(5)
+
+    monkeypatch.setattr(watcher, "_run_poll", broken_poll)
+    monkeypatch.setattr(app_module.threading, "Thread", EagerThread)
+    monkeypatch.setattr(listing, "watched", False)
+    listing.files()
+    watcher.ensure_started()
+    monkeypatch.setattr(app_module.threading, "Thread", threading.Thread)
+    assert stopped.is_set()
+    assert listing.watched is False and watcher.backend is None
+
+    make_image("after_watcher_died.jpg")
+    assert "after_watcher_died.jpg" in listing.files()
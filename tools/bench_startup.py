@@ -0,0 +1,77 @@
+"""Startup benchmark: time to import app.py (i.e. before it can serve) and until
+background reconciliation finishes, on a synthetic catalog.
+
+    python tools/bench_startup.py [images] [annotated fraction]
+
+Runs each start in a fresh interpreter: first without an annotation index snapshot
+(first start), then with the one the first run saved (every later restart).
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import os, sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+imported = time.perf_counter() - t0
+client = app.app.test_client()
+first = time.perf_counter()
+client.get("/api/status")
+first = time.perf_counter() - first
+while True:
+    status = client.get("/api/status").get_json()
+    if status["ready"]:
+        break
+    time.sleep(0.02)
+print(json.dumps({"import": imported, "first_request": first, "ready": time.perf_counter() - t0,
+                  "result": status["reconcile"]["result"]}))
+"""
+
+XML = ("<annotation><filename>{name}</filename><size><width>640</width><height>480</height>"
+       "<depth>3</depth></size><object><name>{label}</name><bndbox><xmin>1</xmin><ymin>2</ymin>"
+       "<xmax>30</xmax><ymax>40</ymax></bndbox></object></annotation>")
+
+def make_catalog(root, images, annotated):
+    cat, ann = os.path.join(root, "catalog"), os.path.join(root, "annotations")
+    os.makedirs(cat)
+    os.makedirs(ann)
+    every = max(1, round(1 / annotated)) if annotated else 0
+    for i in range(images):
+        name = f"img_{i:07d}.jpg"
+        with open(os.path.join(cat, name), "wb") as f:
+            f.write(b"\xff\xd8" + bytes(i % 64))
+        if every and i % every == 0:
+            with open(os.path.join(ann, name[:-4] + ".xml"), "w") as f:
+                f.write(XML.format(name=name, label="rat" if i % 3 else "possum"))
+
+def run(root):
+    env = dict(os.environ,
+               RB_PROJECTS_DIR=os.path.join(root, "projects"),
+               RB_RAW_IMAGES_DIR=os.path.join(root, "raw"),
+               RB_IMAGE_CATALOG_DIR=os.path.join(root, "catalog"),
+               RB_ANNOTATION_CATALOG_DIR=os.path.join(root, "annotations"),
+               RB_THUMB_CACHE_DIR=os.path.join(root, "thumbs"),
+               RB_WATCH="off")
+    out = subprocess.run([sys.executable, "-c", CHILD, APP_DIR], cwd=root, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    annotated = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Creating {images} images ({annotated:.0%} annotated) in {root} ...")
+        make_catalog(root, images, annotated)
+        for label in ("first start (no snapshot)", "restart (snapshot)"):
+            r = run(root)
+            print(f"{label:28} import {r['import']:6.2f}s  first request {r['first_request'] * 1000:6.1f}ms  "
+                  f"reconciled {r['ready']:6.2f}s  {r['result']}")
+
+if __name__ == "__main__":
+    main()